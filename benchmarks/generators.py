@@ -0,0 +1,114 @@
+"""Synthetic protocols and ASMain logs for the benchmarks"""
+import random
+from datetime import datetime, timedelta
+
+from utils.well_codec import well_position
+from utils.big_kahuna_protocol_types import (
+    BigKahunaChemical,
+    BigKahunaDelay,
+    BigKahunaDispense,
+    BigKahunaParameter,
+    BigKahunaPlate,
+    BigKahunaProtocol,
+    BigKahunaStir,
+    BigKahunaTransfer,
+)
+
+LOG_TIME_FORMAT = "%m/%d/%Y %H:%M:%S.%f"
+LOG_COLUMNS = ["Time", "Module", "Action", "Parameter Name", "Parameter Value", "Units"]
+
+CELL_PLATES = 6
+CHEMICALS = ["LiCl", "NaCl", "KCl", "MgCl2", "CaCl2", "YCl3", "Water"]
+
+
+def synthetic_plates() -> dict[str, BigKahunaPlate]:
+    plates = {
+        "ICP_rack": BigKahunaPlate(name="ICP_rack", type="Rack 6x15 ICP robotic", deck_position="Deck 16-17 Waste 1", rows=6, columns=15),
+        "source_plate": BigKahunaPlate(name="source_plate", type="Rack 2x4 20mL Vial", deck_position="Deck 10-11 Position 2", rows=2, columns=4, source=True),
+    }
+    for i in range(1, CELL_PLATES + 1):
+        deck = "Deck 12-13 Heat-Stir %d" % i if i <= 3 else "Deck 14-15 Heat-Stir %d" % (i - 3)
+        plates["cell_plate_%d" % i] = BigKahunaPlate(name="cell_plate_%d" % i, type="Rack 4x2 Mina H-cell", deck_position=deck, rows=4, columns=2)
+    return plates
+
+
+def synthetic_protocol(n_actions: int, seed: int = 0) -> BigKahunaProtocol:
+    """A protocol with the action mix of the AMEWS cell runs: mostly dispenses, some transfers, a few stirs and delays"""
+    rng = random.Random(seed)
+    plates = synthetic_plates()
+    chemicals = [BigKahunaChemical(name="solvent")]
+    for i, name in enumerate(CHEMICALS):
+        chemicals.append(BigKahunaChemical(name=name, source_plate="source_plate", row=i // 4 + 1, column=i % 4 + 1, volume=10000.0))
+    cells = ["cell_plate_%d" % i for i in range(1, CELL_PLATES + 1)]
+    actions = []
+    for i in range(n_actions):
+        r = rng.random()
+        plate = rng.choice(cells)
+        well = "%s%d" % ("ABCD"[rng.randrange(4)], rng.randrange(2) + 1)
+        if r < 0.75:
+            actions.append(BigKahunaDispense(source_chemical=rng.choice(CHEMICALS), target_plate=plate, target_well=well,
+                                             volume=float(rng.choice([100, 250, 500, 1000])), tags=["SyringePump", "SingleTip"]))
+        elif r < 0.97:
+            target = "%s%d" % ("ABCDEF"[rng.randrange(6)], rng.randrange(15) + 1)
+            actions.append(BigKahunaTransfer(source_plate=plate, target_plate="ICP_rack", source_well=well, target_well=target,
+                                             volume=250.0, tags=["SyringePump", "SingleTip"]))
+        elif r < 0.99:
+            actions.append(BigKahunaStir(target_plate=plate, rate=200.0))
+        else:
+            actions.append(BigKahunaDelay(target_plate=plate, delay=1.0))
+    return BigKahunaProtocol(
+        name="synthetic_%d" % n_actions,
+        parameters=[
+            BigKahunaParameter(name="Delay", type="Time", unit="min"),
+            BigKahunaParameter(name="StirRate", type="Stir Rate", unit="rpm"),
+            BigKahunaParameter(name="Pause", type="Text", unit=""),
+        ],
+        plates=plates,
+        chemicals=chemicals,
+        actions=actions,
+    )
+
+
+def write_synthetic_log(protocol: BigKahunaProtocol, path: str, start: datetime = datetime(2025, 8, 14, 20, 0, 0)) -> int:
+    """Write an ASMain log that executes the protocol in order, returns the number of rows written"""
+    t = start
+    rows = 0
+
+    def line(f, action, name, value, step=0.0):
+        nonlocal t, rows
+        t += timedelta(seconds=step)
+        f.write("%s\tArm\t%s\t%s\t%s\t\n" % (t.strftime(LOG_TIME_FORMAT)[:-3], action, name, value))
+        rows += 1
+
+    def move(f, position, row="", column=""):
+        line(f, "Move Arm To Substrate", "Input : Position", position, 2.0)
+        line(f, "Move Arm To Substrate", "Input : Well Row", row)
+        line(f, "Move Arm To Substrate", "Input : Well Column", column)
+
+    def wash(f):
+        move(f, "Drain")
+        line(f, "Dispense", "Output : Volume Dispensed", 1000.0, 6.0)
+        move(f, "Clean")
+        line(f, "Dispense", "Output : Volume Dispensed", 1000.0, 6.0)
+
+    with open(path, "w") as f:
+        f.write("\t".join(LOG_COLUMNS) + "\n")
+        for action in protocol.actions:
+            if action.action_type == "dispense":
+                wash(f)
+                row, column = well_position(action.target_well)
+                move(f, protocol.plates[action.target_plate].deck_position, row, column)
+                line(f, "Dispense", "Output : Volume Dispensed", action.volume, 8.0)
+            elif action.action_type == "transfer":
+                wash(f)
+                row, column = well_position(action.source_well)
+                move(f, protocol.plates[action.source_plate].deck_position, row, column)
+                line(f, "Aspirate", "Output : Volume Aspirated", action.volume, 6.0)
+                row, column = well_position(action.target_well)
+                move(f, protocol.plates[action.target_plate].deck_position, row, column)
+                line(f, "Dispense", "Output : Volume Dispensed", action.volume, 6.0)
+            elif action.action_type == "delay":
+                t += timedelta(minutes=action.delay)
+            else:
+                line(f, "Set Stir Rate", "Input : Rate", getattr(action, "rate", ""), 1.0)
+    return rows
@@ -0,0 +1,195 @@
+"""Benchmarks for protocol compile and build, log parsing, timestamp matching, .NET marshaling and AS xml generation
+
+Runs against the simulated LS backend, so it works on any Linux box:
+
+    python -m benchmarks.hot_paths --sizes 100 1000 10000 --output bench.json
+
+Each benchmark reports wall time, peak traced memory and the LS API / item
+counts of one call. Memory is measured in a second pass so tracemalloc does
+not distort the timings.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+from big_kahuna_interface import simulator
+
+simulator.install()
+
+import System  # noqa: E402
+import System.Collections.Generic  # noqa: E402
+from big_kahuna_interface.library_studio import LS10, ChemFile, CustomUtils, PromptsFile  # noqa: E402
+from utils.protocol_compiler import ProtocolCompiler  # noqa: E402
+from benchmarks.generators import synthetic_protocol, write_synthetic_log  # noqa: E402
+from utils.log_parsing import CHUNK_ROWS, add_timestamps, log_steps, read_logs, scan_log  # noqa: E402
+
+XML_LIMIT = 10000  # chemical manager/prompts entries, every entry re-reads a template file
+RANGE_GEOMETRIES = [(6, 15), (16, 24), (32, 48)]  # ICP rack, 384 and 1536 well plates
+SPARSE_STATUS_ROWS = 15  # status rows per liquid handling row in the sparse log, closer to a real ASMain log
+
+
+def write_status_rows(log_file, path, per_row):  # copy of a log with status rows that read_logs skips after every row
+    rows = 0
+    with open(log_file) as src, open(path, "w") as f:
+        header = src.readline()
+        f.write(header)
+        status = "\t".join({"Time": "%s", "Action": "Get Status"}.get(name, "") for name in header.rstrip("\n").split("\t")) + "\n"
+        for line in src:
+            f.write(line)
+            time_stamp = line.split("\t", 1)[0]
+            f.writelines([status % time_stamp] * per_row)
+            rows += 1 + per_row
+    return rows
+
+
+def build_design(protocol, workdir):  # the LS10 part of BigKahunaNode.run_protocol
+    compiler = ProtocolCompiler()
+    library_studio = LS10(os.path.join(workdir, "LS_API.dll"), workdir, workdir)
+    library_studio.verbose = 0
+    compiler.emit(compiler.compile(protocol), library_studio)
+    return library_studio
+
+
+def compile_protocol(protocol, cache_dir):  # the full pass pipeline, served from cache_dir when it is warm
+    compiler = ProtocolCompiler(cache_dir=cache_dir)
+    return compiler.compile(protocol, compiler.pipeline(reorder=True, skip_wash=True, four_tip=True))
+
+
+def legacy_range_map(rows, columns, volume):  # the per-element Add loops CustomUtils used before net_marshal
+    wells = System.Collections.Generic.List[System.Tuple[System.Int32, System.Int32]](rows * columns)
+    for r in range(1, rows + 1):
+        for c in range(1, columns + 1):
+            wells.Add(System.Tuple[System.Int32, System.Int32](r, c))
+    values = System.Collections.Generic.List[System.Double](rows * columns)
+    for i in range(rows * columns):
+        values.Add(volume)
+    return wells, values
+
+
+def range_map(utils, rows, columns, volume):  # what dispense_chem marshals for a whole plate range
+    wells = utils.WellRange(1, 1, rows, columns)
+    return wells, utils.UniformValues(wells.Count, volume)
+
+
+def marshal(fn, *args):  # (seconds, interop calls) of one map
+    calls = Counter(simulator.interop)
+    start = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - start
+    return seconds, sum((simulator.interop - calls).values())
+
+
+def run_marshal():
+    results = []
+    utils = CustomUtils()
+    for rows, columns in RANGE_GEOMETRIES:
+        wells = rows * columns
+        for name, fn in (("marshal_legacy", legacy_range_map), ("marshal_cold", range_map), ("marshal_interned", range_map)):
+            args = (rows, columns, 10.0) if fn is legacy_range_map else (utils, rows, columns, 10.0)
+            seconds, calls = marshal(fn, *args)
+            results.append({"benchmark": name, "actions": wells, "seconds": seconds, "peak_bytes": 0, "counts": {"interop_calls": calls}})
+    return results
+
+
+def write_xml(n, workdir):  # ChemFile/PromptsFile generation for n chemicals and libraries
+    chemfile = ChemFile()
+    promptsfile = PromptsFile()
+    library_studio = LS10(os.path.join(workdir, "LS_API.dll"), workdir, workdir)
+    for i in range(n):
+        library_studio.AddSource("source_plate", "chem_%d" % i, "Rack 2x4 20mL Vial", "Deck 10-11 Position 2", 0, 1, 1, 1000)
+        chemfile.AddChemical("chem_%d" % i, "factory setting|ADT")
+        chemfile.AddLibrary(i, "plate_%d" % i, 4, 2, "Rack 4x2 Mina H-cell", "Deck 12-13 Heat-Stir 1")
+        promptsfile.AddInitialLibraryState(i, "None")
+        promptsfile.AddInitialSourceState("Deck %d" % i, "None")
+    chemfile.Write(os.path.join(workdir, "chem.xml"))
+    promptsfile.Write(os.path.join(workdir, "prompts.xml"))
+    return n
+
+
+def measure(fn, *args):
+    """Run fn twice, once timed and once under tracemalloc, returns (result, seconds, peak bytes, LS calls)"""
+    calls = Counter(simulator.library_studio.calls)
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    calls = simulator.library_studio.calls - calls
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak, dict(calls)
+
+
+def run(sizes, workdir):
+    results = []
+    for n in sizes:
+        protocol = synthetic_protocol(n)
+        log_file = os.path.join(workdir, "ASMain_synthetic_%d.log" % n)
+        rows = write_synthetic_log(protocol, log_file)
+
+        steps, seconds, peak, calls = measure(read_logs, log_file)
+        results.append({"benchmark": "read_logs", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"log_rows": rows, "steps": len(steps), "step_bytes": steps.nbytes}})
+
+        steps, seconds, peak, calls = measure(read_logs, log_file, CHUNK_ROWS, False)  # without the mmap scan
+        results.append({"benchmark": "read_logs_pandas", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"log_rows": rows, "steps": len(steps)}})
+
+        steps, seconds, peak, calls = measure(lambda: log_steps(scan_log(log_file)))  # forced, the synthetic log is all liquid handling
+        results.append({"benchmark": "read_logs_scan", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"log_rows": rows, "steps": len(steps)}})
+
+        sparse_file = os.path.join(workdir, "ASMain_sparse_%d.log" % n)
+        sparse_rows = write_status_rows(log_file, sparse_file, SPARSE_STATUS_ROWS)
+        for name, fast in (("read_logs_sparse", True), ("read_logs_sparse_pandas", False)):
+            steps, seconds, peak, calls = measure(read_logs, sparse_file, CHUNK_ROWS, fast)
+            results.append({"benchmark": name, "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"log_rows": sparse_rows, "steps": len(steps)}})
+
+        def stamp():
+            return add_timestamps(steps, protocol.model_copy(deep=True))
+
+        stamped, seconds, peak, calls = measure(stamp)
+        matched = sum(1 for a in stamped.actions if getattr(a, "dispense_timestamp", None) is not None)
+        results.append({"benchmark": "add_timestamps", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"steps": len(steps), "matched": matched}})
+
+        design, seconds, peak, calls = measure(compile_protocol, protocol, None)
+        results.append({"benchmark": "compile", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"maps": len(design.maps)}})
+
+        cache_dir = os.path.join(workdir, "compiled")
+        compile_protocol(protocol, cache_dir)
+        design, seconds, peak, calls = measure(compile_protocol, protocol, cache_dir)
+        results.append({"benchmark": "compile_cached", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"maps": len(design.maps), "cached": design.cached}})
+
+        _, seconds, peak, calls = measure(build_design, protocol, workdir)
+        results.append({"benchmark": "build_design", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": calls})
+
+        m = min(n, XML_LIMIT)
+        _, seconds, peak, calls = measure(write_xml, m, workdir)
+        results.append({"benchmark": "xml_files", "actions": n, "seconds": seconds, "peak_bytes": peak, "counts": {"entries": m}})
+    return results
+
+
+def report(results):
+    print("%-24s %10s %12s %12s  %s" % ("benchmark", "actions", "seconds", "peak MiB", "counts"))
+    for r in results:
+        print("%-24s %10d %12.4f %12.2f  %s" % (r["benchmark"], r["actions"], r["seconds"], r["peak_bytes"] / 2**20, r["counts"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="protocol sizes in actions, up to 1000000")
+    parser.add_argument("--output", help="write the results as json")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(args.sizes, workdir) + run_marshal()
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
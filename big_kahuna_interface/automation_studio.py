@@ -8,9 +8,12 @@ from datetime import datetime
 
 import sila2.client
 
+from utils.signal_stats import SignalStats
+from utils.status_record import StatusRecorder
+
 
 class AS10:  # v is verbosity
-    def __init__(self, logs_dir: str, verbosity: bool):
+    def __init__(self, logs_dir: str, verbosity: bool, simulator=None, metrics=None):
         # statements
         self.stopped = "Stopped"
         self.aborted = "Aborted"
@@ -23,6 +26,8 @@ class AS10:  # v is verbosity
         self.error = "Error"
 
         self.verbose = verbosity
+        self.simulator = simulator  # AutomationStudioSimulator stands in for SiLA discovery if set
+        self.metrics = metrics  # CallMetrics to time SiLA calls, None to disable
         self.do_record = (
             1  # to record status statements, 0 - none, 1 - to a file, 2 - also print
         )
@@ -42,6 +47,12 @@ class AS10:  # v is verbosity
         self.description = None             # map description
         self.current_action = None          # current action
         self.current_statement = None       # AS GUI rolling statement
+        self.transitions = []               # (map, total maps, description, time) for each map reached
+        self.holds = []                     # (state, title, start, end) for each prompt or pause
+        self.hold = None                    # currently open prompt or pause
+        self.started = None                 # run start time
+        self.finished = None                # run end time
+        self.eta = None                     # LiveEta of the running design, updated on map transitions
 
         # quering
         self.timeout = 5  # sec between the calls
@@ -69,12 +80,13 @@ class AS10:  # v is verbosity
         self.signal_count = 0                 # signal count
         self.signal_long = 0                  # count of long pause-topause intervals
         self.signal_word = 31415              # code word in CurrentStatement to trigger signal action
+        self.signal_stats = SignalStats()     # pause-to-pause and map latencies, the node loads one with a baseline
 
         # logging
         self.logs_dir = logs_dir # AS logs folder
         self.logs = None  # all logs in the folder
         self.log = None  # the last log
-        self.record = None  # file for status statements
+        self.record = None  # StatusRecorder of the run
         self.dir = ""  # promptsfile folder
         self.normal_response = json.loads(
             '{"Status":"Success","Content":"Experiment running","Error":"","StatusCode":0}'
@@ -84,16 +96,15 @@ class AS10:  # v is verbosity
         )
         self.problems = 0  # counter for "problematice" active dialogs
 
-    def safe_record(self, s, divider=True):  # add to AS record
-        if self.do_record == 2:
-            print("\n>> record = %s\n" % s)
-        if divider:
-            s = "\n\n ************************  %s ************************\n\n" % s
+    def safe_record(self, kind, flush=False, **fields):  # add to AS record, flush on state changes
         if self.record:
-            try:
-                self.record.write(s)
-            except:
-                print(">> No AS record file opened, record = %s" % s)
+            self.record.record(kind, **fields)
+            if flush:
+                self.record.flush()
+
+    def close_record(self):
+        if self.record:
+            self.record.close()
 
     def list_logs(self):
         return set(os.listdir(self.logs_dir))
@@ -129,13 +140,21 @@ class AS10:  # v is verbosity
         attempt = 1
         while 1:
             try:
-                self.client = sila2.client.SilaClient.discover(
-                    server_name=name, insecure=True, timeout=self.timeout
-                )
+                if self.simulator is not None:
+                    self.client = self.simulator.discover(
+                        server_name=name, insecure=True, timeout=self.timeout
+                    )
+                else:
+                    self.client = sila2.client.SilaClient.discover(
+                        server_name=name, insecure=True, timeout=self.timeout
+                    )
 
                 if self.client not in self.clients:
                     self.clients.append(self.client)
 
+                if self.metrics is not None:
+                    self.client = self.metrics.wrap(self.client, "SiLA")
+
                 if self.verbose:
                     print(
                         "\nSILA client for server <%s> opened at %s, port = %d"
@@ -262,8 +281,7 @@ class AS10:  # v is verbosity
             if self.response != self.normal_response and self.do_record:
                 if self.verbose == 2: 
                     print(self.response) # added 7-22-2025 
-                self.timestamp()
-                self.safe_record("%s %s" % (self.stamp, self.response))
+                self.safe_record("status", response=self.response)
 
             return self.response['Content']
         except Exception as e:
@@ -282,6 +300,10 @@ class AS10:  # v is verbosity
             if self.signal_last is not None:
                 self.signal_dt = (self.signal_current - self.signal_last).total_seconds() / 60
                 print(">> AS: Last signal pause time interval = %.2f min" % self.signal_dt)
+                drift = self.signal_stats.observe("signal", self.description, 60 * self.signal_dt)
+                if drift is not None:
+                    print("\n>> CAUTION: pause-to-pause intervals drift, %s" % drift["reason"])
+                    self.safe_record("drift", flush=True, **drift)
 
             self.signal_last = self.signal_current
 
@@ -301,11 +323,24 @@ class AS10:  # v is verbosity
     def check_exp_status(self):
         if self.exp_status(0) > self.last_map: # added 7-25-2025
             self.last_map = self.map
-            self.timestamp()
-            self.safe_record("%s %s" % (self.stamp, self.current_statement))
+            now = datetime.now()
+            self.observe_map(now)
+            self.transitions.append((self.map, self.total_maps, self.description, now))
+            if self.eta is not None:
+                self.eta.update(self.map)
+            self.safe_record("map", flush=True, map=self.map, total=self.total_maps, description=self.description,
+                             statement=self.current_statement)
             if str(self.signal_word) in self.current_statement:
                 self.signal_action()
 
+    def observe_map(self, end):  # the last map reached ran until end
+        if self.transitions:
+            number, total, description, start = self.transitions[-1]
+            drift = self.signal_stats.observe("map", description, (end - start).total_seconds())
+            if drift is not None:
+                print("\n>> CAUTION: map %d takes longer than in earlier runs, %s" % (number, drift["reason"]))
+                self.safe_record("drift", flush=True, map=number, **drift)
+
     def exp_status(self, opt=0):  # get the status of the AS experiment, print if opt=1
         self.map = 0
         self.total_maps = 0
@@ -337,6 +372,15 @@ class AS10:  # v is verbosity
         now = datetime.now()
         self.stamp = now.strftime("%Y%m%d_%H%M%S")
 
+    def open_hold(self, state):  # start timing a prompt or pause
+        self.close_hold()
+        self.hold = (state, self.title, datetime.now())
+
+    def close_hold(self):  # the run left the prompt or pause
+        if self.hold is not None:
+            self.holds.append(self.hold + (datetime.now(),))
+            self.hold = None
+
     def GetActivePrompt(self):
         self.active = None
         self.active_content = None
@@ -349,8 +393,7 @@ class AS10:  # v is verbosity
         )
         if self.active:
             if self.do_record and self.active != self.normal_active:
-                self.timestamp()
-                self.safe_record("ACTIVE = %s" % self.active)
+                self.safe_record("prompt", active=self.active)
 
             if self.active["StatusCode"] == 0:
                 self.active_content = json.loads(self.active["Content"])
@@ -430,7 +473,7 @@ class AS10:  # v is verbosity
         self.dir = os.path.dirname(promptsfile)
 
         if resume:
-            self.safe_record("BACK IN CONTRON", divider=True)
+            self.safe_record("state", flush=True, state="resumed", pause=self.pause_count)
             if self.verbose:
                 print(
                     "\n>> Run of design %d continues after Pause %d"
@@ -441,9 +484,18 @@ class AS10:  # v is verbosity
             self.last = self.GetState()
 
         else:
+            self.close_record()  # a run left at a pause
             self.record = None
             self.pause_count = 0
             self.ID = design_ID
+            self.last_map = 0
+            self.transitions = []
+            self.holds = []
+            self.hold = None
+            self.started = datetime.now()
+            self.finished = None
+            self.signal_last = None  # pause-to-pause intervals do not span runs
+            self.signal_stats.start_run()
 
             if chemfile:
                 pass
@@ -460,11 +512,10 @@ class AS10:  # v is verbosity
 
             if self.do_record:
                 self.timestamp()
-                f = os.path.join(self.dir, "status_%s.log" % self.stamp)
                 try:
-                    self.record = open(f, "w")
-                except:
-                    print(">> Cannot open AS record file %s" % f)
+                    self.record = StatusRecorder(self.dir, "status_%s" % self.stamp, echo=self.do_record == 2)
+                except OSError as e:
+                    print(">> Cannot open AS record file: %s" % e)
 
             self.get_log(0)
 
@@ -482,16 +533,23 @@ class AS10:  # v is verbosity
             if self.RunAS(design_ID, promptsfile, chemfile, tipfile):
                 return "no-go"
 
-            self.safe_record("STARTED", divider=True)
+            self.safe_record("state", flush=True, state="started", design_id=self.ID, prompts=promptsfile, chem=chemfile, tips=tipfile)
 
         while True:
             self.next = self.WaitNextState(self.last, 1)
 
             if self.next != self.wait:
                 self.last = self.next
+                self.safe_record("state", flush=True, state=self.last, title=self.title, info=self.info)
+
+                if self.last in (self.active_prompt, self.paused):
+                    self.open_hold(self.last)
+                else:
+                    self.close_hold()
 
                 if self.last == self.no_tips:
                     print("ERROR: The instrument is out of tips")
+                    self.close_record()
                     return "notips"
 
                 elif self.last == self.active_prompt:
@@ -531,7 +589,6 @@ class AS10:  # v is verbosity
 
                 elif self.last == self.running:
                     print("ALERT: The experiment has resumed\n")
-                    self.safe_record("RESUMED AFTER PROMPT")
                     self.problems = 0
 
                 elif self.last == self.aborted:
@@ -545,13 +602,14 @@ class AS10:  # v is verbosity
                 elif self.last == self.stopped:
                     break
 
+        self.close_hold()
+        self.finished = datetime.now()
+        self.observe_map(self.finished)
+        self.signal_stats.end_run(merge=not self.was_aborted)
         self.get_log(1)
 
-        if self.record:
-            try:
-                self.record.close()
-            except:
-                print(">> Cannot close AS record file")
+        self.safe_record("state", state="finished", aborted=self.was_aborted, log=self.log)
+        self.close_record()
 
         self.copy_log(self.dir)
 
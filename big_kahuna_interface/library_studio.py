@@ -23,6 +23,9 @@ from System.Drawing import Point  # type: ignore
 
 
 from big_kahuna_interface.automation_studio import AS10
+from big_kahuna_interface import net_marshal
+from utils.big_kahuna_protocol_types import PARAMETER_TYPES
+from utils.well_codec import well_label, well_position
 
 
 def CustomVerbosity():  # 1 for verbose script
@@ -35,17 +38,20 @@ class CustomUtils:  # common LS handling utilities
         self.values = []
 
     def well2tuple(self, well):
-        letter = well[0].upper()
-        col = int(well[1:])
-        row = ord(letter) - ord("A") + 1
-        return (row, col)
+        return well_position(well)
 
     def well2point(self, well):
         row, col = self.well2tuple(well)
         return Point(row, col)
 
     def tuple2well(self, row, col):
-        return "%s%d" % (chr(64 + row), col)
+        return well_label(row, col)
+
+    def range2points(self, range_string):  # corners of a well range, top left first whichever way it is written
+        cells = [self.well2tuple(cell) for cell in range_string.split(":")]
+        rows = [cell[0] for cell in cells]
+        columns = [cell[1] for cell in cells]
+        return Point(min(rows), min(columns)), Point(max(rows), max(columns))
 
     def invert_well(self, well):
         row, col = self.well2tuple(well)
@@ -75,35 +81,23 @@ class CustomUtils:  # common LS handling utilities
 
         return self.WellRange(start_row, start_col, row_count, col_count)
 
-    def WellRange(self, row, col, row_count, col_count):  # fills rectangular range
-        n = row_count * col_count
-        self.wells = []
-        retval = System.Collections.Generic.List[
-            System.Tuple[System.Int32, System.Int32]
-        ](n)
-        for r in range(row, row + row_count):
-            for c in range(col, col + col_count):
-                retval.Add(System.Tuple[System.Int32, System.Int32](r, c))
-                self.wells.append((r, c))
+    def WellRange(self, row, col, row_count, col_count):  # fills rectangular range, interned - do not modify
+        retval, self.wells = net_marshal.well_range(row, col, row_count, col_count)
         return retval
 
-    def UniformValues(self, count, value):  # creates uniform dicrete map of doubles
-        self.values = []
-        retval = System.Collections.Generic.List[System.Double](count)
-        for i in range(count):
-            retval.Add(value)
-            self.values.append(value)
-        return retval
+    def UniformValues(self, count, value):  # creates uniform dicrete map of doubles, interned - do not modify
+        self.values = [value] * count
+        return net_marshal.uniform_doubles(count, value)
+
+    def DiscreteValues(self, values):  # creates discrete map of doubles, one value per well, from a list or numpy array
+        self.values = [float(value) for value in values]
+        return net_marshal.double_list(values)
 
     def UniformObjects(
         self, count, value
-    ):  # creates uniform dicrete map of object  - use them in parameter maps
-        self.values = []
-        retval = System.Collections.Generic.List[System.Object](count)
-        for i in range(count):
-            retval.Add(value)
-            self.values.append(value)
-        return retval
+    ):  # creates uniform dicrete map of object  - use them in parameter maps, interned - do not modify
+        self.values = [value] * count
+        return net_marshal.uniform_objects(count, value)
 
     def report_wells_values(self):  # reports well and discrete map ranges
         ws = ";".join([str(t) for t in self.wells])
@@ -217,7 +211,7 @@ class ChemFile:  # chemcial manager xml file, consists of four sections that are
 
 
 class LS10:  # LS API wrapper calls
-    def __init__(self, dll_path: Path, main_dir: Path, logs_dir: Path):
+    def __init__(self, dll_path: Path, main_dir: Path, logs_dir: Path, metrics=None):
         # general settings
         self.logs_dir = logs_dir
         self.path = main_dir
@@ -249,15 +243,7 @@ class LS10:  # LS API wrapper calls
         self.chaser = 0  # chaser volume in uL, 0 is chaser is not used
         self.door = 1  # State of the door interlock, 1 - locked
 
-        self.PTYPES = [
-            "Temperature",
-            "Time",
-            "Rate",
-            "Number",
-            "Text",
-            "Stir Rate",
-            "Temperature Rate",
-        ]  # allowed parameter types
+        self.PTYPES = list(PARAMETER_TYPES)  # allowed parameter types
 
         # numerical codes for pause actions
         # code book for text parameter maps => AS Pause messages
@@ -278,6 +264,8 @@ class LS10:  # LS API wrapper calls
         import LS_API
 
         self.ls = LS_API.LibraryStudioWrapper
+        if metrics is not None:  # CallMetrics to time LS API calls
+            self.ls = metrics.wrap(self.ls, "LS", depth=0)
         self.units = self.units.lower()  # added to prevent using mL etc.
 
     def inspect_assembly(self, assembly):  # inspect modules in a .NET asssembly
@@ -492,16 +480,22 @@ class LS10:  # LS API wrapper calls
         tags=[],
         opt=False,  # adds to mapped chemicals for chemfile
         layerIdx=-1,  # if positive edits the map
+        volumes=None,  # per well volumes, row by row, for a non-uniform map
     ):
         wells = self.utils.WellRangeFromString(range_str)
-        values = self.utils.UniformValues(wells.Count, volume)
+        if volumes is None:
+            mode = "Uniform"
+            values = self.utils.UniformValues(wells.Count, volume)
+        else:
+            mode = "Discrete"
+            values = self.utils.DiscreteValues(volumes)
         tag = self.to_tag(tags)
         i = layerIdx
 
         if layerIdx < 0:
             status = self.ls.AddSourceMap(
                 chem,
-                "Uniform",
+                mode,
                 self.units,
                 volume,
                 wells,
@@ -515,7 +509,7 @@ class LS10:  # LS API wrapper calls
         else:
             status = self.ls.EditSourceMap(
                 chem,
-                "Uniform",
+                mode,
                 self.units,
                 volume,
                 wells,
@@ -545,27 +539,47 @@ class LS10:  # LS API wrapper calls
         layerIdx=-1,
         plates = None
     ):  
+        return self.range_transfer(source_plate, target_plate, source_well, target_well, volume, tags, layerIdx, plates)
+
+    def range_transfer(
+        self,  # rectangular block transfer between the substrates, e.g. A1:D1 -> A3:D3
+        source_plate,  # substrate
+        target_plate,  # substrate
+        source_range,  # well or well range
+        target_range,  # well or well range of the same shape
+        volume,  # volume per well
+        tags=[],
+        layerIdx=-1,
+        plates = None,
+        volumes=None,  # per well volumes, row by row, for a non-uniform map
+    ):
         if source_plate not in self.sources:
             self.sources.append(source_plate)
             full_plate = plates[source_plate]
             print(full_plate)
             self.add_plate_source(full_plate, source_plate)
-        
-        p_from = self.utils.well2point(source_well)
-        p_to = self.utils.well2point(target_well)
-        values = self.utils.UniformValues(1, volume)
+
+        p_from, p_from_end = self.utils.range2points(source_range)  # "C3:A1" maps as A1:C3, like range_wells expands it
+        p_to, p_to_end = self.utils.range2points(target_range)
+        if volumes is None:
+            mode = "Uniform"
+            count = self.utils.WellRangeFromString(source_range).Count
+            values = self.utils.UniformValues(count, volume)
+        else:
+            mode = "Discrete"
+            values = self.utils.DiscreteValues(volumes)
         i = layerIdx
 
         if layerIdx < 0:  # new map
             status = self.ls.AddArrayMap(
                 source_plate,
                 target_plate,
-                "Uniform",
+                mode,
                 self.units,
                 p_from,
-                p_from,
-                p_to,
+                p_from_end,
                 p_to,
+                p_to_end,
                 volume,
                 values,
                 self.to_tag(tags),
@@ -576,12 +590,12 @@ class LS10:  # LS API wrapper calls
             status = self.ls.EditArrayMap(
                 source_plate,
                 target_plate,
-                "Uniform",
+                mode,
                 self.units,
                 p_from,
-                p_from,
-                p_to,
+                p_from_end,
                 p_to,
+                p_to_end,
                 volume,
                 values,
                 self.to_tag(tags),
@@ -672,10 +686,10 @@ class LS10:  # LS API wrapper calls
         self.design = self.ls.GetDesignFromDatabase(lib_ID, False)
         self.ID = lib_ID
         if self.design:
+            self.project = self.ls.GetProjectName()
+            self.name = self.ls.GetLibraryDesign()
             if self.verbose:
                 print("loaded LS library design %d without attachments" % lib_ID)
-                self.project = self.ls.GetProjectName()
-                self.name = self.ls.GetLibraryDesign()
                 print("project %s, design name %s" % (self.project, self.name))
                 self.info_libs()
         else:
@@ -684,6 +698,10 @@ class LS10:  # LS API wrapper calls
 
         return 0
 
+    def info_libs(self):  # report the libraries of the open design
+        for lib in self.ls.GetLibraries():
+            print("library %s, ID = %d, %d x %d" % (lib.Name, lib.ID, lib.Rows, lib.Columns))
+
     def add_param(self, pname, ptype, punit):
         from LS_API import Param
 
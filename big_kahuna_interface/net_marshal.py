@@ -0,0 +1,59 @@
+"""Bulk conversion of Python and NumPy data into the .NET collections the LS API takes
+
+Every pythonnet call crosses the interop boundary, so building a
+List[Tuple[Int32, Int32]] or List[Double] one Add at a time costs one
+crossing per well. Here lists are built from a whole .NET array in one
+constructor call, and the .NET objects of ranges and uniform value lists,
+which the LS API only reads, are interned and handed out again.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+import System  # type: ignore
+import System.Collections.Generic  # type: ignore
+
+_tuples = {}  # (row, column) -> System.Tuple[Int32, Int32], shared by all ranges
+
+
+def net_tuple(row: int, column: int):
+    key = (row, column)
+    value = _tuples.get(key)
+    if value is None:
+        value = _tuples[key] = System.Tuple[System.Int32, System.Int32](row, column)
+    return value
+
+
+def double_list(values):  # List[Double] from any sequence or NumPy array, two interop calls
+    array = System.Array[System.Double](np.asarray(values, dtype=np.float64).tolist())
+    return System.Collections.Generic.List[System.Double](array)
+
+
+def object_list(values):  # List[Object] for parameter maps
+    array = System.Array[System.Object](list(values))
+    return System.Collections.Generic.List[System.Object](array)
+
+
+@lru_cache(maxsize=4096)
+def well_range(row: int, column: int, row_count: int, column_count: int):
+    """Interned List[Tuple[Int32, Int32]] of a rectangular range, row by row, and its (row, column) pairs"""
+    wells = tuple((r, c) for r in range(row, row + row_count) for c in range(column, column + column_count))
+    array = System.Array[System.Tuple[System.Int32, System.Int32]]([net_tuple(r, c) for r, c in wells])
+    return System.Collections.Generic.List[System.Tuple[System.Int32, System.Int32]](array), wells
+
+
+@lru_cache(maxsize=1024, typed=True)  # typed: 1, 1.0 and True are equal keys but marshal differently
+def uniform_doubles(count: int, value: float):  # interned List[Double] of one value
+    return double_list(np.full(count, value, dtype=np.float64))
+
+
+@lru_cache(maxsize=1024, typed=True)
+def uniform_objects(count: int, value):  # interned List[Object] of one value
+    return object_list([value] * count)
+
+
+def clear():  # drop interned objects, e.g. after reloading the dll
+    _tuples.clear()
+    well_range.cache_clear()
+    uniform_doubles.cache_clear()
+    uniform_objects.cache_clear()
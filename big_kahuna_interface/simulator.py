@@ -0,0 +1,619 @@
+"""Local stand-in for AutomationStudio and the LS_API dll
+
+Installing the simulator registers pure-Python replacements for the pythonnet
+modules (clr, System, LS_API) so library_studio imports on machines without
+the Library Studio dll, and AutomationStudioSimulator answers the SiLA calls
+AS10 makes by replaying a recorded ASMain log on an accelerated clock.
+
+Set BIG_KAHUNA_SIMULATOR_LOG to a recorded ASMain log (and optionally
+BIG_KAHUNA_SIMULATOR_SPEED, default 100) to run the node against it.
+BIG_KAHUNA_SIMULATOR_FAULT (aborted, notips or error) makes the first run
+stop that way at BIG_KAHUNA_SIMULATOR_FAULT_AT, default 0.5, of the log.
+"""
+import copy
+import json
+import os
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+LOG_TIME_FORMAT = "%m/%d/%Y %H:%M:%S.%f"  # time stamps in the ASMain logs
+FAULTS = ("aborted", "notips", "error")  # AS aborts the run, runs out of tips, or pauses on an arm error
+HOUSEKEEPING_S = 30.0  # simulated seconds an aborted run reports aborted before AS is idle again
+
+
+def enabled() -> bool:  # the node runs against the simulator
+    return bool(os.environ.get("BIG_KAHUNA_SIMULATOR_LOG"))
+
+
+def from_environment(logs_dir) -> Optional["AutomationStudioSimulator"]:
+    if not enabled():
+        return None
+    return AutomationStudioSimulator(
+        os.environ["BIG_KAHUNA_SIMULATOR_LOG"],
+        logs_dir,
+        speed=float(os.environ.get("BIG_KAHUNA_SIMULATOR_SPEED", 100)),
+        fault=os.environ.get("BIG_KAHUNA_SIMULATOR_FAULT") or None,
+        fault_at=float(os.environ.get("BIG_KAHUNA_SIMULATOR_FAULT_AT", 0.5)),
+    )
+
+
+# ----------------------------------------------------------------------------------------
+# .NET stand-ins
+
+interop = Counter()  # calls that would cross into .NET under pythonnet
+
+
+class NetList(list):  # System.Collections.Generic.List
+    def __init__(self, arg=None):
+        interop["List"] += 1
+        if arg is None or isinstance(arg, int):  # capacity
+            super().__init__()
+        else:
+            super().__init__(arg)
+
+    def Add(self, item):
+        interop["List.Add"] += 1
+        self.append(item)
+
+    @property
+    def Count(self):
+        return len(self)
+
+
+class NetGeneric:  # open generic type, closed by indexing with type arguments
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+
+    def __getitem__(self, type_args):
+        return self.factory
+
+
+def counted(name, factory):  # constructor that counts as one interop call
+    def construct(*args):
+        interop[name] += 1
+        return factory(*args)
+    return construct
+
+
+class Point:  # System.Drawing.Point
+    def __init__(self, x, y):
+        self.X = x
+        self.Y = y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and (self.X, self.Y) == (other.X, other.Y)
+
+    def __repr__(self):
+        return "Point(%d, %d)" % (self.X, self.Y)
+
+
+class Assembly:  # System.Reflection.Assembly
+    @staticmethod
+    def LoadFile(path):
+        return Assembly()
+
+    def GetTypes(self):
+        return []
+
+
+class ReflectionTypeLoadException(Exception):
+    LoaderExceptions = []
+
+
+class Param:  # LS_API.Param
+    def __init__(self):
+        self.Name = ""
+        self.Type = ""
+        self.DefaultUnit = ""
+        self.Description = ""
+        self.Expression = ""
+
+
+class Library:  # library record returned by GetLibraries
+    def __init__(self, ID, Name, Rows, Columns):
+        self.ID = ID
+        self.Name = Name
+        self.Rows = Rows
+        self.Columns = Columns
+
+
+class FakeLibraryStudio:  # pure-Python LS_API.LibraryStudioWrapper
+    errors = {
+        -2: "Unknown chemical",
+        -3: "Unknown library",
+        -4: "Map index out of range",
+        -5: "No design is open",
+    }
+
+    def __init__(self):
+        self.calls = Counter()  # LS API call counts
+        self.designs = {}  # database ID -> saved design
+        self.next_id = 1000
+        self.design = None
+
+    def _call(self, name):
+        self.calls[name] += 1
+
+    def _new_design(self, name, project):
+        return {"name": name, "project": project, "libraries": [], "chemicals": [], "parameters": [], "maps": []}
+
+    def CreateNewDesign(self, name, project, *args):
+        self._call("CreateNewDesign")
+        self.design = self._new_design(name, project)
+        return 0
+
+    def GetErrorMessage(self, status):
+        self._call("GetErrorMessage")
+        return self.errors.get(status, "Unidentified error")
+
+    def AddLibrary(self, name, nRows, nCols, color=0):
+        self._call("AddLibrary")
+        if self.design is None:
+            return -5
+        self.design["libraries"].append({"name": name, "rows": nRows, "columns": nCols, "ID": None})
+        return 0
+
+    def AddChemical(self, name, color, units):
+        self._call("AddChemical")
+        if self.design is None:
+            return -5
+        self.design["chemicals"].append(name)
+        return 0
+
+    def RenameChemical(self, old, new):
+        self._call("RenameChemical")
+        if old not in self.design["chemicals"]:
+            return -2
+        self.design["chemicals"][self.design["chemicals"].index(old)] = new
+        return 0
+
+    def AddParameter(self, p):
+        self._call("AddParameter")
+        self.design["parameters"].append(p)
+        return 0
+
+    def GetParameters(self):
+        self._call("GetParameters")
+        return list(self.design["parameters"]) if self.design else []
+
+    def GetAllUnits(self):
+        self._call("GetAllUnits")
+        return ["Volume", "Time", "Stir Rate"]
+
+    def GetUnits(self, unit_type):
+        self._call("GetUnits")
+        return {"Volume": ["ul", "ml"], "Time": ["min", "s"], "Stir Rate": ["rpm"]}.get(unit_type, [])
+
+    def _has_library(self, name):
+        return any(lib["name"] == name for lib in self.design["libraries"])
+
+    def _put_map(self, layer, entry, edit=False):  # maps are numbered from 1
+        maps = self.design["maps"]
+        if edit:
+            if layer < 1 or layer > len(maps):
+                return -4
+            maps[layer - 1] = entry
+        else:
+            maps.append(entry)
+        return 0
+
+    def _source_map(self, chem, mode, units, volume, wells, values, library, tags, layer, edit):
+        if self.design is None:
+            return -5
+        if chem not in self.design["chemicals"]:
+            return -2
+        if not self._has_library(library):
+            return -3
+        entry = {"kind": "source", "chemical": chem, "mode": mode, "units": units, "volume": volume,
+                 "wells": list(wells), "values": list(values), "library": library, "tags": tags}
+        return self._put_map(layer, entry, edit)
+
+    def AddSourceMap(self, chem, mode, units, volume, wells, values, library, tags, layer, count):
+        self._call("AddSourceMap")
+        return self._source_map(chem, mode, units, volume, wells, values, library, tags, layer, False)
+
+    def EditSourceMap(self, chem, mode, units, volume, wells, values, library, tags, layer, count):
+        self._call("EditSourceMap")
+        return self._source_map(chem, mode, units, volume, wells, values, library, tags, layer, True)
+
+    def _array_map(self, source, target, mode, units, from_start, from_end, to_start, to_end, volume, values, tags, layer, edit):
+        if self.design is None:
+            return -5
+        if not self._has_library(target):
+            return -3
+        entry = {"kind": "array", "source": source, "library": target, "mode": mode, "units": units, "volume": volume,
+                 "from": ((from_start.X, from_start.Y), (from_end.X, from_end.Y)),
+                 "to": ((to_start.X, to_start.Y), (to_end.X, to_end.Y)),
+                 "values": list(values), "tags": tags}
+        return self._put_map(layer, entry, edit)
+
+    def AddArrayMap(self, source, target, mode, units, from_start, from_end, to_start, to_end, volume, values, tags, layer):
+        self._call("AddArrayMap")
+        return self._array_map(source, target, mode, units, from_start, from_end, to_start, to_end, volume, values, tags, layer, False)
+
+    def EditArrayMap(self, source, target, mode, units, from_start, from_end, to_start, to_end, volume, values, tags, layer, count):
+        self._call("EditArrayMap")
+        return self._array_map(source, target, mode, units, from_start, from_end, to_start, to_end, volume, values, tags, layer, True)
+
+    def AddParameterMap(self, name, mode, units, value, wells, values, library, tags, layer, count):
+        self._call("AddParameterMap")
+        if self.design is None:
+            return -5
+        if not self._has_library(library):
+            return -3
+        entry = {"kind": "parameter", "parameter": name, "mode": mode, "units": units, "value": value,
+                 "wells": list(wells), "values": list(values), "library": library, "tags": tags}
+        return self._put_map(layer, entry)
+
+    def SaveDesignToDatabase(self, isnew, attachments):
+        self._call("SaveDesignToDatabase")
+        if self.design is None:
+            return -5
+        if isnew or "ID" not in self.design:
+            self.design["ID"] = self.next_id
+            self.next_id += 1
+            for lib in self.design["libraries"]:
+                lib["ID"] = self.next_id
+                self.next_id += 1
+        self.designs[self.design["ID"]] = copy.deepcopy(self.design)
+        return self.design["ID"]
+
+    def GetDesignFromDatabase(self, design_id, attachments):
+        self._call("GetDesignFromDatabase")
+        if design_id not in self.designs:
+            return None
+        self.design = copy.deepcopy(self.designs[design_id])
+        return self.design
+
+    def GetLibraries(self):
+        self._call("GetLibraries")
+        return [Library(lib["ID"], lib["name"], lib["rows"], lib["columns"]) for lib in self.design["libraries"]]
+
+    def GetProjectName(self):
+        self._call("GetProjectName")
+        return self.design["project"]
+
+    def GetLibraryDesign(self):
+        self._call("GetLibraryDesign")
+        return self.design["name"]
+
+    def SetDesignName(self, name):
+        self._call("SetDesignName")
+        if self.design is None:
+            return -5
+        self.design["name"] = name
+        return 0
+
+    def SaveDesignToFile(self, path):
+        self._call("SaveDesignToFile")
+        with open(path, "w") as f:
+            json.dump(self.design, f, default=str)
+        return True
+
+
+library_studio = FakeLibraryStudio()  # shared by LS_API.LibraryStudioWrapper and the AS simulator
+
+
+def install():  # register the .NET stand-ins, must run before library_studio is imported
+    if "LS_API" in sys.modules:
+        return
+
+    clr = types.ModuleType("clr")
+    clr.AddReference = lambda name: None
+
+    system = types.ModuleType("System")
+    system.Int32 = int
+    system.Double = float
+    system.Object = object
+    system.String = str
+    system.Tuple = NetGeneric("Tuple", counted("Tuple", lambda *items: tuple(items)))
+    system.Array = NetGeneric("Array", counted("Array", list))
+
+    collections = types.ModuleType("System.Collections")
+    generic = types.ModuleType("System.Collections.Generic")
+    generic.List = NetGeneric("List", NetList)
+    collections.Generic = generic
+    system.Collections = collections
+
+    drawing = types.ModuleType("System.Drawing")
+    drawing.Point = Point
+    system.Drawing = drawing
+
+    reflection = types.ModuleType("System.Reflection")
+    reflection.Assembly = Assembly
+    reflection.ReflectionTypeLoadException = ReflectionTypeLoadException
+    system.Reflection = reflection
+
+    ls_api = types.ModuleType("LS_API")
+    ls_api.LibraryStudioWrapper = library_studio
+    ls_api.Param = Param
+
+    sys.modules.update({
+        "clr": clr,
+        "System": system,
+        "System.Collections": collections,
+        "System.Collections.Generic": generic,
+        "System.Drawing": drawing,
+        "System.Reflection": reflection,
+        "LS_API": ls_api,
+    })
+
+
+# ----------------------------------------------------------------------------------------
+# AutomationStudio stand-in
+
+
+class Response:  # SiLA call response
+    def __init__(self, value):
+        self.ReturnValue = value
+
+
+def reply(content, status_code=0, error=""):
+    status = "Success" if status_code >= 0 else "Error"
+    return Response(json.dumps({"Status": status, "Content": content, "Error": error, "StatusCode": status_code}))
+
+
+class Service:  # SiLA feature, dispatches calls to the simulator
+    def __init__(self, calls):
+        for name, handler in calls.items():
+            setattr(self, name, handler)
+
+
+class SimulatedClient:  # what sila2.client.SilaClient.discover returns
+    def __init__(self, simulator, server_name):
+        s = simulator
+        self.server_name = server_name
+        self.address = "127.0.0.1"
+        self.port = 50052
+        self.AutomationStudioRemote = Service({"Start": lambda: reply("AutomationStudio started")})
+        self.AutomationStudio = Service({"Shutdown": lambda: reply("Shut down")})
+        self.ExperimentService = Service({
+            "ChooseDesignID": s.choose_design,
+            "SetPrompts": lambda path: s.set_file("prompts", path),
+            "SetChemicalManager": lambda path: s.set_file("chem", path),
+            "SetTipManagement": lambda path: s.set_file("tips", path),
+        })
+        self.RunService = Service({"Start": s.start, "Abort": s.abort})
+        self.ExperimentStatusService = Service({
+            "GetStatus": s.get_status,
+            "GetExperimentStatus": s.get_experiment_status,
+            "GetActivePrompt": s.get_active_prompt,
+            "SetInput": s.set_input,
+        })
+
+    def close(self):
+        pass
+
+
+class AutomationStudioSimulator:
+    """Replays a recorded ASMain log as a live AutomationStudio run
+
+    With a fault the first run started stops once fault_at of the log is
+    replayed: "aborted" aborts it, "notips" opens the out of tips prompt and
+    "error" pauses the experiment on an arm error until Repeat Action is
+    chosen. Later runs replay the whole log, as a resumed run would.
+    """
+
+    def __init__(self, log_file, logs_dir, speed: float = 100.0, library_studio: FakeLibraryStudio = library_studio,
+                 fault: Optional[str] = None, fault_at: float = 0.5):
+        if fault is not None and fault not in FAULTS:
+            raise ValueError("unknown simulator fault %s, expected one of %s" % (fault, ", ".join(FAULTS)))
+        self.logs_dir = Path(logs_dir)
+        self.speed = speed
+        self.library_studio = library_studio
+        self.fault = fault
+        self.fault_at = fault_at  # fraction of the log replayed before the fault
+        self.faulted = False  # the fault happened, it is not repeated
+        self.lock = threading.Lock()
+        self.calls = Counter()  # SiLA call counts
+        self.files = {}
+        self.design_id = None
+        self.load_log(log_file)
+        self.reset()
+
+    def load_log(self, log_file):  # split the recorded log into header and (offset, line) pairs
+        with open(log_file) as f:
+            lines = f.read().splitlines()
+        self.header = lines[0]
+        time_column = self.header.split("\t").index("Time")
+        self.lines = []
+        start = None
+        for line in lines[1:]:
+            fields = line.split("\t")
+            try:
+                t = datetime.strptime(fields[time_column], LOG_TIME_FORMAT)
+            except (IndexError, ValueError):
+                continue
+            if start is None:
+                start = t
+            self.lines.append(((t - start).total_seconds(), line))
+        self.span = self.lines[-1][0] if self.lines else 0.0
+
+    def reset(self):
+        self.state = "idle"  # idle, running, completed, aborted
+        self.started = None
+        self.held = 0.0  # wall time spent waiting on prompts
+        self.hold_start = None
+        self.prompt = None  # open prompt: pause, notips or error
+        self.aborted_at = None
+        self.written = 0
+        self.output = None
+        self.acknowledged = set()  # pause maps already answered
+
+    def discover(self, server_name, insecure=True, timeout=5):
+        self.calls["discover"] += 1
+        return SimulatedClient(self, server_name)
+
+    # experiment setup
+
+    def choose_design(self, design_id):
+        self.calls["ChooseDesignID"] += 1
+        if self.library_studio is not None and self.library_studio.designs and design_id not in self.library_studio.designs:
+            return reply("", -1, "Design %s not found" % design_id)
+        self.design_id = design_id
+        return reply("Design %s selected" % design_id)
+
+    def set_file(self, kind, path):
+        self.calls["Set%s" % kind.capitalize()] += 1
+        if not os.path.exists(str(path)):
+            return reply("", -1, "File %s not found" % path)
+        self.files[kind] = str(path)
+        return reply("%s file set" % kind)
+
+    def maps(self):
+        if self.library_studio is not None and self.design_id in self.library_studio.designs:
+            return self.library_studio.designs[self.design_id]["maps"]
+        return []
+
+    def start(self):
+        self.calls["Start"] += 1
+        with self.lock:
+            self.reset()
+            self.state = "running"
+            self.started = time.monotonic()
+            name = "ASMain_%s.log" % datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            self.output = self.logs_dir / name
+            with open(self.output, "w") as f:
+                f.write(self.header + "\n")
+        return reply("Run started")
+
+    def abort(self):
+        self.calls["Abort"] += 1
+        with self.lock:
+            if self.state == "running":
+                self.abort_run()
+        return reply("Run aborted")
+
+    # replay
+
+    def elapsed(self):  # simulated seconds since start, frozen while a prompt is open
+        if self.started is None:
+            return 0.0
+        held = self.held
+        if self.hold_start is not None:
+            held += time.monotonic() - self.hold_start
+        return (time.monotonic() - self.started - held) * self.speed
+
+    def current_map(self):  # (map number, total maps, map record)
+        maps = self.maps()
+        total = max(len(maps), 1)
+        fraction = min(self.elapsed() / self.span, 1.0) if self.span else 1.0
+        number = min(int(fraction * total) + 1, total)
+        return number, total, maps[number - 1] if maps else None
+
+    def abort_run(self):
+        self.state = "aborted"
+        self.aborted_at = time.monotonic()
+
+    def hold(self, prompt):  # freeze the clock until the prompt is answered
+        self.prompt = prompt
+        self.hold_start = time.monotonic()
+
+    def advance(self):
+        if self.state == "aborted" and (time.monotonic() - self.aborted_at) * self.speed >= HOUSEKEEPING_S:
+            self.state = "idle"
+        if self.state != "running" or self.prompt is not None:
+            return
+        number, total, record = self.current_map()
+        if record and record["kind"] == "parameter" and record["parameter"] == "Pause" and number not in self.acknowledged:
+            self.hold("pause")
+            return
+        now = self.elapsed()
+        fault = self.fault is not None and not self.faulted and now >= self.fault_at * self.span
+        if fault:
+            now = self.fault_at * self.span  # the log stops where the fault happened
+        written = self.written
+        while written < len(self.lines) and self.lines[written][0] <= now:
+            written += 1
+        if written > self.written:
+            with open(self.output, "a") as f:
+                f.write("\n".join(line for _, line in self.lines[self.written:written]) + "\n")
+            self.written = written
+        if fault:
+            self.faulted = True
+            if self.fault == "aborted":
+                self.abort_run()
+            else:
+                self.hold(self.fault)
+        elif self.written >= len(self.lines) and now >= self.span:
+            self.state = "completed"
+
+    def describe(self, record):  # map description shown in CurrentMap
+        if record is None:
+            return "Replay"
+        if record["kind"] == "source":
+            return "Dispense %s to %s" % (record["chemical"], record["library"])
+        if record["kind"] == "array":
+            return "Transfer %s to %s" % (record["source"], record["library"])
+        return "%s %s" % (record["parameter"], record["values"][0] if record["values"] else "")
+
+    # status services
+
+    def get_status(self):
+        self.calls["GetStatus"] += 1
+        with self.lock:
+            self.advance()
+            content = {
+                "idle": "No experiment running",
+                "running": "Experiment paused" if self.prompt == "error" else "Experiment running",
+                "completed": "Experiment completed",
+                "aborted": "Experiment aborted",
+            }[self.state]
+        if content == "Experiment running":
+            return Response('{"Status":"Success","Content":"Experiment running","Error":"","StatusCode":0}')
+        return reply(content)
+
+    def get_experiment_status(self):
+        self.calls["GetExperimentStatus"] += 1
+        with self.lock:
+            if self.state != "running":
+                return reply({"CurrentAction": "", "CurrentMap": ""})
+            number, total, record = self.current_map()
+            return reply({
+                "CurrentAction": "Replaying %s" % self.describe(record),
+                "CurrentMap": "Map %d of %d: %s" % (number, total, self.describe(record)),
+            })
+
+    def get_active_prompt(self):
+        self.calls["GetActivePrompt"] += 1
+        with self.lock:
+            if self.state == "running" and self.prompt is not None:
+                return reply(json.dumps(self.prompt_content()))
+        return Response('{"Status":"Success","Content":"No prompts are waiting for user input.","Error":"","StatusCode":1}')
+
+    def prompt_content(self) -> dict:
+        if self.prompt == "notips":
+            return {"Title": "Tip Management", "InformationMessage": "No more tips available. Refill the tip racks",
+                    "Option": ["OK", "Abort"]}
+        if self.prompt == "error":
+            return {"Title": "Experiment Paused", "InformationMessage": "Arm error: liquid level not detected",
+                    "Option": ["Repeat Action", "Abort"]}
+        number, total, record = self.current_map()
+        return {
+            "Title": "Experiment Paused",
+            "InformationMessage": "%s. Press OK to continue" % (record["values"][0] if record["values"] else "Pause"),
+            "Option": ["OK", "Abort"],
+        }
+
+    def set_input(self, option):
+        self.calls["SetInput"] += 1
+        with self.lock:
+            if self.prompt is None:
+                return reply("No prompt open")
+            if option not in self.prompt_content()["Option"]:
+                return reply("", -1, "Option %s not offered" % option)
+            self.held += time.monotonic() - self.hold_start
+            self.hold_start = None
+            if self.prompt == "pause":
+                self.acknowledged.add(self.current_map()[0])
+            self.prompt = None
+            if option == "Abort":
+                self.abort_run()
+        return reply("Input %s accepted" % option)
@@ -1,3 +1,4 @@
+from contextlib import nullcontext
 from datetime import datetime
 import json
 from pathlib import Path
@@ -22,11 +23,23 @@ from madsci.common.types.resource_types import ContinuousConsumable
 from madsci.common.types.resource_types.definitions import ContinuousConsumableResourceDefinition
 from utils.big_kahuna_protocol_types import BigKahunaPlate, BigKahunaProtocol, BigKahunaAction
 from madsci.client.resource_client import ResourceClient
+from big_kahuna_interface import simulator
+if simulator.enabled():  # .NET stand-ins have to be registered before library_studio is imported
+    simulator.install()
 from big_kahuna_interface.library_studio import LS10
 from big_kahuna_interface.automation_studio import AS10
 import os
 from pathlib import Path
 from utils.log_parsing import read_logs, add_timestamps
+from utils.call_metrics import CallMetrics
+from utils.timeline import build_timeline
+from utils.eta import DurationModel, LiveEta
+from utils.protocol_compiler import CompiledDesign, ProtocolCompiler
+from utils.protocol_validator import ProtocolValidationError, check_protocol
+from utils.checkpoint import STOPPED_RUNS, RunCheckpoint, continuation_design, take_checkpoint
+from utils.run_index import RunIndex
+from utils.design_patch import DesignRecord, apply_patch, design_setup, diff_design, load_record, save_record
+from utils.signal_stats import SignalStats
 
 
 
@@ -38,6 +51,12 @@ class BigKahunaConfig(RestNodeConfig):
     """Directory for Chem and Prompts files"""
     logs_dir: Path
     """Path that Automation Studio writes logs to """
+    instrument_calls: bool = False
+    """Record counts and latency histograms of SiLA and LS API calls"""
+    wash_compatibility: dict[str, list[str]] = {}
+    """Chemicals that may follow each chemical without a wash in between, for skip_wash"""
+    delay_overlap_margin: float = 0.1
+    """Share of the estimated work in a delay window not relied on to fill it, for overlap_delays"""
     # directory: str
     # resource_server_url: Optional[str]
     # deck_locations: Optional[list[str]]
@@ -51,13 +70,22 @@ class BigKahunaNode(RestNode):
 
     config_model = BigKahunaConfig
     def startup_handler(self):
-       self.automation_studio = AS10(logs_dir=self.config.logs_dir, verbosity=True)
+       self.call_metrics = CallMetrics() if self.config.instrument_calls else None
+       self.automation_studio = AS10(logs_dir=self.config.logs_dir, verbosity=True, simulator=simulator.from_environment(self.config.logs_dir), metrics=self.call_metrics)
        self.automation_studio.FindOrStartAS()
+       self.duration_model = DurationModel.load(self.duration_model_path())
+       self.run_index = RunIndex(os.path.join(self.config.main_directory, "run_index.sqlite"))
+       self.automation_studio.signal_stats = SignalStats.load(self.signal_stats_path())
 
     def state_handler(self):
         experiment_status = self.automation_studio.client.ExperimentStatusService.GetExperimentStatus().ReturnValue
         experiment_status = json.loads(experiment_status)
         self.node_state = {"experiment_status": experiment_status}
+        if self.call_metrics is not None:
+            self.node_state["call_metrics"] = self.call_metrics.summary()
+        if self.automation_studio.eta is not None:
+            self.node_state["eta"] = self.automation_studio.eta.summary()
+        self.node_state["signal_stats"] = self.automation_studio.signal_stats.summary()
 
     def shutdown_handler(self):
         self.automation_studio.CloseAS()
@@ -67,49 +95,112 @@ class BigKahunaNode(RestNode):
     def run_protocol(
         self,
         protocol: Path,
+        reorder: bool = False,
+        skip_wash: bool = False,
+        four_tip: bool = False,
+        overlap: bool = False,
+        design_id: Optional[int] = None,
     ) -> ActionResult:
-        """generate a library studio protocol"""
+        """generate a library studio protocol, optionally reordered between barriers to cut arm travel, with other plates' work run during each plate's delays, with washes skipped between compatible steps and with adjacent rows run on the 4Tip head; given the ID of a design this node built, only its changed maps are edited when possible"""
         with open(protocol) as f:
             protocol = BigKahunaProtocol.model_validate(json.load(f))
-        library_studio = LS10(self.config.dll_path, self.config.main_directory, self.config.logs_dir)
-        library_studio.create_lib(protocol.name)
-        library_studio.units = protocol.units
-        for parameter in protocol.parameters:
-            library_studio.add_param(parameter.name, parameter.type, parameter.unit)
-        for name, library in protocol.plates.items():
-            if library.source == False:
-                library_studio.add_library(library.name, library.rows, library.columns, library.color)
-        for chemical in protocol.chemicals:
-            if chemical.source_plate is not None:
-                plate =  protocol.plates[chemical.source_plate]
-            else:
-                plate = None
-            library_studio.add_chemical(plate, chemical.name, chemical.row, chemical.column, chemical.color, chemical.volume)
-        for protocol_action in protocol.actions:
-            self.add_step(protocol_action, library_studio, protocol.plates)
-        library_studio.finish(protocol.plates)
-        success = self.automation_studio.run(library_studio.ID, library_studio._prompts, library_studio._chem, library_studio._tips)
-        if success:
-            file_path = os.path.join(self.automation_studio.logs_dir,self.automation_studio.log)
-            steps = read_logs(file_path)
-            stamped_protocol = add_timestamps(steps, protocol)
-            steps = [step.model_dump() for step in steps]
-            protocol_path = "protocol.json"
-            with open(protocol_path, "w") as f:
-                    json.dump(stamped_protocol.model_dump(), f)
-            action_log_path = "action_logs.json"
-            with open(action_log_path, "w") as f:
-                    json.dump(steps, f)
+        compiler = self.protocol_compiler()
+        try:
+            design = compiler.compile(protocol, compiler.pipeline(reorder, overlap, skip_wash, four_tip))
+        except ProtocolValidationError as e:  # rejected before LS or AS are touched
+            return ActionFailed(errors=[str(e)], json_result={"validation": [issue.model_dump() for issue in e.issues]})
+        data = dict(design.reports)
+        data["compile"] = {"key": design.key, "cached": design.cached, "maps": len(design.maps), "timings_s": design.timings_s}
+        return self.run_design(design, data, design_id)
+
+    @action
+    def resume_protocol(
+        self,
+        checkpoint: Path,
+    ) -> ActionResult:
+        """continue an aborted or out of tips run from the map it stopped in, without redoing the maps before it"""
+        with open(checkpoint) as f:
+            checkpoint = RunCheckpoint.model_validate_json(f.read())
+        compiler = self.protocol_compiler()
+        design = compiler.load(checkpoint.design_key)
+        if design is None:
+            return ActionFailed(errors=["compiled design %s is not in the cache" % checkpoint.design_key])
+        design, continuation = continuation_design(design, checkpoint)
+        if not design.maps:
+            return ActionSucceeded(json_result={"continuation": continuation.model_dump()})
+        compiler.store(design)  # a resumed run can be checkpointed and resumed again
+        data = {"continuation": continuation.model_dump()}
+        data["compile"] = {"key": design.key, "cached": False, "maps": len(design.maps), "timings_s": design.timings_s}
+        return self.run_design(design, data)
+
+    @action
+    def estimate_protocol(
+        self,
+        protocol: Path,
+    ) -> ActionResult:
+        """predict the runtime of a protocol from the durations of past runs"""
+        with open(protocol) as f:
+            protocol = BigKahunaProtocol.model_validate(json.load(f))
+        try:
+            check_protocol(protocol)
+        except ProtocolValidationError as e:
+            return ActionFailed(errors=[str(e)], json_result={"validation": [issue.model_dump() for issue in e.issues]})
+        return ActionSucceeded(json_result=self.duration_model.estimate(protocol).model_dump())
+
+    @action
+    def compile_protocol(
+        self,
+        protocol: Path,
+        reorder: bool = False,
+        skip_wash: bool = False,
+        four_tip: bool = False,
+        overlap: bool = False,
+    ) -> ActionResult:
+        """dry run of run_protocol: compile a protocol into LS maps without touching LS or AS"""
+        with open(protocol) as f:
+            protocol = BigKahunaProtocol.model_validate(json.load(f))
+        compiler = self.protocol_compiler()
+        try:
+            design = compiler.compile(protocol, compiler.pipeline(reorder, overlap, skip_wash, four_tip))
+        except ProtocolValidationError as e:  # rejected before LS or AS are touched
+            return ActionFailed(errors=[str(e)], json_result={"validation": [issue.model_dump() for issue in e.issues]})
+        data = dict(design.reports)
+        data["compile"] = {"key": design.key, "cached": design.cached, "maps": len(design.maps), "timings_s": design.timings_s}
+        data["estimate_s"] = self.duration_model.estimate(design.protocol).total_s
+        design_path = "compiled_%s.json" % design.key
+        with open(design_path, "w") as f:
+            f.write(design.model_dump_json(indent=4))
+        return ActionSucceeded(files={"design": design_path}, json_result=data)
+
+    @action
+    def query_runs(
+        self,
+        plate: Optional[str] = None,
+        well: Optional[str] = None,
+        chemical: Optional[str] = None,
+        location: Optional[str] = None,
+        run_id: Optional[int] = None,
+        design_id: Optional[int] = None,
+        type: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        group_by: Optional[list[str]] = None,
+        limit: int = 1000,
+    ) -> ActionResult:
+        """liquid handling events of past runs from the run index, filtered by plate, well, chemical, deck location, run, design, step type and ISO time window, or their counts and total volumes grouped by any of those"""
+        filters = {"plate": plate, "well": well, "chemical": chemical, "location": location, "run_id": run_id, "design_id": design_id, "type": type}
+        try:
+            result = self.run_index.events(
+                filters,
+                datetime.fromisoformat(since) if since else None,
+                datetime.fromisoformat(until) if until else None,
+                group_by,
+                limit,
+            )
+        except ValueError as e:  # unknown column or malformed time
+            return ActionFailed(errors=[str(e)])
+        return ActionSucceeded(json_result=result)
 
-        # if success and self.resource_client:
-        #     for action in protocol.actions:
-        #         try:
-        #             self.process_resource(action, protocol)
-        #         except Exception as e:
-        #             self.logger.error(str(e))
-            return ActionSucceeded(files={"log_file": file_path, "action_logs": action_log_path, "protocol": protocol_path})
-        else: 
-          return ActionFailed()
     @action
     def run_preloaded_library(
         self,
@@ -118,34 +209,151 @@ class BigKahunaNode(RestNode):
         promptsfile: Path
     ) -> ActionResult:
         """generate a library studio protocol"""
-        success = self.automation_studio.run(library_id, str(promptsfile), str(chemfile))
-        if success:
+        status = self.automation_studio.run(library_id, str(promptsfile), str(chemfile))
+        if status == "completed":
             file_path = os.path.join(self.automation_studio.logs_dir,self.automation_studio.log)
-            steps = read_logs(file_path)
-            steps = [step.model_dump() for step in steps]
+            steps = read_logs(file_path).to_records()
             action_log_path = "action_logs.json"
             with open(action_log_path, "w") as f:
                     json.dump(steps, f)
 
             return ActionSucceeded(files={"log_file": file_path, "action_logs": action_log_path})
         else: 
-          return ActionFailed()
+          return ActionFailed(errors=["run %s" % status])
         
 
 
    
-    def add_step(self, action: BigKahunaAction, library_studio: LS10, plates: dict[str, BigKahunaPlate]):
-        if action.action_type == "transfer":
-            library_studio.single_well_transfer(action.source_plate, action.target_plate, action.source_well, action.target_well, action.volume, action.tags, -1,  plates)
-        elif action.action_type == "dispense":
-            library_studio.dispense_chem(action.source_chemical, action.target_plate, action.target_well, action.volume, action.tags)
-        elif action.action_type == "pause":
-            library_studio.Pause(action.target_plate, action.code)
-        elif action.action_type == "delay":
-            library_studio.Delay(action.target_plate, action.delay)
-        elif action.action_type == "stir":
-            library_studio.Stir(action.target_plate, action.rate)
-   
+    def run_design(self, design: CompiledDesign, data: dict, design_id: Optional[int] = None) -> ActionResult:  # build a compiled design in LS, run it and collect its logs
+        protocol = design.protocol
+        metrics = self.call_metrics
+        if metrics is not None:
+            metrics.reset()
+        estimate = self.duration_model.estimate(protocol)
+        with self.phase("build_design"):
+            library_studio = self.build_design(design, design_id, data)
+        self.automation_studio.eta = LiveEta([max(estimate.per_map_s[i] for i in ls_map.actions) for ls_map in design.maps])
+        try:
+            with self.phase("run"):
+                status = self.automation_studio.run(library_studio.ID, library_studio._prompts, library_studio._chem, library_studio._tips)
+        finally:
+            self.automation_studio.eta = None  # node state shows an ETA only while a design runs
+        self.automation_studio.signal_stats.save(self.signal_stats_path())
+        files = {}
+        if metrics is not None:
+            files["call_metrics"] = "call_metrics_%d.json" % library_studio.ID
+            metrics.write(files["call_metrics"])
+        if status in STOPPED_RUNS:
+            with self.phase("checkpoint"):
+                checkpoint = self.run_checkpoint(design, library_studio.ID, status)
+            files["checkpoint"] = "checkpoint_%d.json" % library_studio.ID
+            with open(files["checkpoint"], "w") as f:
+                f.write(checkpoint.model_dump_json(indent=4))
+            data["checkpoint"] = {"reached_map": checkpoint.reached_map, "total_maps": checkpoint.total_maps, "done_wells": len(checkpoint.done_wells)}
+        if status != "completed":
+            return ActionFailed(errors=["run %s" % status], files=files or None, json_result=data)
+
+        resumed = "continuation" in design.reports
+        if resumed:  # only the actions behind the continued maps ran
+            protocol = protocol.model_copy(update={"actions": [protocol.actions[i] for i in sorted({i for m in design.maps for i in m.actions})]})
+        with self.phase("parse_logs"):
+            file_path = os.path.join(self.automation_studio.logs_dir,self.automation_studio.log)
+            steps = read_logs(file_path)
+            stamped_protocol = add_timestamps(steps, protocol)
+            timeline = self.run_timeline(library_studio.ID, steps, [ls_map.action_type for ls_map in design.maps])
+            if not resumed:  # shortened delays and split maps would skew the model
+                self.learn_durations(steps, stamped_protocol, timeline)
+        with self.phase("index_run"):
+            data["run_id"] = self.run_index.ingest_run(steps, file_path, library_studio.ID, timeline, stamped_protocol, design.key)
+        steps = steps.to_records()
+        protocol_path = "protocol.json"
+        with open(protocol_path, "w") as f:
+                json.dump(stamped_protocol.model_dump(), f)
+        action_log_path = "action_logs.json"
+        with open(action_log_path, "w") as f:
+                json.dump(steps, f)
+        timeline_path = "timeline_%d.json" % library_studio.ID
+        with open(timeline_path, "w") as f:
+                f.write(timeline.model_dump_json(indent=4))
+        files.update({"log_file": file_path, "action_logs": action_log_path, "protocol": protocol_path, "timeline": timeline_path})
+
+        # if self.resource_client:
+        #     for action in protocol.actions:
+        #         try:
+        #             self.process_resource(action, protocol)
+        #         except Exception as e:
+        #             self.logger.error(str(e))
+        return ActionSucceeded(files=files, json_result=data)
+
+    def build_design(self, design: CompiledDesign, design_id: Optional[int], data: dict) -> LS10:
+        """Create the design in LS, or edit the changed maps of design_id when it was built from the same setup"""
+        compiler = self.protocol_compiler()
+        library_studio = LS10(self.config.dll_path, self.config.main_directory, self.config.logs_dir, metrics=self.call_metrics)
+        record = None
+        if design_id is not None:
+            record = load_record(compiler.cache_dir, design_id)
+            patch = diff_design(record, design, design_id)
+            if patch.rebuild is None and library_studio.from_db(design_id):
+                patch.rebuild = "design %d is not in the LS database" % design_id
+            data["patch"] = patch.model_dump()
+            if patch.rebuild is None:
+                apply_patch(patch, design, library_studio)
+                library_studio._prompts, library_studio._chem, library_studio._tips = record.prompts, record.chem, record.tips
+                save_record(compiler.cache_dir, record.model_copy(update={"key": design.key, "maps": design.maps, "patches": record.patches + 1}))
+                return library_studio
+        compiler.emit(design, library_studio)
+        library_studio.finish(design.protocol.plates)
+        save_record(compiler.cache_dir, DesignRecord(design_id=library_studio.ID, key=design.key, setup=design_setup(design),
+                                                     maps=design.maps, prompts=str(library_studio._prompts),
+                                                     chem=str(library_studio._chem), tips=library_studio._tips))
+        return library_studio
+
+    def run_checkpoint(self, design: CompiledDesign, design_id: int, status: str) -> RunCheckpoint:  # how far a stopped run got
+        automation_studio = self.automation_studio
+        if automation_studio.log is None:  # out of tips returns before the log is picked up
+            automation_studio.get_log(1)
+        steps = []
+        if automation_studio.log is not None:
+            steps = read_logs(os.path.join(automation_studio.logs_dir, automation_studio.log))
+        return take_checkpoint(design, design_id, status, automation_studio.transitions, steps, automation_studio.finished)
+
+    def run_timeline(self, design_id: int, steps, map_actions: list[str]):  # per-map timeline of the last run
+        automation_studio = self.automation_studio
+        return build_timeline(
+            design_id,
+            automation_studio.transitions,
+            automation_studio.holds,
+            steps,
+            map_actions,
+            automation_studio.started,
+            automation_studio.finished,
+        )
+
+    def protocol_compiler(self) -> ProtocolCompiler:
+        return ProtocolCompiler(
+            self.duration_model,
+            os.path.join(self.config.main_directory, "compiled"),
+            self.config.wash_compatibility,
+            self.config.delay_overlap_margin,
+        )
+
+    def duration_model_path(self) -> str:
+        return os.path.join(self.config.main_directory, "duration_model.json")
+
+    def signal_stats_path(self) -> str:
+        return os.path.join(self.config.main_directory, "signal_stats.json")
+
+    def learn_durations(self, steps, stamped_protocol: BigKahunaProtocol, timeline):  # fold a finished run into the ETA model
+        self.duration_model.learn_steps(steps)
+        self.duration_model.learn_stamped_protocol(stamped_protocol)
+        self.duration_model.learn_timeline(timeline, stamped_protocol)
+        self.duration_model.save(self.duration_model_path())
+
+    def phase(self, name: str):  # times a python-side phase of an action when instrumented
+        if self.call_metrics is None:
+            return nullcontext()
+        return self.call_metrics.timed("python.%s" % name)
+
     def process_resource(self, action, protocol):
         if action.action_type == "transfer":
             target_plate_location = self.deck_locations[protocol.plates[action.target_plate].deck_location]
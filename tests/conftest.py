@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from big_kahuna_interface import simulator  # noqa: E402
+
+simulator.install()  # the node imports library_studio, which needs the .NET stand-ins
+
+from benchmarks.generators import synthetic_protocol, write_synthetic_log  # noqa: E402
+from big_kahuna_interface.automation_studio import AS10  # noqa: E402
+
+SPEED = "20000"  # simulated seconds per second, a synthetic run takes a fraction of a second
+
+
+@pytest.fixture
+def protocol():
+    return synthetic_protocol(24, seed=3)
+
+
+@pytest.fixture
+def protocol_file(tmp_path, protocol):
+    path = tmp_path / "protocol_in.json"
+    path.write_text(protocol.model_dump_json())
+    return path
+
+
+@pytest.fixture
+def recorded_log(tmp_path, protocol):  # ASMain log the simulator replays, matching protocol
+    path = tmp_path / "ASMain_recorded.log"
+    write_synthetic_log(protocol, str(path))
+    return path
+
+
+@pytest.fixture
+def node(tmp_path, monkeypatch, recorded_log):
+    """BigKahunaNode started against the simulator, working in tmp_path"""
+    import big_kahuna_module
+
+    for name in ("main", "logs"):
+        (tmp_path / name).mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("BIG_KAHUNA_SIMULATOR_LOG", str(recorded_log))
+    monkeypatch.setenv("BIG_KAHUNA_SIMULATOR_SPEED", SPEED)
+    monkeypatch.setattr(AS10, "FindOrStartAS", AS10.StartAS)  # no AutomationRemote and its 20 s wait
+    sleep = time.sleep
+    monkeypatch.setattr(time, "sleep", lambda seconds: sleep(min(seconds, 0.01)))  # AS10 polls every second
+    config = big_kahuna_module.BigKahunaConfig(
+        dll_path=tmp_path / "LS_API.dll",
+        main_directory=tmp_path / "main",
+        logs_dir=tmp_path / "logs",
+        enable_registry_resolution=False,
+    )
+    node = big_kahuna_module.BigKahunaNode(node_config=config)
+    node.startup_handler()
+    yield node
+    node.automation_studio.close_record()
@@ -0,0 +1,79 @@
+from utils.design_patch import load_record
+
+
+def test_estimate_protocol(node, protocol, protocol_file):
+    result = node.estimate_protocol(protocol_file)
+
+    assert result.status == "succeeded"
+    assert result.json_result["total_s"] > 0
+    assert len(result.json_result["per_map_s"]) == len(protocol.actions)
+
+
+def test_estimate_protocol_rejects_unknown_plate(node, protocol, tmp_path):
+    protocol.actions[0].target_plate = "no_such_plate"
+    path = tmp_path / "bad_protocol.json"
+    path.write_text(protocol.model_dump_json())
+
+    result = node.estimate_protocol(path)
+
+    assert result.status == "failed"
+    assert any(issue["message"] == "unknown plate no_such_plate" for issue in result.json_result["validation"])
+
+
+def test_compile_protocol_reports(node, protocol_file):
+    result = node.compile_protocol(protocol_file, reorder=True, skip_wash=True, overlap=True)
+
+    assert result.status == "succeeded"
+    data = result.json_result
+    assert data["compile"]["maps"] > 0 and not data["compile"]["cached"]
+    assert {"reorder", "skip_wash", "overlap"} <= set(data)
+    assert data["estimate_s"] > 0
+
+
+def test_compile_protocol_validation_issues(node, protocol, tmp_path):
+    protocol.actions[0].volume = -1.0
+    path = tmp_path / "bad_protocol.json"
+    path.write_text(protocol.model_dump_json())
+
+    result = node.compile_protocol(path)
+
+    assert result.status == "failed"
+    assert [issue["field"] for issue in result.json_result["validation"]] == ["volume"]
+
+
+def test_run_protocol_reports(node, protocol_file):
+    result = node.run_protocol(protocol_file, reorder=True)
+
+    assert result.status == "succeeded", result.errors
+    data = result.json_result
+    assert "reorder" in data and data["compile"]["maps"] > 0
+    assert isinstance(data["run_id"], int)
+    assert set(result.files.model_dump()) >= {"log_file", "action_logs", "protocol", "timeline"}
+
+
+def test_run_protocol_patches_design(node, protocol, tmp_path, protocol_file):
+    first = node.run_protocol(protocol_file)
+    design_id = node.automation_studio.ID
+    dispense = next(a for a in protocol.actions if a.action_type == "dispense")
+    dispense.volume += 50.0
+    path = tmp_path / "changed_protocol.json"
+    path.write_text(protocol.model_dump_json())
+
+    result = node.run_protocol(path, design_id=design_id)
+
+    assert first.status == result.status == "succeeded"
+    patch = result.json_result["patch"]
+    assert patch["design_id"] == design_id and patch["rebuild"] is None
+    assert len(patch["edits"]) == 1
+    assert result.json_result["run_id"] != first.json_result["run_id"]
+
+
+def test_run_preloaded_library(node, protocol_file, tmp_path):
+    node.run_protocol(protocol_file)
+    record = load_record(node.protocol_compiler().cache_dir, node.automation_studio.ID)
+
+    result = node.run_preloaded_library(record.design_id, record.chem, record.prompts)
+    missing = node.run_preloaded_library(record.design_id, tmp_path / "no_chem.xml", record.prompts)
+
+    assert result.status == "succeeded"
+    assert missing.status == "failed" and missing.errors[0].message == "run no-go"
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from utils import call_metrics
+from utils.call_metrics import BUCKET_LABELS, CallMetrics, LatencyHistogram
+
+
+class Feature:
+    def Get(self, value):
+        return value
+
+
+class Stub:
+    def __init__(self):
+        self.feature = Feature()
+        self.name = "stub"
+
+    def Run(self, value):
+        return value * 2
+
+    def Fail(self):
+        raise RuntimeError("instrument fault")
+
+
+@pytest.fixture
+def clock(monkeypatch):  # perf_counter stepping 2 ms per call, so every call takes 2 ms
+    ticks = iter(k * 0.002 for k in range(1000))
+    monkeypatch.setattr(call_metrics.time, "perf_counter", lambda: next(ticks))
+
+
+def test_proxy_counts_calls_and_errors(clock):
+    metrics = CallMetrics()
+    proxy = metrics.wrap(Stub(), "SiLA")
+
+    assert [proxy.Run(k) for k in range(3)] == [0, 2, 4]
+    assert proxy.feature.Get(5) == 5
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            proxy.Fail()
+    assert proxy.name == "stub"  # plain values are not timed
+
+    summary = metrics.summary()
+    assert list(summary) == ["SiLA.Fail", "SiLA.Run", "SiLA.feature.Get"]
+    assert (summary["SiLA.Run"]["count"], summary["SiLA.Run"]["errors"]) == (3, 0)
+    assert (summary["SiLA.Fail"]["count"], summary["SiLA.Fail"]["errors"]) == (2, 2)
+    assert summary["SiLA.feature.Get"]["count"] == 1
+    assert summary["SiLA.Run"]["total_s"] == pytest.approx(0.006)
+
+
+def test_timed_counts_errors(clock):
+    metrics = CallMetrics()
+    with metrics.timed("python.build"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timed("python.build"):
+            raise ValueError
+
+    assert (metrics.histograms["python.build"].count, metrics.histograms["python.build"].errors) == (2, 1)
+
+
+def test_bucket_placement():
+    histogram = LatencyHistogram()
+    for seconds in (0.001, 0.0011, 0.002, 5000.0):
+        histogram.observe(seconds)
+
+    # bucket bounds are inclusive, 1 ms sits in the 1 ms bucket and 1.1 ms in the next one up
+    assert histogram.to_dict()["buckets"] == {"0.001": 1, "0.00178": 1, "0.00316": 1, "inf": 1}
+    assert histogram.quantile(0.5) == pytest.approx(0.0017782794)
+    assert histogram.quantile(1.0) == 5000.0
+    assert BUCKET_LABELS[-1] == "inf"
+
+
+def test_write_round_trip(tmp_path, clock):
+    metrics = CallMetrics()
+    proxy = metrics.wrap(Stub(), "LS", depth=0)
+    proxy.Run(1)
+    with pytest.raises(RuntimeError):
+        proxy.Fail()
+    metrics.write(str(tmp_path / "metrics.json"))
+
+    with open(tmp_path / "metrics.json") as f:
+        data = json.load(f)
+    merged = LatencyHistogram.from_dict(data["LS.Fail"])
+    merged.merge(LatencyHistogram.from_dict(data["LS.Run"]))
+    assert (merged.count, merged.errors) == (2, 1)
+    assert merged.to_dict()["buckets"] == {"0.00316": 2}
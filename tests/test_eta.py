@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.generators import synthetic_plates, synthetic_protocol
+from utils.big_kahuna_protocol_types import (
+    BigKahunaChemical,
+    BigKahunaDelay,
+    BigKahunaDispense,
+    BigKahunaDispenseRange,
+    BigKahunaProtocol,
+    BigKahunaTags,
+)
+from utils.eta import DEFAULT_DURATIONS, DurationModel, LiveEta, action_keys
+from utils.log_parsing import LiquidStepRecord
+
+SOURCE = "Deck 10-11 Position 2"
+CELL_1 = "Deck 12-13 Heat-Stir 1"
+CELL_2 = "Deck 12-13 Heat-Stir 2"
+
+
+def learned_model() -> DurationModel:
+    model = DurationModel()
+    model.learn_steps([
+        LiquidStepRecord("aspirate", SOURCE, "A", 1, 100.0, 0),
+        LiquidStepRecord("dispense", CELL_1, "A", 1, 100.0, 4000),
+        LiquidStepRecord("dispense", "Drain", None, None, 0.0, 5000),  # wash cycle
+        LiquidStepRecord("dispense", "Clean", None, None, 0.0, 9000),
+        LiquidStepRecord("dispense", CELL_2, "B", 1, 250.0, 12000),
+    ])
+    return model
+
+
+def protocol(*actions) -> BigKahunaProtocol:
+    chemicals = [BigKahunaChemical(name="Water", source_plate="source_plate", row=1, column=1, volume=10000.0)]
+    return BigKahunaProtocol(name="eta", parameters=synthetic_protocol(0).parameters, plates=synthetic_plates(),
+                             chemicals=chemicals, actions=list(actions))
+
+
+def test_learn_steps_splits_at_washes():
+    model = learned_model()
+
+    assert model.stats["transfer|%s|%s|128" % (SOURCE, CELL_1)] == [1, 4.0]
+    assert model.stats["wash"] == [1, 5.0]
+    assert model.stats["dispense|%s|256" % CELL_2] == [1, 3.0]
+    assert (model.washes, model.segments, model.washes_per_action()) == (1, 2, 0.5)
+
+
+def test_action_seconds():
+    model = learned_model()
+    dispense = BigKahunaDispense(source_chemical="Water", target_plate="cell_plate_1", target_well="A1", volume=100.0)
+    p = protocol(dispense)
+
+    assert model.action_seconds(dispense, p) == 4.0 + 0.5 * 5.0  # plate-held chemical, pipetted like a transfer, plus washes
+    skip_wash = dispense.model_copy(update={"tags": [BigKahunaTags.SkipWash]})
+    assert model.action_seconds(skip_wash, p) == 4.0
+    assert model.action_seconds(dispense.model_copy(update={"tags": [BigKahunaTags.SkipMap]}), p) == 0.0
+    wells = BigKahunaDispenseRange(source_chemical="Water", target_plate="cell_plate_1", target_range="A1:B1", volume=100.0)
+    assert model.action_seconds(wells, p) == 2 * 6.5
+    delay = BigKahunaDelay(target_plate="cell_plate_1", delay=1.0)
+    assert model.action_seconds(delay, p) == 60 + DEFAULT_DURATIONS["delay_overhead"]
+
+    model.observe(action_keys(dispense, p)[0], 20.0)  # whole actions seen before win
+    assert model.action_seconds(dispense, p) == 20.0
+
+
+def test_live_eta_rescales_and_clamps():
+    start = datetime(2025, 8, 14, 20, 0, 0)
+    eta = LiveEta([10.0, 10.0, 10.0, 10.0], start)
+
+    eta.update(1, start)
+    assert (eta.scale, eta.remaining_s, eta.finish) == (1.0, 40.0, start + timedelta(seconds=40))
+
+    eta.update(3, start + timedelta(seconds=40))  # two maps done in twice their prediction
+    assert (eta.scale, eta.remaining_s) == (2.0, 40.0)
+
+    eta.update(3, start + timedelta(seconds=200))
+    assert (eta.scale, eta.remaining_s) == (4.0, 80.0)
+    eta.update(3, start + timedelta(seconds=1))
+    assert (eta.scale, eta.remaining_s) == (0.25, 5.0)
+    assert eta.summary()["map"] == 3
+
+
+@pytest.mark.parametrize("fault", [None, "aborted"])
+def test_eta_is_cleared_after_the_run(node, protocol_file, fault):
+    node.automation_studio.simulator.fault = fault
+
+    node.run_protocol(protocol_file)
+    node.state_handler()
+
+    assert node.automation_studio.eta is None
+    assert "eta" not in node.node_state
@@ -0,0 +1,10 @@
+from big_kahuna_interface.library_studio import CustomUtils
+from big_kahuna_interface.simulator import Point
+
+
+def test_reversed_ranges_map_top_left_first():
+    utils = CustomUtils()
+
+    for range_string in ("A1:C3", "C3:A1", "A3:C1", "C1:A3"):
+        assert utils.range2points(range_string) == (Point(1, 1), Point(3, 3))
+    assert utils.range2points("B2") == (Point(2, 2), Point(2, 2))
@@ -0,0 +1,122 @@
+from benchmarks.generators import synthetic_protocol, write_synthetic_log
+from utils.big_kahuna_protocol_types import BigKahunaDispenseRange, BigKahunaTransferRange
+from utils.log_parsing import CHUNK_ROWS, LiquidSteps, add_timestamps, log_steps, read_log_chunks, read_logs, scan_log, scan_pays_off
+from utils.timeline import step_time
+
+HEADER = "Time\tModule\tAction\tParameter Name\tParameter Value\tUnits\n"
+
+
+def write_log(path, stamps):  # one move and one dispense per stamp
+    with open(path, "w") as f:
+        f.write(HEADER)
+        for i, stamp in enumerate(stamps):
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Position\tDeck 1\t\n" % stamp)
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Well Row\t%d\t\n" % (stamp, i + 1))
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Well Column\t2\t\n" % stamp)
+            f.write("%s\tArm\tDispense\tOutput : Volume Dispensed\t%d\t\n" % (stamp, 100 * (i + 1)))
+
+
+def write_status_log(path, status_rows: int):  # transfers between status rows, the share of status rows sets the scan choice
+    with open(path, "w") as f:
+        f.write(HEADER)
+        for i in range(4):
+            stamp = "08/14/2025 20:38:%02d.%03d" % (20 + i, 7 * i)
+            for _ in range(status_rows):
+                f.write("%s\tSystem\tStatus\tOutput : State\tRunning\t\n" % stamp)
+            f.write("%s\tSystem\tStatus\tOutput : Message\tOutput : Volume check\t\n" % stamp)  # pattern in another column
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Position\tDeck 10-11 Position 2\t\n" % stamp)
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Well Row\t%d\t\n" % (stamp, i + 1))
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Well Column\t1\t\n" % stamp)
+            f.write("%s\tArm\tAspirate\tOutput : Volume Aspirated\t%d\tuL\n" % (stamp, 50 * (i + 1)))
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Position\tDeck 12-13 Heat-Stir 1\t\n" % stamp)
+            f.write("%s\tArm\tMove Arm To Substrate\tInput : Well Row\t\t\n" % stamp)
+            f.write("%s\tArm\tDispense\tOutput : Volume Filld\t%d\tuL\n" % (stamp, 50 * (i + 1)))
+
+
+def test_output_keeps_logged_stamps(tmp_path):
+    stamps = ["08/14/2025 20:38:23.171", "8/14/2025 20:38:24.5", "08/14/2025 20:38:25.123456", "08/14/2025 20:38:26.000"]
+    path = tmp_path / "ASMain_odd.log"
+    write_log(path, stamps)
+
+    for fast in (True, False):
+        steps = read_logs(str(path), CHUNK_ROWS, fast)
+        assert [r["timestamp"] for r in steps.to_records()] == stamps
+        assert [step.time_ms - steps[0].time_ms for step in steps] == [0, 1329, 1952, 2829]
+        assert set(steps.stamps) == {1, 2}  # only the stamps ms_stamp would print differently
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "ASMain_odd.log"
+    write_log(path, ["08/14/2025 23:59:59.999", "8/15/2025 0:00:00.25"])
+    steps = read_logs(str(path))
+
+    copy = LiquidSteps.from_steps(steps.to_records())
+
+    assert copy.to_records() == steps.to_records()
+    assert [step_time(step) for step in copy] == [step_time(step) for step in steps]
+    assert steps.model(1).timestamp == "8/15/2025 0:00:00.25" and steps[1].row == "B" and steps[1].column == 2
+
+
+def test_scan_matches_pandas(tmp_path):
+    path = tmp_path / "ASMain_status.log"
+    write_status_log(path, 20)
+
+    scanned = log_steps(scan_log(str(path)))
+    read = log_steps(read_log_chunks(str(path)))
+
+    assert len(scanned) == 8
+    assert scanned.to_records() == read.to_records()
+    assert [step.time_ms for step in scanned] == [step.time_ms for step in read]
+    assert [(step.type, step.row, step.volume) for step in scanned[:2]] == [("aspirate", "A", 50.0), ("dispense", None, 50.0)]
+
+
+def test_scan_pays_off(tmp_path):
+    sparse = tmp_path / "ASMain_sparse.log"
+    dense = tmp_path / "ASMain_dense.log"
+    empty = tmp_path / "ASMain_empty.log"
+    write_status_log(sparse, 20)
+    write_status_log(dense, 0)
+    empty.write_text("")
+
+    assert scan_pays_off(str(sparse))
+    assert not scan_pays_off(str(dense))  # mostly liquid rows, pandas reads those faster
+    assert not scan_pays_off(str(empty))
+    assert read_logs(str(sparse)).to_records() == read_logs(str(dense)).to_records() == read_logs(str(sparse), fast=False).to_records()
+
+
+def test_chunks_carry_the_arm_position(tmp_path):
+    path = tmp_path / "ASMain_status.log"
+    write_status_log(path, 3)
+    with open(path) as f:  # columns read_log_chunks skips, in another order
+        lines = [line.rstrip("\n").split("\t") for line in f]
+    with open(path, "w") as f:
+        f.writelines("\t".join([line[5], line[0], line[3], line[2], line[4], line[1], "x"]) + "\n" for line in lines)
+
+    whole = log_steps(read_log_chunks(str(path)))
+    chunked = log_steps(read_log_chunks(str(path), 2))  # moves and volumes land in different chunks
+
+    assert len(whole) == 8
+    assert chunked.to_records() == whole.to_records()
+    assert [step.location for step in whole[:2]] == ["Deck 10-11 Position 2", "Deck 12-13 Heat-Stir 1"]
+
+
+def test_add_timestamps_stamps_range_wells(tmp_path):
+    protocol = synthetic_protocol(6, seed=1)
+    protocol.actions[2:2] = [
+        BigKahunaDispenseRange(source_chemical="solvent", target_plate="cell_plate_1", target_range="B2:A1", volumes=[10.0, 20.0, 30.0, 40.0]),
+        BigKahunaTransferRange(source_plate="cell_plate_1", target_plate="cell_plate_2", source_range="A1:A2", target_range="C1:C2", volume=5.0),
+    ]
+    expanded = protocol.model_copy(deep=True)  # the single well actions LS runs the ranges as
+    expanded.actions = [single for action in expanded.actions for single in (action.expand() if hasattr(action, "expand") else [action])]
+    path = tmp_path / "ASMain_ranges.log"
+    write_synthetic_log(expanded, str(path))
+    steps = read_logs(str(path))
+
+    stamped = add_timestamps(steps, protocol)
+    singles = add_timestamps(steps, expanded)
+
+    stamps = [a.dispense_timestamp for a in singles.actions if a.action_type in ("transfer", "dispense")]
+    assert None not in stamps
+    assert stamped.actions[2].dispense_timestamps == stamps[2:6]  # A1, A2, B1, B2 although written B2:A1
+    assert stamped.actions[3].dispense_timestamps == stamps[6:8]
+    assert [a.dispense_timestamp for a in stamped.actions if a.action_type in ("transfer", "dispense")] == stamps[:2] + stamps[8:]
@@ -0,0 +1,17 @@
+from big_kahuna_interface import net_marshal
+
+
+def test_uniform_lists_keep_the_value_type():
+    net_marshal.clear()
+
+    lists = [net_marshal.uniform_objects(3, value) for value in (1, 1.0, True)]
+
+    assert [type(items[0]) for items in lists] == [int, float, bool]
+    assert net_marshal.uniform_objects(3, 1.0) is lists[1]
+
+
+def test_uniform_doubles_are_interned_per_type():
+    net_marshal.clear()
+
+    assert net_marshal.uniform_doubles(2, 1) is not net_marshal.uniform_doubles(2, 1.0)
+    assert net_marshal.uniform_doubles(2, 1.0) is net_marshal.uniform_doubles(2, 1.0)
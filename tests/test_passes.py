@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+
+from benchmarks.generators import synthetic_plates, synthetic_protocol
+from utils.big_kahuna_protocol_types import (
+    BigKahunaAction,
+    BigKahunaChemical,
+    BigKahunaDelay,
+    BigKahunaDispense,
+    BigKahunaDispenseRange,
+    BigKahunaProtocol,
+    BigKahunaStir,
+    BigKahunaTags,
+    BigKahunaTransfer,
+)
+from utils.checkpoint import continuation_design, take_checkpoint
+from utils.eta import DurationModel
+from utils.log_parsing import LiquidStepRecord
+from utils.protocol_compiler import ProtocolCompiler
+from utils.reorder import REORDER_BARRIERS, action_wells, reorder_actions
+from utils.scheduler import overlap_delays
+from utils.timeline import datetime_ms
+from utils.tip_optimizer import optimize_four_tip
+from utils.wash_planner import plan_skip_wash
+
+
+def dispense(plate, well, chemical="Water", volume=100.0):
+    return BigKahunaDispense(source_chemical=chemical, target_plate=plate, target_well=well, volume=volume)
+
+
+def make_protocol(actions):
+    chemicals = [BigKahunaChemical(name=name, source_plate="source_plate", row=1, column=i + 1, volume=10000.0)
+                 for i, name in enumerate(["Water", "NaCl"])]
+    return BigKahunaProtocol(name="passes", parameters=synthetic_protocol(0).parameters, plates=synthetic_plates(),
+                             chemicals=chemicals, actions=actions)
+
+
+def test_reorder_keeps_generic_actions_in_place():
+    before = [dispense("cell_plate_1", "A1"), dispense("cell_plate_6", "A1"), dispense("cell_plate_1", "B1")]
+    after = [dispense("cell_plate_6", "B1"), dispense("cell_plate_1", "C1"), dispense("cell_plate_6", "C1")]
+    action = BigKahunaAction()
+
+    actions, _ = reorder_actions(make_protocol(before + [action] + after))
+
+    assert actions[3] is action
+    assert {id(a) for a in actions[:3]} == {id(a) for a in before}
+
+
+def test_overlap_does_not_cross_generic_actions():
+    action = BigKahunaAction()
+    other = dispense("cell_plate_2", "A1")
+    protocol = make_protocol([BigKahunaDelay(target_plate="cell_plate_1", delay=5.0), dispense("cell_plate_1", "A1"), action, other])
+
+    actions, _ = overlap_delays(protocol, DurationModel())
+
+    assert actions.index(action) < actions.index(other)
+
+
+def test_four_tip_groups_stop_at_generic_actions():
+    wells = [dispense("cell_plate_1", row + "1") for row in "ABCD"]
+
+    _, grouped = optimize_four_tip(make_protocol(wells))
+    _, split = optimize_four_tip(make_protocol(wells[:2] + [BigKahunaAction()] + wells[2:]))
+
+    assert (grouped.groups, split.groups) == (1, 0)
+
+
+def test_wash_is_kept_around_generic_actions():
+    _, together = plan_skip_wash(make_protocol([dispense("cell_plate_1", "A1"), dispense("cell_plate_1", "B1")]))
+    _, apart = plan_skip_wash(make_protocol([dispense("cell_plate_1", "A1"), BigKahunaAction(), dispense("cell_plate_1", "B1")]))
+
+    assert (together.skipped, apart.skipped) == (1, 0)
+
+
+def accesses(actions):  # (plate, well) -> ids of the actions touching it, in order
+    order = {}
+    for action in actions:
+        for well in action_wells(action):
+            order.setdefault(well, []).append(id(action))
+    return order
+
+
+def test_reorder_keeps_well_order_and_barriers():
+    protocol = synthetic_protocol(80, seed=1)
+
+    actions, report = reorder_actions(protocol)
+
+    assert sorted(map(id, actions)) == sorted(map(id, protocol.actions))
+    assert accesses(actions) == accesses(protocol.actions)
+    assert [(i, a) for i, a in enumerate(actions) if a.action_type in REORDER_BARRIERS] == \
+        [(i, a) for i, a in enumerate(protocol.actions) if a.action_type in REORDER_BARRIERS]
+    assert report.travel_after <= report.travel_before and report.saving == report.travel_before - report.travel_after
+
+
+def test_overlap_fills_delay_with_other_plates():
+    first, second = dispense("cell_plate_2", "A1"), dispense("cell_plate_2", "B1")
+    held = dispense("cell_plate_1", "A1")
+    protocol = make_protocol([BigKahunaDelay(target_plate="cell_plate_1", delay=5.0), held, first, second])
+
+    actions, report = overlap_delays(protocol, DurationModel())
+
+    liquid = [a for a in actions if a.action_type == "dispense"]
+    assert liquid == [first, second, held]
+    delays = [a for a in actions if a.action_type == "delay"]
+    assert [d.target_plate for d in delays] == ["cell_plate_1"] and delays[0].delay < 5.0
+    assert report.saving_s > 0 and report.residual_delays == 1
+
+
+def test_four_tip_pulls_adjacent_rows_together():
+    rows = {row: dispense("cell_plate_1", row + "1") for row in "ABCD"}
+    other = dispense("cell_plate_2", "A1", chemical="NaCl")
+    protocol = make_protocol([rows["A"], other, rows["C"], rows["B"], rows["D"]])
+
+    actions, report = optimize_four_tip(protocol)
+
+    assert [a.target_well for a in actions] == ["A1", "B1", "C1", "D1", "A1"]
+    assert all(BigKahunaTags.FourTip in a.tags for a in actions[:4])
+    assert actions[4].tags == [BigKahunaTags.SingleTip]
+    assert (report.groups, report.maps_saved, report.single_tip) == (1, 3, 1)
+
+
+def test_four_tip_does_not_jump_over_a_well_access():
+    rows = [dispense("cell_plate_1", row + "1") for row in "ABCD"]
+    between = BigKahunaTransfer(source_plate="cell_plate_1", source_well="C1", target_plate="ICP_rack", target_well="A1", volume=50.0)
+
+    _, report = optimize_four_tip(make_protocol(rows[:1] + [between] + rows[1:]))
+
+    assert report.groups == 0
+
+
+def test_four_tip_keeps_skip_wash_where_the_order_holds():
+    compiler = ProtocolCompiler()
+    actions = [dispense("cell_plate_1", "A1", volume=100.0), dispense("cell_plate_1", "A2", volume=250.0)]
+    actions[0].tags = [BigKahunaTags.SkipWash]
+
+    design = compiler.compile(make_protocol(actions), compiler.pipeline(four_tip=True))
+
+    assert [m.tags for m in design.maps] == [[BigKahunaTags.SkipWash, BigKahunaTags.SingleTip], [BigKahunaTags.SingleTip]]
+
+
+def test_four_tip_drops_skip_wash_when_the_next_step_changes():
+    rows = {row: dispense("cell_plate_1", row + "1") for row in "ABCD"}
+    other = dispense("cell_plate_2", "A1", chemical="NaCl")
+    other.tags = [BigKahunaTags.SkipWash]  # followed by D1, by nothing once D1 joins the group
+    rows["D"].tags = [BigKahunaTags.SkipWash]  # last, then followed by other
+
+    actions, _ = optimize_four_tip(make_protocol([rows["A"], rows["B"], rows["C"], other, rows["D"]]))
+
+    assert [a.target_well for a in actions] == ["A1", "B1", "C1", "D1", "A1"]
+    assert [BigKahunaTags.SkipWash in a.tags for a in actions] == [False] * 5
+
+
+def test_four_tip_keeps_chained_transfers_apart():
+    chain = [BigKahunaTransfer(source_plate="ICP_rack", source_well=source, target_plate="ICP_rack", target_well=target, volume=50.0)
+             for source, target in (("D1", "E1"), ("C1", "D1"), ("B1", "C1"), ("A1", "B1"))]
+
+    actions, report = optimize_four_tip(make_protocol(chain))
+
+    assert report.groups == 0
+    assert [(a.source_well, a.target_well) for a in actions] == [(a.source_well, a.target_well) for a in chain]
+
+
+def test_skip_wash_between_compatible_liquids():
+    actions = [dispense("cell_plate_1", "A1"), dispense("cell_plate_1", "B1", chemical="NaCl"), dispense("cell_plate_1", "C1")]
+
+    _, strict = plan_skip_wash(make_protocol(actions))
+    tagged, plan = plan_skip_wash(make_protocol(actions), {"Water": ["NaCl"]})
+
+    assert strict.skipped == 0
+    assert plan.actions == [0] and BigKahunaTags.SkipWash in tagged[0].tags
+
+
+def test_skip_wash_after_the_same_source_well():
+    transfers = [BigKahunaTransfer(source_plate="cell_plate_1", source_well="A1", target_plate="ICP_rack", target_well=well, volume=50.0)
+                 for well in ("A1", "A2")]
+
+    _, plan = plan_skip_wash(make_protocol(transfers))
+
+    assert plan.actions == [0]
+
+
+def stopped_design():
+    protocol = make_protocol([
+        BigKahunaStir(target_plate="cell_plate_1", rate=200.0),
+        BigKahunaDispenseRange(source_chemical="Water", target_plate="cell_plate_1", target_range="A1:D1", volume=100.0),
+        BigKahunaDelay(target_plate="cell_plate_1", delay=2.0),
+        dispense("cell_plate_2", "A1"),
+    ])
+    return ProtocolCompiler().compile(protocol)
+
+
+def test_checkpoint_of_a_partly_done_map():
+    design = stopped_design()
+    start = datetime(2025, 8, 14, 20, 0, 0)
+    transitions = [(1, 4, "StirRate", start), (2, 4, "Dispense", start + timedelta(seconds=10))]
+    steps = [LiquidStepRecord("dispense", "Deck 12-13 Heat-Stir 1", "A", 1, 100.0, datetime_ms(start) + 12000),
+             LiquidStepRecord("dispense", "Deck 12-13 Heat-Stir 1", "B", 1, 100.0, datetime_ms(start) + 5000)]  # before the map
+
+    checkpoint = take_checkpoint(design, 1000, "notips", transitions, steps, start + timedelta(seconds=20))
+    continued, report = continuation_design(design, checkpoint)
+
+    assert (checkpoint.reached_map, checkpoint.done_wells, checkpoint.elapsed_s) == (2, [("cell_plate_1", "A1")], 10.0)
+    assert (report.first_map, report.skipped_maps, report.split_maps, report.restored_stirs) == (2, 1, 1, 1)
+    assert [(m.parameter or m.target_range) for m in continued.maps] == ["StirRate", "B1", "C1", "D1", "Delay", "A1"]
+    assert continued.key == design.key + "-from2"
+
+
+def test_checkpoint_in_a_delay_keeps_its_rest():
+    design = stopped_design()
+    start = datetime(2025, 8, 14, 20, 0, 0)
+    checkpoint = take_checkpoint(design, 1000, "aborted", [(3, 4, "Delay", start)], [], start + timedelta(seconds=30))
+
+    continued, report = continuation_design(design, checkpoint)
+
+    assert report.remaining_delay_s == 90.0
+    assert [(m.parameter, m.value) for m in continued.maps[:2]] == [("StirRate", 200.0), ("Delay", 1.5)]
+    assert len(continued.maps) == 3
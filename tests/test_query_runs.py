@@ -0,0 +1,27 @@
+def test_query_runs_returns_events(node, protocol, recorded_log):
+    run_id = node.run_index.ingest_log(str(recorded_log), protocol=protocol, design_id=7)
+
+    result = node.query_runs(design_id=7, type="dispense", plate="cell_plate_1")
+
+    assert result.status == "succeeded"
+    events = result.json_result["events"]
+    assert events and not result.json_result["truncated"]
+    assert {(e["run_id"], e["plate"], e["type"]) for e in events} == {(run_id, "cell_plate_1", "dispense")}
+
+
+def test_query_runs_groups(node, protocol, recorded_log):
+    node.run_index.ingest_log(str(recorded_log), protocol=protocol, design_id=7)
+    dispenses = sum(1 for a in protocol.actions if a.action_type == "dispense")
+
+    result = node.query_runs(design_id=7, type="dispense", group_by=["chemical"])
+
+    groups = [g for g in result.json_result["groups"] if g["chemical"] is not None]  # washes have no chemical
+    assert {g["chemical"] for g in groups} == {a.source_chemical for a in protocol.actions if a.action_type == "dispense"}
+    assert sum(g["count"] for g in groups) == dispenses
+
+
+def test_query_runs_rejects_unknown_group(node):
+    result = node.query_runs(group_by=["colour"])
+
+    assert result.status == "failed"
+    assert result.json_result is None
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from utils.log_parsing import read_logs
+from utils.run_index import RunIndex
+from utils.timeline import ms_datetime
+
+
+def test_steps_keep_their_parsed_times(tmp_path, protocol, recorded_log):
+    steps = read_logs(str(recorded_log))
+    index = RunIndex(str(tmp_path / "index.sqlite"))
+
+    run_id = index.ingest_log(str(recorded_log), protocol=protocol)
+
+    rows = index.query("SELECT time_ms FROM steps WHERE run_id = ? ORDER BY seq", (run_id,))
+    assert [row["time_ms"] for row in rows] == list(steps.times)
+    run = index.query("SELECT start_ms, end_ms FROM runs", ())[0]
+    assert (run["start_ms"], run["end_ms"]) == (min(steps.times), max(steps.times))
+
+
+def test_time_window_uses_the_log_clock(tmp_path, protocol, recorded_log):
+    steps = read_logs(str(recorded_log))
+    index = RunIndex(str(tmp_path / "index.sqlite"))
+    index.ingest_log(str(recorded_log), protocol=protocol)
+    middle = steps[len(steps) // 2]
+
+    later = index.events(since=ms_datetime(middle.time_ms), limit=10 ** 6)["events"]
+    earlier = index.events(until=datetime.strptime(middle.timestamp, "%m/%d/%Y %H:%M:%S.%f"), limit=10 ** 6)["events"]
+
+    assert min(e["time_ms"] for e in later) == middle.time_ms
+    assert len(later) + len(earlier) == len(steps)
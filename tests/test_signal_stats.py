@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+from big_kahuna_interface.automation_studio import AS10
+from utils.signal_stats import DRIFT_STREAK, MIN_BASELINE, SignalStats
+
+
+def with_baseline(kind="map", description="Dispense Water", seconds=10.0, n=20) -> SignalStats:
+    stats = SignalStats()
+    for _ in range(n):
+        stats.observe(kind, description, seconds)
+    stats.end_run()
+    stats.start_run()
+    return stats
+
+
+def test_stable_run_does_not_drift():
+    stats = with_baseline()
+
+    assert [stats.observe("map", "Dispense Water", 10.0) for _ in range(10)] == [None] * 10
+    assert stats.summary()["drifting"] == {}
+
+
+def test_long_streak_drifts():
+    stats = with_baseline()
+
+    drifts = [stats.observe("map", "Dispense Water", 30.0) for _ in range(DRIFT_STREAK)]
+
+    assert drifts[:-1] == [None] * (DRIFT_STREAK - 1)
+    assert drifts[-1] == {"key": "map:Dispense Water", "seconds": 30.0,
+                          "reason": "3 intervals in a row above the baseline p95 of 10 s"}
+    assert stats.summary()["drifting"] == {"map:Dispense Water": drifts[-1]}
+
+
+def test_shifted_median_drifts():
+    stats = with_baseline()
+
+    drifts = [stats.observe("map", "Dispense Water", seconds) for seconds in (20.0, 10.0, 20.0, 10.0, 20.0)]
+
+    assert drifts[:-1] == [None] * 4  # no streak, and too few intervals for a median
+    assert drifts[-1]["reason"] == "median 20 s against a baseline median of 10 s"
+
+
+def test_new_map_is_compared_with_its_kind():
+    stats = with_baseline()
+
+    drifts = [stats.observe("map", "Stir cell_plate_1", 30.0) for _ in range(DRIFT_STREAK)]
+
+    assert drifts[-1]["key"] == "map:Stir cell_plate_1"
+
+
+def test_short_baseline_is_not_used():
+    stats = with_baseline(n=MIN_BASELINE - 1)
+
+    assert [stats.observe("map", "Dispense Water", 300.0) for _ in range(10)] == [None] * 10
+
+
+def test_aborted_run_is_not_merged():
+    stats = with_baseline()
+    stats.observe("map", "Dispense Water", 300.0)
+
+    stats.end_run(merge=False)
+
+    assert stats.baseline["map"].count == 20 and stats.runs == 1
+
+
+def test_baseline_round_trip(tmp_path):
+    stats = with_baseline()
+    path = str(tmp_path / "signal_stats.json")
+
+    stats.save(path)
+    loaded = SignalStats.load(path)
+
+    assert loaded.runs == 1
+    assert {k: h.to_dict() for k, h in loaded.baseline.items()} == {k: h.to_dict() for k, h in stats.baseline.items()}
+    assert SignalStats.load(str(tmp_path / "missing.json")).baseline == {}
+
+
+def test_automation_studio_warns_on_drift(tmp_path, capsys):
+    automation_studio = AS10(str(tmp_path), True)
+    automation_studio.signal_stats = with_baseline()
+    start = datetime(2025, 8, 14, 20, 0, 0)
+
+    for n in range(DRIFT_STREAK):
+        automation_studio.transitions = [(n + 1, 10, "Dispense Water", start)]
+        automation_studio.observe_map(start + timedelta(seconds=30))
+
+    assert "CAUTION: map 3 takes longer than in earlier runs, 3 intervals in a row" in capsys.readouterr().out
+
+
+def test_automation_studio_warns_on_signal_drift(tmp_path, capsys):
+    automation_studio = AS10(str(tmp_path), True)
+    automation_studio.signal_stats = with_baseline("signal", None)
+    automation_studio.exp_status = lambda opt=0: 0  # no AS to ask for the map
+
+    for _ in range(DRIFT_STREAK):
+        automation_studio.signal_last = datetime.now() - timedelta(seconds=30)
+        automation_studio.signal_action()
+
+    assert "CAUTION: pause-to-pause intervals drift, 3 intervals in a row" in capsys.readouterr().out
@@ -0,0 +1,54 @@
+import pytest
+
+from big_kahuna_interface.simulator import AutomationStudioSimulator
+
+
+def stop_run(node, protocol_file, fault):
+    simulator = node.automation_studio.simulator
+    simulator.fault = fault
+    result = node.run_protocol(protocol_file)
+    assert result.status == "failed" and result.errors[0].message == "run %s" % fault
+    return result
+
+
+@pytest.mark.parametrize("fault", ["notips", "aborted"])
+def test_stopped_run_is_checkpointed(node, protocol_file, fault):
+    result = stop_run(node, protocol_file, fault)
+
+    checkpoint = result.json_result["checkpoint"]
+    assert 1 <= checkpoint["reached_map"] < checkpoint["total_maps"]
+    assert "run_id" not in result.json_result
+
+
+@pytest.mark.parametrize("fault", ["notips", "aborted"])
+def test_resume_runs_the_rest(node, protocol_file, fault):
+    stopped = stop_run(node, protocol_file, fault)
+    reached = stopped.json_result["checkpoint"]["reached_map"]
+    total = stopped.json_result["checkpoint"]["total_maps"]
+    if fault == "notips":
+        node.automation_studio.simulator.set_input("Abort")  # the operator ends the run left at the prompt
+
+    result = node.resume_protocol(stopped.files.model_dump()["checkpoint"])
+
+    assert result.status == "succeeded"
+    continuation = result.json_result["continuation"]
+    assert continuation["first_map"] == reached
+    assert continuation["skipped_maps"] == reached - 1
+    assert result.json_result["compile"]["maps"] <= total - reached + 1 + continuation["split_maps"] + continuation["restored_stirs"]
+    assert isinstance(result.json_result["run_id"], int)
+
+
+def test_arm_error_is_repeated(node, protocol_file):
+    simulator = node.automation_studio.simulator
+    simulator.fault = "error"
+
+    result = node.run_protocol(protocol_file)
+
+    assert result.status == "succeeded"
+    assert simulator.faulted and simulator.calls["SetInput"] == 1
+    assert [hold[0] for hold in node.automation_studio.holds] == [node.automation_studio.paused]
+
+
+def test_unknown_fault(tmp_path, recorded_log):
+    with pytest.raises(ValueError):
+        AutomationStudioSimulator(recorded_log, tmp_path, fault="fire")
@@ -0,0 +1,54 @@
+import json
+
+from utils.status_record import StatusRecorder
+
+
+def read_records(recorder):
+    records = []
+    for path in recorder.files:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_records_survive_rotation(tmp_path):
+    recorder = StatusRecorder(str(tmp_path), "status", rotate_bytes=300)
+    for n in range(40):
+        recorder.record("map", map=n)
+    recorder.close()
+
+    assert len(recorder.files) > 1
+    assert recorder.files[1].endswith("status.1.jsonl")
+    assert [r["map"] for r in read_records(recorder)] == list(range(40))
+    assert recorder.errors == 0
+
+
+def test_close_writes_everything_queued(tmp_path):
+    recorder = StatusRecorder(str(tmp_path), "status", flush_s=60)  # no timed flush before close
+    for n in range(1000):
+        recorder.record("status", n=n)
+    recorder.close()
+
+    records = read_records(recorder)
+    assert [r["n"] for r in records] == list(range(1000))
+    assert all(r["kind"] == "status" and isinstance(r["t"], int) for r in records)
+
+
+def test_flush_waits_for_the_disk(tmp_path):
+    recorder = StatusRecorder(str(tmp_path), "status", flush_s=60)
+    recorder.record("state", state="started")
+
+    assert recorder.flush()
+    assert [r["state"] for r in read_records(recorder)] == ["started"]
+    recorder.close()
+
+
+def test_records_after_close_are_dropped(tmp_path):
+    recorder = StatusRecorder(str(tmp_path), "status")
+    recorder.record("state", state="finished")
+    recorder.close()
+    recorder.record("state", state="late")
+
+    assert recorder.flush()
+    assert [r["state"] for r in read_records(recorder)] == ["finished"]
+    recorder.close()  # closing twice is harmless
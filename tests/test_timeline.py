@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.log_parsing import LiquidStepRecord
+from utils.timeline import build_timeline, datetime_ms
+
+START = datetime(2025, 8, 14, 20, 0, 0)
+MAP_ACTIONS = ["dispense", "pause", "delay", "dispense"]
+
+
+def at(seconds: float) -> datetime:
+    return START + timedelta(seconds=seconds)
+
+
+def dispense(seconds: float, volume: float, location: str = "Deck 12-13 Heat-Stir 1") -> LiquidStepRecord:
+    return LiquidStepRecord("dispense", location, "A", 1, volume, datetime_ms(at(seconds)))
+
+
+# transitions as AS10 records them: (map, total maps, description, time the map was reached)
+TRANSITIONS = [
+    (1, 4, "Dispense Water", at(0)),
+    (2, 4, "Pause", at(30)),
+    (3, 4, "Delay 1 min", at(90)),
+    (4, 4, "Dispense Water", at(150)),
+]
+HOLDS = [("Paused", "Check the plate", at(30), at(80))]
+STEPS = [
+    LiquidStepRecord("aspirate", "Deck 10-11 Position 2", "A", 1, 200.0, datetime_ms(at(2))),
+    dispense(10, 100.0),
+    dispense(20, 100.0),
+    dispense(25, 0.0, "Drain"),  # washes are not plate volume
+    dispense(160, 50.0),
+    dispense(170, 50.0),
+]
+
+
+def test_build_timeline():
+    timeline = build_timeline(7, TRANSITIONS, HOLDS, STEPS, MAP_ACTIONS, at(0), at(180))
+
+    assert [(m.map, m.action_type, m.duration_s, m.volume) for m in timeline.maps] == [
+        (1, "dispense", 30.0, 200.0),
+        (2, "pause", 60.0, 0.0),
+        (3, "delay", 60.0, 0.0),
+        (4, "dispense", 30.0, 100.0),
+    ]
+    assert timeline.time_per_action_type_s == {"dispense": 60.0, "pause": 60.0, "delay": 60.0}
+    assert (timeline.duration_s, timeline.total_maps, timeline.idle_s) == (180.0, 4, 50.0)
+    assert timeline.holds[0].title == "Check the plate"
+    assert timeline.volume == 300.0
+    assert timeline.volume_per_min == pytest.approx(100.0)
+    assert timeline.maps_per_hour == pytest.approx(80.0)
+
+
+def test_build_timeline_of_an_aborted_run():
+    # aborted 40 s into map 2, the last map ends with the run and later maps never show up
+    timeline = build_timeline(7, TRANSITIONS[:2], [], STEPS[:4], MAP_ACTIONS, at(0), at(70))
+
+    assert [(m.map, m.end, m.duration_s) for m in timeline.maps] == [(1, at(30), 30.0), (2, at(70), 40.0)]
+    assert timeline.total_maps == 4
+    assert timeline.volume == 200.0
+    assert timeline.maps_per_hour == pytest.approx(2 / (70 / 3600))
+
+
+def test_build_timeline_without_run_times():
+    # start and end fall back to the first transition and the last plate dispense
+    timeline = build_timeline(7, TRANSITIONS[:1], [], STEPS[:3], MAP_ACTIONS)
+
+    assert (timeline.start, timeline.end, timeline.duration_s) == (at(0), at(20), 20.0)
+    assert timeline.maps[0].volume == 200.0
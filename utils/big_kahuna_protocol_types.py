@@ -6,6 +6,18 @@ from pydantic import Field
 from pydantic.types import Discriminator, Tag
 from typing import Annotated, Union, Optional
 from enum import Enum
+from utils.well_codec import well_label, well_position
+
+
+PARAMETER_TYPES = (
+    "Temperature",
+    "Time",
+    "Rate",
+    "Number",
+    "Text",
+    "Stir Rate",
+    "Temperature Rate",
+)  # parameter types LS accepts
 
 
 class BigKahunaTags(str, Enum):
@@ -233,6 +245,136 @@ class BigKahunaStir(BigKahunaAction):
         title="Code",
         description="The rate for the stir"
         )
+
+
+def range_wells(range_str: str) -> list[str]:
+    """Wells of a rectangular range such as "A1:F15", row by row as LS fills its maps"""
+    cells = [well_position(cell) for cell in range_str.split(":")]
+    rows = [cell[0] for cell in cells]
+    columns = [cell[1] for cell in cells]
+    return [well_label(row, column)
+            for row in range(min(rows), max(rows) + 1)
+            for column in range(min(columns), max(columns) + 1)]
+
+
+class BigKahunaRangeVolumes:
+    """volume handling shared by the range actions"""
+
+    def well_volumes(self, count: int) -> list[float]:
+        if (self.volume is None) == (self.volumes is None):
+            raise ValueError("%s: give either volume or volumes" % self.action_type)
+        if self.volumes is None:
+            return [self.volume] * count
+        if len(self.volumes) != count:
+            raise ValueError("%s: %d volumes for %d wells" % (self.action_type, len(self.volumes), count))
+        return list(self.volumes)
+
+    def map_volume(self) -> float:  # nominal volume of the LS map
+        return self.volume if self.volume is not None else max(self.volumes)
+
+
+class BigKahunaDispenseRange(BigKahunaRangeVolumes, BigKahunaAction):
+    action_type: Literal["dispense_range"] = Field(
+        title="Action Type",
+        description="The type of the action",
+        default="dispense_range"
+        )
+    source_chemical: str = Field(
+        title="Source Chemical",
+        description="The source chemical to dispense"
+        )
+    target_plate: str = Field(
+        title="Target Plate",
+        description="The target plate for the dispense"
+        )
+    target_range: str = Field(
+        title="Target Range",
+        description="The rectangular well range to dispense into, e.g. A1:F15"
+        )
+    volume: Optional[float] = Field(
+        title="Target Volume",
+        description="The volume to dispense into every well",
+        default=None
+        )
+    volumes: Optional[list[float]] = Field(
+        title="Target Volumes",
+        description="The volume for each well of the range, row by row",
+        default=None
+        )
+    tags: list[BigKahunaTags] = Field(
+        title="Tag Code",
+        description="The Big Kahuna Specific Tags for the dispense",
+        default=[]
+        )
+    dispense_timestamps: Optional[list[Optional[str]]] = Field(
+        title="Dispense Timestamps",
+        description="The dispense timestamp of each well of the range, row by row",
+        default=None
+        )
+
+    def expand(self) -> list[BigKahunaDispense]:  # the equivalent single well dispenses
+        wells = range_wells(self.target_range)
+        return [BigKahunaDispense(source_chemical=self.source_chemical, target_plate=self.target_plate, target_well=well, volume=volume, tags=self.tags)
+                for well, volume in zip(wells, self.well_volumes(len(wells)))]
+
+
+class BigKahunaTransferRange(BigKahunaRangeVolumes, BigKahunaAction):
+    action_type: Literal["transfer_range"] = Field(
+        title="Action Type",
+        description="The type of the action",
+        default="transfer_range"
+        )
+    source_plate: str  = Field(
+        title="Source Plate",
+        description="The source plate for the transfer"
+        )
+    target_plate: str  = Field(
+        title="Target Plate",
+        description="The target plate for the transfer"
+        )
+    source_range: str = Field(
+        title="Source Range",
+        description="The rectangular well range to transfer from, e.g. A1:D2"
+        )
+    target_range: str = Field(
+        title="Target Range",
+        description="The well range to transfer to, the same shape as the source range"
+        )
+    volume: Optional[float] = Field(
+        title="Transfer Volume",
+        description="The volume to transfer for every well",
+        default=None
+        )
+    volumes: Optional[list[float]] = Field(
+        title="Transfer Volumes",
+        description="The volume for each well of the range, row by row",
+        default=None
+        )
+    tags: list[BigKahunaTags] = Field(
+        title="Tag Code",
+        description="The Big Kahuna Specific Tags for the transfer",
+        default=[]
+        )
+    dispense_timestamps: Optional[list[Optional[str]]] = Field(
+        title="Dispense Timestamps",
+        description="The dispense timestamp of each well of the range, row by row",
+        default=None
+        )
+
+    def expand(self) -> list[BigKahunaTransfer]:  # the equivalent single well transfers
+        sources = range_wells(self.source_range)
+        targets = range_wells(self.target_range)
+        if len(sources) != len(targets):
+            raise ValueError("transfer_range: %s and %s differ in size" % (self.source_range, self.target_range))
+        return [BigKahunaTransfer(source_plate=self.source_plate, target_plate=self.target_plate, source_well=source, target_well=target, volume=volume, tags=self.tags)
+                for source, target, volume in zip(sources, targets, self.well_volumes(len(sources)))]
+
+
+RANGE_TYPES = ("dispense_range", "transfer_range")  # actions covering a well range in one map
+LIQUID_TYPES = ("transfer", "dispense")  # liquid handling of one well
+PLATE_TYPES = ("delay", "stir")  # processing maps that hold a whole plate
+PROMPT_TYPES = ("pause", "action")  # operator prompts and actions of unknown effect, never moved across
+
 BigKahunaActions = Annotated[
     Union[
         Annotated[BigKahunaAction, Tag("action")],
@@ -241,6 +383,8 @@ BigKahunaActions = Annotated[
         Annotated[BigKahunaDispense, Tag("dispense")],
         Annotated[BigKahunaPause, Tag("pause")],
         Annotated[BigKahunaStir, Tag("stir")],
+        Annotated[BigKahunaDispenseRange, Tag("dispense_range")],
+        Annotated[BigKahunaTransferRange, Tag("transfer_range")],
     ],
     Discriminator("action_type"),
 ]
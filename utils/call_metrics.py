@@ -0,0 +1,162 @@
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Optional
+
+# bucket upper bounds in seconds, four per decade from 1 us to 1000 s
+BUCKET_BOUNDS = [10 ** (k / 4) for k in range(-24, 13)]
+BUCKET_LABELS = ["%.3g" % b for b in BUCKET_BOUNDS] + ["inf"]  # bucket keys of to_dict
+
+
+class LatencyHistogram:
+    """Fixed-size latency histogram with log-spaced buckets"""
+
+    __slots__ = ("counts", "count", "errors", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)  # last bucket holds overflow
+        self.count = 0
+        self.errors = 0  # calls that raised, also counted in count
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> Optional[float]:  # upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else None,
+            "min_s": self.min,
+            "p50_s": self.quantile(0.5),
+            "p95_s": self.quantile(0.95),
+            "p99_s": self.quantile(0.99),
+            "max_s": self.max,
+        }
+
+    def to_dict(self) -> dict[str, Any]:  # summary plus the non-empty buckets
+        d = self.summary()
+        d["buckets"] = {BUCKET_LABELS[i]: n for i, n in enumerate(self.counts) if n}
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict[str, Any]) -> "LatencyHistogram":  # inverse of to_dict
+        histogram = cls()
+        for label, n in d.get("buckets", {}).items():
+            histogram.counts[BUCKET_LABELS.index(label)] = n
+        histogram.count = d.get("count", 0)
+        histogram.errors = d.get("errors", 0)
+        histogram.total = d.get("total_s", 0.0)
+        histogram.min = d.get("min_s")
+        histogram.max = d.get("max_s")
+        return histogram
+
+    def merge(self, other: "LatencyHistogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+
+class CallMetrics:
+    """Counts and latency histograms for instrumented call sites"""
+
+    def __init__(self):
+        self.histograms: dict[str, LatencyHistogram] = {}
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.observe(seconds, error)
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe(name, time.perf_counter() - start, error)
+
+    def wrap(self, target: Any, prefix: str, depth: int = 1) -> "InstrumentedProxy":
+        return InstrumentedProxy(target, self, prefix, depth)
+
+    def reset(self):
+        self.histograms.clear()
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump({name: h.to_dict() for name, h in sorted(self.histograms.items())}, f, indent=4)
+
+
+class InstrumentedProxy:
+    """Times every method called through it, nested attributes (SiLA features) are proxied `depth` levels deep"""
+
+    def __init__(self, target: Any, metrics: CallMetrics, prefix: str, depth: int = 1):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_metrics", metrics)
+        object.__setattr__(self, "_prefix", prefix)
+        object.__setattr__(self, "_depth", depth)
+        object.__setattr__(self, "_cache", {})
+
+    def __getattr__(self, name: str):
+        cache = self._cache
+        if name in cache:
+            return cache[name]
+        attr = getattr(self._target, name)
+        label = "%s.%s" % (self._prefix, name)
+        if callable(attr) and not isinstance(attr, type):
+            metrics = self._metrics
+
+            def timed_call(*args, **kwargs):
+                start = time.perf_counter()
+                error = True
+                try:
+                    result = attr(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    metrics.observe(label, time.perf_counter() - start, error)
+
+            cache[name] = timed_call
+            return timed_call
+        if self._depth > 0 and not isinstance(attr, (str, int, float, bool, type(None))):
+            proxy = InstrumentedProxy(attr, self._metrics, label, self._depth - 1)
+            cache[name] = proxy
+            return proxy
+        return attr
+
+    def __setattr__(self, name: str, value: Any):
+        self._cache.pop(name, None)
+        setattr(self._target, name, value)
@@ -0,0 +1,137 @@
+import math
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import RANGE_TYPES, BigKahunaTags
+from utils.protocol_compiler import CompiledDesign, LsMap, lower_action
+from utils.timeline import WASH_LOCATIONS, datetime_ms, step_ms
+from utils.well_codec import row_number, well_label
+
+STOPPED_RUNS = ("aborted", "notips")  # AS10.run results a design can be resumed from
+
+
+class RunCheckpoint(BaseModel):
+    """How far a stopped run got through its compiled design"""
+    design_key: str  # key of the compiled design that was running
+    design_id: int
+    status: str  # AS10.run result
+    total_maps: int
+    reached_map: int  # last map AS reported, from 1, 0 if the run stopped before map 1
+    done_wells: list[tuple[str, str]] = []  # (plate, well) of the reached map dispensed before the stop
+    elapsed_s: float = 0.0  # time spent in the reached map
+    created: datetime
+
+
+class Continuation(BaseModel):
+    first_map: int  # first map of the stopped design still to run, from 1
+    skipped_maps: int  # maps of the stopped design not run again
+    split_maps: int  # partly done maps re-emitted well by well
+    restored_stirs: int  # stir maps re-emitted ahead of the remaining maps
+    remaining_delay_s: Optional[float] = None  # what was left of a delay the run stopped in
+
+
+def take_checkpoint(design: CompiledDesign, design_id: int, status: str, transitions: list, steps: list,
+                    finished: Optional[datetime] = None) -> RunCheckpoint:
+    """Checkpoint from the AS10 map transitions and the LiquidSteps of a stopped run
+
+    Maps before the last one AS reported are done. Within that map a well is
+    done once a dispense into it was logged after the map started.
+    """
+    checkpoint = RunCheckpoint(design_key=design.key, design_id=design_id, status=status, total_maps=len(design.maps),
+                               reached_map=0, created=datetime.now())
+    if not transitions:
+        return checkpoint
+    number, total, description, start = max(transitions, key=lambda t: t[0])
+    checkpoint.reached_map = number
+    checkpoint.elapsed_s = max(0.0, ((finished or datetime.now()) - start).total_seconds())
+    positions = {plate.deck_position: key for key, plate in design.protocol.plates.items()}
+    start_ms = datetime_ms(start)
+    done = []
+    for step in steps:
+        if step.type != "dispense" or step.location in WASH_LOCATIONS or step.row is None or step.column is None:
+            continue
+        if step.location in positions and step_ms(step) >= start_ms:
+            done.append((positions[step.location], well_label(row_number(step.row), int(step.column))))
+    checkpoint.done_wells = list(dict.fromkeys(done))
+    return checkpoint
+
+
+def map_singles(ls_map: LsMap, design: CompiledDesign) -> list[tuple[int, object]]:  # (action index, single-well action) pairs
+    singles = []
+    for i in ls_map.actions:
+        action = design.protocol.actions[i]
+        singles.extend((i, single) for single in (action.expand() if action.action_type in RANGE_TYPES else [action]))
+    return singles
+
+
+def split_map(ls_map: LsMap, design: CompiledDesign, done: set) -> list[LsMap]:
+    """Maps for the wells of a partly done liquid map that were not dispensed yet"""
+    left = [(i, single) for i, single in map_singles(ls_map, design) if (single.target_plate, single.target_well) not in done]
+    maps = [lower_action(i, single) for i, single in left]
+    for m in maps:  # single wells, and they may be different chemicals, wash between them
+        m.tags = [tag for tag in m.tags if tag not in (BigKahunaTags.SkipWash, BigKahunaTags.FourTip)]
+    if maps and BigKahunaTags.SkipWash in ls_map.tags:
+        maps[-1].tags.append(BigKahunaTags.SkipWash)
+    return maps
+
+
+def continuation_design(design: CompiledDesign, checkpoint: RunCheckpoint) -> tuple[CompiledDesign, Continuation]:
+    """Compiled design with only the maps a stopped run has not done
+
+    The map the run stopped in is kept whole if none of its wells were
+    dispensed, split into its remaining wells if some were, and dropped if all
+    were. A delay the run stopped in keeps only its remaining time. Stir rates
+    are plate state, so the last stir of every plate with work left is run
+    again first.
+    """
+    if checkpoint.design_key != design.key:
+        raise ValueError("checkpoint of design %s, not %s" % (checkpoint.design_key, design.key))
+    first = max(checkpoint.reached_map, 1)
+    remaining = []
+    skipped = first - 1
+    split = 0
+    remaining_delay = None
+    if first <= len(design.maps):
+        current = design.maps[first - 1]
+        if checkpoint.reached_map == 0:
+            remaining.append(current)
+        elif current.kind == "parameter" and current.parameter == "Delay":
+            remaining_delay = max(0.0, 60 * current.value - checkpoint.elapsed_s)
+            if remaining_delay > 0:
+                remaining.append(current.model_copy(update={"value": math.ceil(remaining_delay / 0.6) / 100}))  # LS's 0.01 min
+        elif current.kind == "parameter":
+            remaining.append(current)
+        else:
+            done = set(map(tuple, checkpoint.done_wells))
+            wells = {(single.target_plate, single.target_well) for _, single in map_singles(current, design)}
+            if not wells & done:
+                remaining.append(current)
+            elif wells - done:
+                remaining.extend(split_map(current, design, done))
+                split = 1
+        if not remaining:
+            skipped += 1
+        remaining.extend(design.maps[first:])
+
+    stirs = {}
+    for m in design.maps[:first - 1]:
+        if m.parameter == "StirRate":
+            stirs[m.target_plate] = m
+    next_map = {}
+    for m in remaining:
+        next_map.setdefault(m.target_plate, m)
+    restored = [m for plate, m in stirs.items() if plate in next_map and next_map[plate].parameter != "StirRate"]
+    key = "%s-from%d" % (design.key, first)
+    continued = design.model_copy(update={"key": key, "maps": restored + remaining, "cached": False, "timings_s": {}}, deep=True)
+    continued.reports = dict(design.reports)
+    report = Continuation(
+        first_map=first,
+        skipped_maps=skipped,
+        split_maps=split,
+        restored_stirs=len(restored),
+        remaining_delay_s=remaining_delay,
+    )
+    continued.reports["continuation"] = report.model_dump()
+    return continued, report
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.protocol_compiler import CompiledDesign, LsMap, emit_map
+
+MAP_FIELDS = {"actions"}  # LsMap fields that do not reach LS
+
+
+class DesignRecord(BaseModel):
+    """What was built into an LS design ID, so that it can be patched later"""
+    design_id: int
+    key: str  # compiled design key
+    setup: str  # hash of everything LS gets before the maps
+    maps: list[LsMap]
+    prompts: str  # AS files written for the design
+    chem: str
+    tips: Optional[str] = None
+    patches: int = 0  # times the design was patched in place
+
+
+class DesignPatch(BaseModel):
+    design_id: int
+    edits: list[int] = []  # maps to edit, from 1
+    unchanged: int = 0
+    rebuild: Optional[str] = None  # why the design has to be rebuilt, None if it can be patched
+
+
+def design_setup(design: CompiledDesign) -> str:
+    """Hash of the libraries, chemicals, parameters and source plates of a design
+
+    These are written once when a design is created and into the AS files, so
+    a design can only be patched while they stay the same.
+    """
+    protocol = design.protocol
+    setup = {
+        "name": protocol.name,
+        "units": protocol.units,
+        "parameters": [p.model_dump(mode="json") for p in protocol.parameters],
+        "plates": {key: plate.model_dump(mode="json") for key, plate in protocol.plates.items()},
+        "chemicals": [c.model_dump(mode="json") for c in protocol.chemicals],
+        "sources": sorted({m.source_plate for m in design.maps if m.kind == "array"}),
+    }
+    return hashlib.sha256(json.dumps(setup, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def record_path(directory: str, design_id: int) -> str:
+    return os.path.join(directory, "design_%d.json" % design_id)
+
+
+def load_record(directory: str, design_id: int) -> Optional[DesignRecord]:
+    path = record_path(directory, design_id)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return DesignRecord.model_validate_json(f.read())
+
+
+def save_record(directory: str, record: DesignRecord):
+    os.makedirs(directory, exist_ok=True)
+    with open(record_path(directory, record.design_id), "w") as f:
+        f.write(record.model_dump_json())
+
+
+def diff_design(record: Optional[DesignRecord], design: CompiledDesign, design_id: int) -> DesignPatch:
+    """Maps of a recorded LS design that differ from a newly compiled one
+
+    LS can edit source and array maps in place, but cannot insert, delete or
+    edit parameter maps, so anything else needs a new design.
+    """
+    patch = DesignPatch(design_id=design_id)
+    if record is None:
+        patch.rebuild = "design %d was not built by this node" % design_id
+    elif not all(os.path.exists(path) for path in (record.prompts, record.chem, record.tips) if path):
+        patch.rebuild = "AS files of design %d are missing" % design_id
+    elif record.setup != design_setup(design):
+        patch.rebuild = "libraries, chemicals, parameters or source plates changed"
+    elif len(record.maps) != len(design.maps):
+        patch.rebuild = "%d maps instead of %d" % (len(design.maps), len(record.maps))
+    else:
+        for n, (old, new) in enumerate(zip(record.maps, design.maps), 1):
+            if old.model_dump(exclude=MAP_FIELDS) == new.model_dump(exclude=MAP_FIELDS):
+                patch.unchanged += 1
+            elif old.kind != new.kind or new.kind == "parameter":
+                patch.rebuild = "map %d (%s -> %s) cannot be edited" % (n, old.action_type, new.action_type)
+                break
+            else:
+                patch.edits.append(n)
+    if patch.rebuild:
+        patch.edits = []
+    return patch
+
+
+def apply_patch(patch: DesignPatch, design: CompiledDesign, library_studio):
+    """Edit the changed maps of an LS design loaded with from_db and save it over the same ID"""
+    library_studio.sources = sorted({m.source_plate for m in design.maps if m.kind == "array"})  # already in the design
+    for n in patch.edits:
+        emit_map(design.maps[n - 1], library_studio, design.protocol, layer=n)
+    library_studio.map_count = len(design.maps) + 1
+    status = library_studio.to_db(False)
+    if status < 0:
+        library_studio.HandleStatus(status)
@@ -0,0 +1,269 @@
+import json
+import math
+import os
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import RANGE_TYPES, BigKahunaProtocol, BigKahunaTags
+from utils.log_parsing import LiquidSteps, read_logs
+from utils.timeline import WASH_LOCATIONS, RunTimeline, stamp_ms, step_ms
+
+# duration guesses in seconds until the model has seen a run
+DEFAULT_DURATIONS = {
+    "transfer": 45.0,
+    "dispense": 35.0,
+    "wash": 35.0,
+    "stir": 5.0,
+    "pause": 60.0,
+    "delay_overhead": 5.0,
+}
+DEFAULT_WASHES_PER_ACTION = 2.0
+
+
+def volume_bucket(volume: float) -> int:  # nearest power of two, keeps keys few and stable
+    if volume <= 0:
+        return 0
+    return 2 ** round(math.log2(volume))
+
+
+class ProtocolEstimate(BaseModel):
+    total_s: float
+    per_map_s: list[float]
+    per_action_type_s: dict[str, float]
+
+
+class DurationModel:
+    """Running mean durations of transfers, dispenses, washes and processing maps learned from past runs"""
+
+    def __init__(self):
+        self.stats: dict[str, list[float]] = {}  # key -> [count, mean seconds]
+        self.washes = 0  # wash cycles seen
+        self.segments = 0  # liquid handling steps seen
+
+    # learning
+
+    def observe(self, key: str, seconds: float):
+        count, mean = self.stats.get(key, (0, 0.0))
+        count += 1
+        self.stats[key] = [count, mean + (seconds - mean) / count]
+
+    def observe_levels(self, keys: list[str], seconds: float):  # most specific key first
+        for key in keys:
+            self.observe(key, seconds)
+
+    def learn_steps(self, steps: LiquidSteps):
+        """Split the steps at the wash cycles and learn each wash and liquid handling step"""
+        if not steps:
+            return
+        previous = step_ms(steps[0])
+        wash_start = previous
+        segment = []
+        for step in steps:
+            t = step_ms(step)
+            if step.location in WASH_LOCATIONS:
+                if segment:
+                    self.learn_segment(segment, previous)
+                    wash_start = step_ms(segment[-1])
+                    segment = []
+                if step.location == WASH_LOCATIONS[-1]:
+                    self.observe("wash", (t - wash_start) / 1000)
+                    self.washes += 1
+                    previous = wash_start = t
+            else:
+                segment.append(step)
+        if segment:
+            self.learn_segment(segment, previous)
+
+    def learn_segment(self, segment: list, start: int):  # start in ms, as step_ms
+        seconds = (step_ms(segment[-1]) - start) / 1000
+        self.segments += 1
+        aspirate = next((s for s in segment if s.type == "aspirate" and s.volume > 0), None)
+        if aspirate is not None:
+            target = next((s for s in segment if s.type == "dispense" and s.location != aspirate.location), None)
+            destination = target.location if target is not None else aspirate.location
+            keys = transfer_keys(aspirate.location, destination, aspirate.volume)
+        else:
+            dispenses = [s for s in segment if s.type == "dispense"]
+            volume = max((s.volume for s in dispenses), default=0.0)
+            location = dispenses[0].location if dispenses else segment[0].location
+            keys = dispense_keys(location, volume)
+        self.observe_levels(keys, seconds)
+
+    def learn_stamped_protocol(self, protocol: BigKahunaProtocol):
+        """Learn whole-action durations, washes included, from a protocol stamped by add_timestamps"""
+        previous = None
+        waited = 0.0  # delays run since the last stamped action
+        for action in protocol.actions:
+            if action.action_type == "delay":
+                waited += 60 * action.delay
+            stamp = getattr(action, "dispense_timestamp", None)
+            if stamp is None:
+                continue
+            t = stamp_ms(stamp)
+            if previous is not None:
+                self.observe_levels(action_keys(action, protocol), max((t - previous) / 1000 - waited, 0.0))
+            previous = t
+            waited = 0.0
+
+    def learn_timeline(self, timeline: RunTimeline, protocol: Optional[BigKahunaProtocol] = None):
+        """Learn processing map and prompt durations from a run timeline"""
+        delays = [a.delay for a in protocol.actions if a.action_type == "delay"] if protocol else []
+        for interval in timeline.maps:
+            if interval.action_type == "stir":
+                self.observe("stir", interval.duration_s)
+            elif interval.action_type == "delay" and delays:
+                self.observe("delay_overhead", max(interval.duration_s - 60 * delays.pop(0), 0.0))
+        for hold in timeline.holds:
+            self.observe("pause", hold.duration_s)
+
+    def learn_action_logs(self, path: str):  # an action_logs.json written by run_protocol
+        with open(path) as f:
+            self.learn_steps(LiquidSteps.from_steps(json.load(f)))
+
+    def learn_log(self, path: str):  # a raw ASMain log
+        self.learn_steps(read_logs(path))
+
+    # prediction
+
+    def mean(self, keys: list[str], default: str) -> float:
+        for key in keys:
+            if key in self.stats:
+                return self.stats[key][1]
+        return DEFAULT_DURATIONS[default]
+
+    def washes_per_action(self) -> float:
+        return self.washes / self.segments if self.segments else DEFAULT_WASHES_PER_ACTION
+
+    def action_seconds(self, action, protocol: BigKahunaProtocol) -> float:
+        action_type = action.action_type
+        if action_type in RANGE_TYPES:  # one map, but every well is still pipetted and washed for
+            return sum(self.action_seconds(single, protocol) for single in action.expand())
+        if action_type in ("transfer", "dispense"):
+            if BigKahunaTags.SkipMap in action.tags:
+                return 0.0
+            for key in action_keys(action, protocol):  # seen as a whole action before
+                if key in self.stats:
+                    return self.stats[key][1]
+            washes = self.washes_per_action()
+            if BigKahunaTags.SkipWash in action.tags:
+                washes = max(washes - 1, 0.0)
+            wash = washes * self.mean(["wash"], "wash")
+            if action_type == "transfer":
+                keys = transfer_keys(protocol.plates[action.source_plate].deck_position,
+                                     protocol.plates[action.target_plate].deck_position, action.volume)
+                return self.mean(keys, "transfer") + wash
+            target = protocol.plates[action.target_plate].deck_position
+            source = chemical_position(protocol, action.source_chemical)
+            if source is not None:  # chemicals held in a source plate are pipetted like a transfer
+                return self.mean(transfer_keys(source, target, action.volume), "transfer") + wash
+            return self.mean(dispense_keys(target, action.volume), "dispense") + wash
+        if action_type == "delay":
+            return 60 * action.delay + self.mean(["delay_overhead"], "delay_overhead")
+        if action_type in ("stir", "pause"):
+            return self.mean([action_type], action_type)
+        return 0.0
+
+    def estimate(self, protocol: BigKahunaProtocol) -> ProtocolEstimate:
+        per_map = []
+        per_type = {}
+        for action in protocol.actions:
+            seconds = self.action_seconds(action, protocol)
+            per_map.append(seconds)
+            per_type[action.action_type] = per_type.get(action.action_type, 0.0) + seconds
+        return ProtocolEstimate(total_s=sum(per_map), per_map_s=per_map, per_action_type_s=per_type)
+
+    # persistence
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"stats": self.stats, "washes": self.washes, "segments": self.segments}, f, indent=4)
+
+    @classmethod
+    def load(cls, path: str) -> "DurationModel":
+        model = cls()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            model.stats = data.get("stats", {})
+            model.washes = data.get("washes", 0)
+            model.segments = data.get("segments", 0)
+        return model
+
+
+def chemical_position(protocol: BigKahunaProtocol, name: str) -> Optional[str]:  # deck position of a plate-held chemical
+    for chemical in protocol.chemicals:
+        if chemical.name == name and chemical.source_plate is not None:
+            return protocol.plates[chemical.source_plate].deck_position
+    return None
+
+
+def action_keys(action, protocol: BigKahunaProtocol) -> list[str]:
+    tags = ",".join(sorted(tag.value for tag in action.tags))
+    target = protocol.plates[action.target_plate].deck_position
+    if action.action_type == "transfer":
+        source = protocol.plates[action.source_plate].deck_position
+    else:
+        source = chemical_position(protocol, action.source_chemical) or action.source_chemical
+    return [
+        "action|%s|%s|%s|%d|%s" % (action.action_type, source, target, volume_bucket(action.volume), tags),
+        "action|%s|%s|%s|%s" % (action.action_type, source, target, tags),
+        "action|%s|%s" % (action.action_type, tags),
+    ]
+
+
+def transfer_keys(source: str, target: str, volume: float) -> list[str]:
+    return ["transfer|%s|%s|%d" % (source, target, volume_bucket(volume)), "transfer|%s|%s" % (source, target), "transfer"]
+
+
+def dispense_keys(location: str, volume: float) -> list[str]:
+    return ["dispense|%s|%d" % (location, volume_bucket(volume)), "dispense|%s" % location, "dispense"]
+
+
+class LiveEta:
+    """Remaining time of a running design, rescaled by how the finished maps compared to their prediction"""
+
+    def __init__(self, per_map_s: list[float], start: Optional[datetime] = None):
+        self.per_map_s = per_map_s
+        self.start = start or datetime.now()
+        self.map = 0
+        self.remaining_s = sum(per_map_s)
+        self.finish = None
+        self.scale = 1.0
+
+    def update(self, current_map: int, now: Optional[datetime] = None):  # current_map is running, the ones before it are done
+        now = now or datetime.now()
+        self.map = current_map
+        predicted_done = sum(self.per_map_s[:current_map - 1])
+        elapsed = (now - self.start).total_seconds()
+        if predicted_done > 0:
+            self.scale = min(max(elapsed / predicted_done, 0.25), 4.0)
+        self.remaining_s = self.scale * sum(self.per_map_s[current_map - 1:])
+        self.finish = datetime.fromtimestamp(now.timestamp() + self.remaining_s)
+
+    def summary(self) -> dict:
+        return {
+            "map": self.map,
+            "remaining_s": self.remaining_s,
+            "scale": self.scale,
+            "finish": self.finish.isoformat() if self.finish else None,
+        }
+
+
+if __name__ == "__main__":  # seed a model from past runs: python -m utils.eta model.json <action_logs.json | protocol.json | ASMain_*.log>...
+    import sys
+
+    model = DurationModel.load(sys.argv[1])
+    for path in sys.argv[2:]:
+        if path.endswith(".json"):
+            with open(path) as f:
+                data = json.load(f)
+            if isinstance(data, dict):  # stamped protocol
+                model.learn_stamped_protocol(BigKahunaProtocol.model_validate(data))
+            else:
+                model.learn_steps(LiquidSteps.from_steps(data))
+        else:
+            model.learn_log(path)
+    model.save(sys.argv[1])
+    print("learned %d keys from %d files" % (len(model.stats), len(sys.argv) - 2))
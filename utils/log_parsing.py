@@ -1,8 +1,14 @@
-from typing import Optional
+import heapq
+import mmap
+import os
+from array import array
+from typing import NamedTuple, Optional
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel
-import string
-from utils.big_kahuna_protocol_types import BigKahunaProtocol
+from utils.big_kahuna_protocol_types import RANGE_TYPES, BigKahunaProtocol
+from utils.timeline import LOG_TIME_FORMAT, STAMP_PATTERN, ms_stamp, stamp_ms
+from utils.well_codec import parse_well, row_label, row_number
 class LiquidStep(BaseModel):
     type: str
     location: str
@@ -11,50 +17,293 @@ class LiquidStep(BaseModel):
     timestamp: str
     volume: float
 
-def read_logs(log_file: str):
-    with open(log_file) as f:
-        log_data = pd.read_csv(f, sep="\t")
-    log_data = log_data.fillna("")
-    filtered_logs = log_data[(log_data["Action"] == "Move Arm To Substrate") | ( log_data["Parameter Name"].str.contains("Output : Volume" ))]
-    current_location = None
+STEP_TYPES = ("dispense", "aspirate")  # type codes of LiquidSteps
+
+
+def parse_stamps(stamps) -> list:
+    """stamp_ms of many ASMain time stamps at once, parsed by pandas in one vectorized call
+
+    Stamps that ms_stamp would not print back unchanged, such as unpadded
+    fields or other than three decimals, are returned as they are, for
+    LiquidSteps to parse and keep.
+    """
+    stamps = list(stamps)
+    try:
+        ns = pd.to_datetime(pd.Series(stamps, dtype=object), format=LOG_TIME_FORMAT).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    except ValueError:  # an odd stamp, stamp_ms reports it or copes
+        return stamps
+    ms = ((ns + 500000) // 1000000).tolist()
+    exact = [len(stamp) == 23 and stamp[19] == "." for stamp in stamps]  # parsed, so every field is padded and there are 3 decimals
+    if all(exact):
+        return ms
+    return [m if keep else stamp for m, keep, stamp in zip(ms, exact, stamps)]
+
+
+class LiquidStepRecord(NamedTuple):  # one step of LiquidSteps, with the attributes of LiquidStep
+    type: str
+    location: Optional[str]
+    row: Optional[str]
+    column: Optional[int]
+    volume: float
+    time_ms: int
+    stamp: Optional[str] = None  # time stamp of the log, when ms_stamp would not give it back
+
+    @property
+    def timestamp(self) -> str:  # only built for output
+        return self.stamp if self.stamp is not None else ms_stamp(self.time_ms)
+
+
+class LiquidSteps:
+    """Column store of the LiquidSteps of a log
+
+    Types and locations are small integer codes, rows and columns numbers with
+    0 for none, times ms since 1970 (see stamp_ms) and volumes doubles, each in
+    its own array. A step costs about 25 bytes instead of a pydantic model.
+    The few time stamps ms_stamp would print differently are kept as written.
+    Indexing and iteration give LiquidStepRecord tuples; model() and models()
+    give LiquidStep when pydantic models are needed.
+    """
+
+    __slots__ = ("types", "location_codes", "rows", "columns", "times", "volumes", "locations", "location_index", "stamps")
+
+    def __init__(self):
+        self.types = array("b")
+        self.location_codes = array("h")  # index into locations, -1 for none
+        self.rows = array("H")
+        self.columns = array("H")
+        self.times = array("q")
+        self.volumes = array("d")
+        self.locations: list[str] = []
+        self.location_index: dict[str, int] = {}
+        self.stamps: dict[int, str] = {}  # step -> time stamp as logged, only where ms_stamp differs
+
+    def location_code(self, location: Optional[str]) -> int:
+        if location is None:
+            return -1
+        code = self.location_index.get(location)
+        if code is None:
+            code = self.location_index[location] = len(self.locations)
+            self.locations.append(location)
+        return code
+
+    def append(self, type: str, location: Optional[str], row: Optional[str], column, timestamp, volume):  # timestamp as ms or stamp
+        if not isinstance(timestamp, int):
+            if not STAMP_PATTERN.fullmatch(timestamp):
+                self.stamps[len(self.types)] = timestamp
+            timestamp = stamp_ms(timestamp)
+        self.types.append(STEP_TYPES.index(type))
+        self.location_codes.append(self.location_code(location))
+        self.rows.append(row_number(row) if row else 0)
+        self.columns.append(int(column) if column not in (None, "") else 0)
+        self.times.append(timestamp)
+        self.volumes.append(float(volume))
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def record(self, i: int) -> LiquidStepRecord:
+        location = self.location_codes[i]
+        row = self.rows[i]
+        column = self.columns[i]
+        ms = self.times[i]
+        return LiquidStepRecord(STEP_TYPES[self.types[i]], self.locations[location] if location >= 0 else None,
+                                row_label(row) if row else None, column if column else None, self.volumes[i], ms, self.stamps.get(i))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.record(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("step index out of range")
+        return self.record(i)
+
+    def __iter__(self):
+        locations = self.locations + [None]  # code -1
+        stamps = self.stamps
+        columns = zip(self.types, self.location_codes, self.rows, self.columns, self.volumes, self.times)
+        for i, (type, location, row, column, volume, ms) in enumerate(columns):
+            yield LiquidStepRecord(STEP_TYPES[type], locations[location], row_label(row) if row else None, column or None, volume, ms,
+                                   stamps.get(i) if stamps else None)
+
+    def model(self, i: int) -> LiquidStep:
+        step = self[i]
+        return LiquidStep(type=step.type, location=step.location, row=step.row, column=step.column,
+                          timestamp=step.timestamp, volume=step.volume)
+
+    def models(self) -> list[LiquidStep]:
+        return [self.model(i) for i in range(len(self))]
+
+    def to_records(self) -> list[dict]:  # the LiquidStep.model_dump() of every step, as in action_logs.json
+        return [{"type": step.type, "location": step.location, "row": step.row, "column": step.column,
+                 "timestamp": step.timestamp, "volume": step.volume} for step in self]
+
+    @classmethod
+    def from_steps(cls, steps) -> "LiquidSteps":  # from LiquidSteps, records or dicts such as action_logs.json
+        compact = cls()
+        for step in steps:
+            if isinstance(step, dict):
+                compact.append(step["type"], step["location"], step["row"], step["column"], step["timestamp"], step["volume"])
+            else:
+                compact.append(step.type, step.location, step.row, step.column, step.timestamp, step.volume)
+        return compact
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.types, self.location_codes, self.rows, self.columns, self.times, self.volumes))
+
+LOG_COLUMNS = ["Time", "Action", "Parameter Name", "Parameter Value"]  # the only ASMain columns read_logs needs
+LOG_DTYPES = {"Time": str, "Action": "category", "Parameter Name": "category", "Parameter Value": str}
+CHUNK_ROWS = 65536  # rows parsed at a time, bounds memory on multi-day logs
+MOVE_ACTION = "Move Arm To Substrate"
+DISPENSE_NAMES = ("Output : Volume Filld", "Output : Volume Dispensed")
+ASPIRATE_NAME = "Output : Volume Aspirated"
+
+
+def read_log_chunks(log_file: str, chunk_rows: int = CHUNK_ROWS):
+    """Rows of an ASMain log that read_logs uses, as (action, name, value, time) tuples
+
+    Only four columns are parsed, the repeated action and parameter names as
+    categoricals, and rows are read chunk_rows at a time, so memory does not
+    grow with the length of the log. Empty cells read as "". Times are ms
+    from parse_stamps, parsed a chunk at a time.
+    """
+    with pd.read_csv(log_file, sep="\t", usecols=LOG_COLUMNS, dtype=LOG_DTYPES, keep_default_na=False,
+                     chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            names = chunk["Parameter Name"]
+            volume_names = [name for name in names.cat.categories if "Output : Volume" in name]
+            chunk = chunk[(chunk["Action"] == MOVE_ACTION) | names.isin(volume_names)]
+            yield from zip(chunk["Action"], chunk["Parameter Name"], chunk["Parameter Value"], parse_stamps(chunk["Time"]))
+
+
+SCAN_PATTERNS = (MOVE_ACTION.encode(), b"Output : Volume")  # every row read_logs needs holds one of these
+SCAN_SAMPLE_BYTES = 1 << 20
+SCAN_SHARE = 0.5  # share of matching lines above which pandas is faster than the scan
+
+
+def pattern_lines(data, pattern: bytes, start: int):  # offsets of the lines after start holding pattern, in file order
+    p = data.find(pattern, start)
+    while p >= 0:
+        yield data.rfind(b"\n", 0, p) + 1
+        end = data.find(b"\n", p)
+        if end < 0:
+            return
+        p = data.find(pattern, end)
+
+
+def scan_log(log_file: str):
+    """Same rows as read_log_chunks, found by a byte scan of the memory-mapped log
+
+    The patterns are found with mmap.find, which skips through the bytes
+    without Python work per line, and only the lines holding one are split
+    and decoded, so this pays off when they are a small part of the log.
+    Raises ValueError for anything the scan does not handle like pandas
+    does: missing columns, quoting, ragged lines or bad UTF-8. Times are
+    parsed CHUNK_ROWS rows at a time.
+    """
+    with open(log_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("empty log")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data.find(b'"') >= 0:
+                raise ValueError("quoted fields")
+            end = data.find(b"\n")
+            if end < 0:
+                return
+            header = data[:end].rstrip(b"\r").removeprefix(b"\xef\xbb\xbf").decode().split("\t")
+            try:
+                action_i, name_i, value_i, time_i = [header.index(name) for name in ("Action", "Parameter Name", "Parameter Value", "Time")]
+            except ValueError:
+                raise ValueError("missing columns") from None
+            width = len(header)
+            previous = -1
+            rows = []
+            for start in heapq.merge(*(pattern_lines(data, pattern, end + 1) for pattern in SCAN_PATTERNS)):
+                if start == previous:  # both patterns on one line
+                    continue
+                previous = start
+                stop = data.find(b"\n", start)
+                fields = data[start:stop if stop >= 0 else len(data)].decode().rstrip("\r").split("\t")
+                if len(fields) != width:
+                    raise ValueError("line with %d fields, header has %d" % (len(fields), width))
+                action = fields[action_i]
+                name = fields[name_i]
+                if action == MOVE_ACTION or "Output : Volume" in name:  # the pattern may have matched another column
+                    rows.append((action, name, fields[value_i], fields[time_i]))
+                    if len(rows) == CHUNK_ROWS:
+                        yield from timed_rows(rows)
+                        rows = []
+            yield from timed_rows(rows)
+
+
+def timed_rows(rows: list):  # rows with their time stamps parsed by parse_stamps
+    if rows:
+        actions, names, values, times = zip(*rows)
+        yield from zip(actions, names, values, parse_stamps(times))
+
+
+def scan_pays_off(log_file: str) -> bool:  # few enough lines match, from the start of the log
+    with open(log_file, "rb") as f:
+        sample = f.read(SCAN_SAMPLE_BYTES)
+    lines = sample.count(b"\n")
+    return lines > 0 and sum(sample.count(pattern) for pattern in SCAN_PATTERNS) < SCAN_SHARE * lines
+
+
+def read_logs(log_file: str, chunk_rows: int = CHUNK_ROWS, fast: bool = True):
+    if fast and scan_pays_off(log_file):
+        try:
+            return log_steps(scan_log(log_file))
+        except ValueError:  # also UnicodeDecodeError, the pandas reader copes with these logs
+            pass
+    return log_steps(read_log_chunks(log_file, chunk_rows))
+
+
+def log_steps(rows) -> LiquidSteps:  # LiquidSteps from (action, name, value, time) rows
+    current_location = None  # arm position, carried across chunks
     current_row = None
     current_column = None
-    steps = []
-    for index, row in filtered_logs.iterrows():
-        if row["Action"] == "Move Arm To Substrate":
-            if row["Parameter Name"] == "Input : Position":
-                current_location = row["Parameter Value"]
-            if row["Parameter Name"] == "Input : Well Row":
-                if row["Parameter Value"] is not "":
-                    current_row = string.ascii_uppercase[int(row["Parameter Value"])  - 1]
-                else:
-                    current_row = None
-            if row["Parameter Name"] == "Input : Well Column":
-                if row["Parameter Value"] is not "":
-                    current_column = row["Parameter Value"]
-                else:
-                    current_column = None
-        elif row["Parameter Name"] == "Output : Volume Filld" or row["Parameter Name"] == "Output : Volume Dispensed":
-            steps.append(LiquidStep(type="dispense", location=current_location, row=current_row, column=current_column, timestamp=row["Time"], volume=row["Parameter Value"]))
-        elif row["Parameter Name"] == "Output : Volume Aspirated":
-            steps.append(LiquidStep(type="aspirate", location=current_location, row=current_row, column=current_column, timestamp=row["Time"], volume=row["Parameter Value"]))
+    steps = LiquidSteps()
+    for action, name, value, time in rows:
+        if action == MOVE_ACTION:
+            if name == "Input : Position":
+                current_location = value
+            if name == "Input : Well Row":
+                current_row = row_label(int(value)) if value != "" else None
+            if name == "Input : Well Column":
+                current_column = value if value != "" else None
+        elif name in DISPENSE_NAMES:
+            steps.append("dispense", current_location, current_row, current_column, time, value)
+        elif name == ASPIRATE_NAME:
+            steps.append("aspirate", current_location, current_row, current_column, time, value)
     return steps
 def add_timestamps(steps: list, protocol: BigKahunaProtocol):
     step_index = 0
+    wells = [(row_number(s.row), int(s.column)) if s.row is not None and s.column is not None else None for s in steps]  # compared as (row, column) ints
     for step in protocol.actions:
-        if step.action_type == "transfer" or step.action_type == "dispense" and "SkipMap" not in step.tags:
-            while step_index < len(steps) and step.dispense_timestamp is None:
-                compare_step = steps[step_index]
-                if compare_step.row is not None and compare_step.column is not None:
-                    well = compare_step.row + str(compare_step.column)
-                else:
-                    well = None
-                if step.action_type == "transfer" and compare_step.type == "aspirate" and step.source_well == well and compare_step.location == protocol.plates[step.source_plate].deck_position and step.volume == compare_step.volume:
-                    step.aspirate_timestamp = compare_step.timestamp
-                if step.action_type == "dispense" or (step.action_type == "transfer" and step.aspirate_timestamp is not None) and compare_step.type == "dispense" and step.target_well == well and compare_step.location == protocol.plates[step.target_plate].deck_position and step.volume == compare_step.volume:
-                    step.dispense_timestamp = compare_step.timestamp
-                step_index += 1
+        if step.action_type in RANGE_TYPES and "SkipMap" not in step.tags:  # stamped well by well, as LS runs the range
+            stamps = []
+            for well_step in step.expand():
+                step_index = match_step(well_step, steps, wells, step_index, protocol)
+                stamps.append(well_step.dispense_timestamp)
+            step.dispense_timestamps = stamps
+        elif step.action_type == "transfer" or step.action_type == "dispense" and "SkipMap" not in step.tags:
+            step_index = match_step(step, steps, wells, step_index, protocol)
     return protocol
+
+
+def match_step(step, steps: list, wells: list, step_index: int, protocol: BigKahunaProtocol) -> int:  # stamps a single well action, returns the next step to compare
+    source_well = parse_well(step.source_well) if step.action_type == "transfer" else None
+    target_well = parse_well(step.target_well)
+    while step_index < len(steps) and step.dispense_timestamp is None:
+        compare_step = steps[step_index]
+        well = wells[step_index]
+        if step.action_type == "transfer" and compare_step.type == "aspirate" and source_well == well and compare_step.location == protocol.plates[step.source_plate].deck_position and step.volume == compare_step.volume:
+            step.aspirate_timestamp = compare_step.timestamp
+        if (step.action_type == "dispense" or step.aspirate_timestamp is not None) and compare_step.type == "dispense" and target_well == well and compare_step.location == protocol.plates[step.target_plate].deck_position and step.volume == compare_step.volume:
+            step.dispense_timestamp = compare_step.timestamp
+        step_index += 1
+    return step_index
                     
 
 
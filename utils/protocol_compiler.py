@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Literal, Optional, Union
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import RANGE_TYPES, BigKahunaProtocol, BigKahunaTags, range_wells
+from utils.eta import DurationModel
+from utils.protocol_validator import PARAMETER_MAPS, check_protocol
+from utils.reorder import reorder_actions
+from utils.scheduler import drop_stale_skip_wash, overlap_delays
+from utils.tip_optimizer import four_tip_runs, optimize_four_tip
+from utils.wash_planner import plan_skip_wash
+
+COMPILER_VERSION = 2  # bump when the IR or a pass changes, old cache entries are then ignored
+
+
+class LsMap(BaseModel):
+    """One map of an LS design"""
+    kind: Literal["source", "array", "parameter"]  # AddSourceMap, AddArrayMap or AddParameterMap
+    action_type: str
+    actions: list[int]  # indexes of the compiled protocol's actions behind the map
+    target_plate: str
+    target_range: Optional[str] = None
+    source_chemical: Optional[str] = None
+    source_plate: Optional[str] = None
+    source_range: Optional[str] = None
+    volume: Optional[float] = None
+    volumes: Optional[list[float]] = None  # per well volumes of a non-uniform map
+    parameter: Optional[str] = None
+    value: Optional[Union[float, str]] = None
+    tags: list[BigKahunaTags] = []
+
+
+class CompiledDesign(BaseModel):
+    key: str  # cache key, hash of the protocol, pipeline and pass options
+    pipeline: list[str]
+    protocol: BigKahunaProtocol  # the protocol after the action passes
+    maps: list[LsMap] = []
+    reports: dict[str, Any] = {}
+    timings_s: dict[str, float] = {}
+    cached: bool = False
+
+
+class ProtocolCompiler:
+    """Lowers a BigKahunaProtocol into LS maps through a pipeline of named passes
+
+    Passes before "lower" rewrite the protocol's actions, passes after it work
+    on the maps. Compiled designs are cached in cache_dir by key.
+    """
+
+    def __init__(
+        self,
+        duration_model: Optional[DurationModel] = None,
+        cache_dir: Optional[str] = None,
+        wash_compatibility: Optional[dict[str, list[str]]] = None,
+        delay_overlap_margin: float = 0.1,
+    ):
+        self.duration_model = duration_model or DurationModel()
+        self.cache_dir = cache_dir
+        self.wash_compatibility = wash_compatibility or {}
+        self.delay_overlap_margin = delay_overlap_margin
+
+    def pipeline(self, reorder=False, overlap=False, skip_wash=False, four_tip=False) -> list[str]:
+        passes = ["validate"]
+        if reorder:
+            passes.append("reorder")
+        if overlap:  # before four_tip and skip_wash, both depend on which actions end up next to each other
+            passes.append("overlap")
+        if four_tip:
+            passes.append("four_tip")
+        if skip_wash:  # last, it only holds for the final order
+            passes.append("skip_wash")
+        passes.append("lower")
+        if four_tip:
+            passes.append("merge_four_tip")
+        return passes
+
+    def cache_key(self, protocol: BigKahunaProtocol, pipeline: list[str]) -> str:
+        options = {"version": COMPILER_VERSION, "pipeline": pipeline, "protocol": protocol.model_dump(mode="json")}
+        if "overlap" in pipeline:  # schedules follow the learned durations
+            options["durations"] = self.duration_model.stats
+            options["margin"] = self.delay_overlap_margin
+        if "skip_wash" in pipeline:
+            options["compatibility"] = self.wash_compatibility
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+
+    def cache_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, "compiled_%s.json" % key) if self.cache_dir else None
+
+    def compile(self, protocol: BigKahunaProtocol, pipeline: Optional[list[str]] = None) -> CompiledDesign:
+        pipeline = pipeline or self.pipeline()
+        start = time.perf_counter()
+        key = self.cache_key(protocol, pipeline)
+        design = self.load(key)
+        if design is not None:
+            design.timings_s["cache_load"] = time.perf_counter() - start
+            return design
+        design = CompiledDesign(key=key, pipeline=pipeline, protocol=protocol.model_copy(deep=True))
+        design.timings_s["cache_key"] = time.perf_counter() - start
+        for name in pipeline:
+            start = time.perf_counter()
+            report = PASSES[name](design, self)
+            design.timings_s[name] = time.perf_counter() - start
+            if report is not None:
+                design.reports[name] = report
+        self.store(design)
+        return design
+
+    def load(self, key: str) -> Optional[CompiledDesign]:  # cached design by key, None if not cached
+        path = self.cache_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            design = CompiledDesign.model_validate_json(f.read())
+        design.cached = True
+        return design
+
+    def store(self, design: CompiledDesign):
+        path = self.cache_path(design.key)
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path, "w") as f:
+                f.write(design.model_dump_json())
+
+    def emit(self, design: CompiledDesign, library_studio):
+        """Create the design in LS: libraries, parameters, chemicals and then every map in order"""
+        protocol = design.protocol
+        library_studio.create_lib(protocol.name)
+        library_studio.units = protocol.units
+        for parameter in protocol.parameters:
+            library_studio.add_param(parameter.name, parameter.type, parameter.unit)
+        for name, library in protocol.plates.items():
+            if library.source == False:
+                library_studio.add_library(library.name, library.rows, library.columns, library.color)
+        for chemical in protocol.chemicals:
+            plate = protocol.plates[chemical.source_plate] if chemical.source_plate is not None else None
+            library_studio.add_chemical(plate, chemical.name, chemical.row, chemical.column, chemical.color, chemical.volume)
+        for ls_map in design.maps:
+            emit_map(ls_map, library_studio, protocol)
+
+
+def emit_map(ls_map: LsMap, library_studio, protocol: BigKahunaProtocol, layer: int = -1):  # layer >= 1 edits that map in place
+    if ls_map.kind == "array":
+        library_studio.range_transfer(ls_map.source_plate, ls_map.target_plate, ls_map.source_range, ls_map.target_range,
+                                      ls_map.volume, ls_map.tags, layer, protocol.plates, volumes=ls_map.volumes)
+    elif ls_map.kind == "source":
+        library_studio.dispense_chem(ls_map.source_chemical, ls_map.target_plate, ls_map.target_range, ls_map.volume, ls_map.tags,
+                                     layerIdx=layer, volumes=ls_map.volumes)
+    elif layer >= 0:
+        raise ValueError("LS has no edit call for parameter maps")
+    elif ls_map.parameter == "Pause":
+        library_studio.Pause(ls_map.target_plate, ls_map.value)
+    elif ls_map.parameter == "Delay":
+        library_studio.Delay(ls_map.target_plate, ls_map.value)
+    elif ls_map.parameter == "StirRate":
+        library_studio.Stir(ls_map.target_plate, ls_map.value)
+
+
+# passes
+
+
+def validate_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    check_protocol(design.protocol)
+
+
+def reorder_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    actions, report = reorder_actions(design.protocol)
+    design.protocol.actions = drop_stale_skip_wash(design.protocol.actions, actions)
+    return report.model_dump()
+
+
+def overlap_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    design.protocol.actions, report = overlap_delays(design.protocol, compiler.duration_model, compiler.delay_overlap_margin)
+    return report.model_dump()
+
+
+def skip_wash_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    design.protocol.actions, plan = plan_skip_wash(design.protocol, compiler.wash_compatibility)
+    report = plan.model_dump()
+    report["saved_s"] = plan.skipped * compiler.duration_model.mean(["wash"], "wash")
+    return report
+
+
+def four_tip_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    design.protocol.actions, report = optimize_four_tip(design.protocol)
+    return report.model_dump()
+
+
+def lower_action(i: int, action) -> Optional[LsMap]:
+    if action.action_type == "transfer":
+        return LsMap(kind="array", action_type="transfer", actions=[i], target_plate=action.target_plate,
+                     target_range=action.target_well, source_plate=action.source_plate, source_range=action.source_well,
+                     volume=action.volume, tags=action.tags)
+    if action.action_type == "dispense":
+        return LsMap(kind="source", action_type="dispense", actions=[i], target_plate=action.target_plate,
+                     target_range=action.target_well, source_chemical=action.source_chemical, volume=action.volume,
+                     tags=action.tags)
+    if action.action_type in RANGE_TYPES:
+        volumes = action.well_volumes(len(range_wells(action.target_range)))
+        uniform = len(set(volumes)) == 1
+        return LsMap(kind="array" if action.action_type == "transfer_range" else "source", action_type=action.action_type,
+                     actions=[i], target_plate=action.target_plate, target_range=action.target_range,
+                     source_chemical=getattr(action, "source_chemical", None), source_plate=getattr(action, "source_plate", None),
+                     source_range=getattr(action, "source_range", None), volume=action.map_volume() if not uniform else volumes[0],
+                     volumes=None if uniform else volumes, tags=action.tags)
+    if action.action_type in PARAMETER_MAPS:
+        value = {"pause": "code", "delay": "delay", "stir": "rate"}[action.action_type]
+        return LsMap(kind="parameter", action_type=action.action_type, actions=[i], target_plate=action.target_plate,
+                     target_range="A1", parameter=PARAMETER_MAPS[action.action_type], value=getattr(action, value))
+    return None  # plain actions have no map
+
+
+def lower_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    design.maps = [m for m in (lower_action(i, a) for i, a in enumerate(design.protocol.actions)) if m is not None]
+
+
+def merge_four_tip_pass(design: CompiledDesign, compiler: ProtocolCompiler):
+    """Merge the single-well maps of each 4Tip run into one range map"""
+    actions = design.protocol.actions
+    maps = []
+    for run in four_tip_runs([actions[m.actions[0]] for m in design.maps]):
+        first, last = design.maps[run[0]], design.maps[run[-1]]
+        if len(run) > 1:
+            first = first.model_copy(update={
+                "actions": [i for j in run for i in design.maps[j].actions],
+                "target_range": "%s:%s" % (first.target_range, last.target_range),
+                "source_range": "%s:%s" % (first.source_range, last.source_range) if first.kind == "array" else None,
+                "tags": last.tags,  # SkipWash is decided by what follows the run
+            })
+        maps.append(first)
+    report = {"maps_before": len(design.maps), "maps_after": len(maps)}
+    design.maps = maps
+    return report
+
+
+PASSES: dict[str, Callable[[CompiledDesign, ProtocolCompiler], Optional[dict]]] = {
+    "validate": validate_pass,
+    "reorder": reorder_pass,
+    "overlap": overlap_pass,
+    "skip_wash": skip_wash_pass,
+    "four_tip": four_tip_pass,
+    "lower": lower_pass,
+    "merge_four_tip": merge_four_tip_pass,
+}
@@ -0,0 +1,158 @@
+from functools import lru_cache
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import PARAMETER_TYPES, RANGE_TYPES, BigKahunaProtocol
+from utils.well_codec import parse_well
+PARAMETER_MAPS = {"pause": "Pause", "delay": "Delay", "stir": "StirRate"}  # processing action -> parameter it sets
+
+
+class ValidationIssue(BaseModel):
+    action: Optional[int] = None  # index in protocol.actions, None for plates, chemicals and parameters
+    field: str
+    message: str
+
+
+class ProtocolValidationError(ValueError):
+    def __init__(self, issues: list[ValidationIssue]):
+        self.issues = issues
+        lines = ["%s%s: %s" % ("action %d " % i.action if i.action is not None else "", i.field, i.message) for i in issues[:10]]
+        if len(issues) > 10:
+            lines.append("... %d more" % (len(issues) - 10))
+        super().__init__("invalid protocol:\n" + "\n".join(lines))
+
+
+@lru_cache(maxsize=1024)
+def parse_range(range_str: str) -> Optional[tuple[int, int, int, int]]:  # first row, first column, rows, columns
+    cells = [parse_well(cell) for cell in range_str.split(":")]
+    if len(cells) > 2 or None in cells:
+        return None
+    rows = [cell[0] for cell in cells]
+    columns = [cell[1] for cell in cells]
+    return min(rows), min(columns), max(rows) - min(rows) + 1, max(columns) - min(columns) + 1
+
+
+class ProtocolIndex:
+    """Plate geometry, chemicals and parameters of a protocol, looked up by name"""
+
+    def __init__(self, protocol: BigKahunaProtocol):
+        self.plates = {key: (plate.rows, plate.columns, plate.source) for key, plate in protocol.plates.items()}
+        self.chemicals = {chemical.name for chemical in protocol.chemicals}
+        self.parameters = {parameter.name for parameter in protocol.parameters}
+
+
+class ProtocolValidator:
+    def __init__(self, protocol: BigKahunaProtocol):
+        self.protocol = protocol
+        self.index = ProtocolIndex(protocol)
+        self.issues: list[ValidationIssue] = []
+
+    def issue(self, action: Optional[int], field: str, message: str):
+        self.issues.append(ValidationIssue(action=action, field=field, message=message))
+
+    def validate(self) -> list[ValidationIssue]:
+        self.check_parameters()
+        self.check_plates()
+        self.check_chemicals()
+        for i, action in enumerate(self.protocol.actions):
+            self.check_action(i, action)
+        return self.issues
+
+    def check_parameters(self):
+        seen = set()
+        for parameter in self.protocol.parameters:
+            if parameter.type not in PARAMETER_TYPES:
+                self.issue(None, "parameters", "%s has type %r, expected one of %s" % (parameter.name, parameter.type, ", ".join(PARAMETER_TYPES)))
+            if parameter.name in seen:
+                self.issue(None, "parameters", "%s is defined twice" % parameter.name)
+            seen.add(parameter.name)
+
+    def check_plates(self):
+        for key, plate in self.protocol.plates.items():
+            if plate.rows < 1 or plate.columns < 1:
+                self.issue(None, "plates", "%s has %dx%d wells" % (key, plate.rows, plate.columns))
+            if not plate.source and plate.name != key:  # maps name the LS library by key
+                self.issue(None, "plates", "%s is named %s, library plates need the same key and name" % (key, plate.name))
+
+    def check_chemicals(self):
+        seen = set()
+        for chemical in self.protocol.chemicals:
+            if chemical.name in seen:
+                self.issue(None, "chemicals", "%s is defined twice" % chemical.name)
+            seen.add(chemical.name)
+            if chemical.source_plate is None:
+                continue
+            plate = self.index.plates.get(chemical.source_plate)
+            if plate is None:
+                self.issue(None, "chemicals", "%s is in unknown plate %s" % (chemical.name, chemical.source_plate))
+            elif not (1 <= chemical.row <= plate[0] and 1 <= chemical.column <= plate[1]):
+                self.issue(None, "chemicals", "%s at row %d column %d is outside the %dx%d plate %s"
+                           % (chemical.name, chemical.row, chemical.column, plate[0], plate[1], chemical.source_plate))
+
+    def check_plate(self, i: int, field: str, key: str, library: bool) -> Optional[tuple]:
+        plate = self.index.plates.get(key)
+        if plate is None:
+            self.issue(i, field, "unknown plate %s" % key)
+        elif library and plate[2]:
+            self.issue(i, field, "%s is a source plate, not a library" % key)
+        return plate
+
+    def check_wells(self, i: int, field: str, range_str: str, plate: Optional[tuple]) -> Optional[tuple]:
+        bounds = parse_range(range_str)
+        if bounds is None:
+            self.issue(i, field, "%r is not a well or well range" % range_str)
+        elif plate is not None and (bounds[0] + bounds[2] - 1 > plate[0] or bounds[1] + bounds[3] - 1 > plate[1]):
+            self.issue(i, field, "%s is outside the %dx%d plate" % (range_str, plate[0], plate[1]))
+        return bounds
+
+    def check_volume(self, i: int, action):
+        volumes = getattr(action, "volumes", None) or [action.volume]
+        if any(volume is None or volume <= 0 for volume in volumes):
+            self.issue(i, "volume", "volumes must be positive")
+
+    def check_action(self, i: int, action):
+        action_type = action.action_type
+        if action_type in ("transfer", "transfer_range"):
+            source = self.check_plate(i, "source_plate", action.source_plate, False)
+            target = self.check_plate(i, "target_plate", action.target_plate, True)
+            ranged = action_type == "transfer_range"
+            a = self.check_wells(i, "source_range" if ranged else "source_well", action.source_range if ranged else action.source_well, source)
+            b = self.check_wells(i, "target_range" if ranged else "target_well", action.target_range if ranged else action.target_well, target)
+            if a is not None and b is not None and a[2:] != b[2:]:
+                self.issue(i, "target_range", "%dx%d target for a %dx%d source" % (b[2], b[3], a[2], a[3]))
+        elif action_type in ("dispense", "dispense_range"):
+            if action.source_chemical not in self.index.chemicals:
+                self.issue(i, "source_chemical", "unknown chemical %s" % action.source_chemical)
+            target = self.check_plate(i, "target_plate", action.target_plate, True)
+            ranged = action_type == "dispense_range"
+            b = self.check_wells(i, "target_range" if ranged else "target_well", action.target_range if ranged else action.target_well, target)
+        elif action_type in PARAMETER_MAPS:
+            self.check_plate(i, "target_plate", action.target_plate, True)
+            if PARAMETER_MAPS[action_type] not in self.index.parameters:
+                self.issue(i, "action_type", "%s needs a %s parameter" % (action_type, PARAMETER_MAPS[action_type]))
+            if action_type == "delay" and action.delay < 0:
+                self.issue(i, "delay", "negative delay")
+            if action_type == "stir" and action.rate < 0:
+                self.issue(i, "rate", "negative stir rate")
+            return
+        else:
+            return
+        if action_type in RANGE_TYPES:
+            if (action.volume is None) == (action.volumes is None):
+                self.issue(i, "volume", "give either volume or volumes")
+                return
+            if action.volumes is not None and b is not None and len(action.volumes) != b[2] * b[3]:
+                self.issue(i, "volumes", "%d volumes for %d wells" % (len(action.volumes), b[2] * b[3]))
+        self.check_volume(i, action)
+
+
+def validate_protocol(protocol: BigKahunaProtocol) -> list[ValidationIssue]:
+    return ProtocolValidator(protocol).validate()
+
+
+def check_protocol(protocol: BigKahunaProtocol):
+    """Raise ProtocolValidationError listing every problem found, before any LS or SiLA work"""
+    issues = validate_protocol(protocol)
+    if issues:
+        raise ProtocolValidationError(issues)
@@ -0,0 +1,129 @@
+import re
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import PLATE_TYPES, PROMPT_TYPES, RANGE_TYPES, BigKahunaProtocol
+
+REORDER_BARRIERS = PROMPT_TYPES + PLATE_TYPES  # order is only kept per well, so plate-wide maps split the protocol too
+
+
+class ReorderReport(BaseModel):
+    travel_before: float
+    travel_after: float
+    saving: float
+    moved: int  # actions that changed position
+
+
+def deck_coordinate(deck_position: str) -> Optional[tuple[float, float]]:
+    """Rough arm coordinate of a deck position, e.g. "Deck 12-13 Heat-Stir 2" -> (12.5, 2)
+
+    The deck number range gives the column, a trailing number the slot in it.
+    Positions off the deck (Drain, Clean) have no coordinate.
+    """
+    match = re.match(r"Deck (\d+)(?:-(\d+))?", deck_position)
+    if match is None:
+        return None
+    x = (int(match.group(1)) + int(match.group(2) or match.group(1))) / 2
+    slot = re.search(r"(\d+)\s*$", deck_position[match.end():])
+    return (x, float(slot.group(1)) if slot else 0.0)
+
+
+def action_path(action, protocol: BigKahunaProtocol) -> list[str]:  # deck positions the arm visits for an action
+    if action.action_type in ("transfer", "transfer_range"):
+        return [protocol.plates[action.source_plate].deck_position, protocol.plates[action.target_plate].deck_position]
+    if action.action_type in ("dispense", "dispense_range"):
+        path = []
+        for chemical in protocol.chemicals:
+            if chemical.name == action.source_chemical and chemical.source_plate is not None:
+                path.append(protocol.plates[chemical.source_plate].deck_position)
+        path.append(protocol.plates[action.target_plate].deck_position)
+        return path
+    return []
+
+
+def action_wells(action) -> list[tuple[str, str]]:  # (plate, well) pairs an action reads or changes
+    if action.action_type in RANGE_TYPES:
+        return [well for single in action.expand() for well in action_wells(single)]
+    if action.action_type == "transfer":
+        return [(action.source_plate, action.source_well), (action.target_plate, action.target_well)]
+    if action.action_type == "dispense":
+        return [(action.target_plate, action.target_well)]
+    return []
+
+
+def distance(a: Optional[tuple[float, float]], b: Optional[tuple[float, float]]) -> float:
+    if a is None or b is None:
+        return 0.0
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def travel(actions: list, protocol: BigKahunaProtocol) -> float:
+    """Estimated arm travel of running the actions in order, in deck units"""
+    total = 0.0
+    current = None
+    for action in actions:
+        for position in action_path(action, protocol):
+            coordinate = deck_coordinate(position)
+            if coordinate is not None:
+                total += distance(current, coordinate)
+                current = coordinate
+    return total
+
+
+def reorder_segment(segment: list, protocol: BigKahunaProtocol, start: Optional[tuple[float, float]]) -> list:
+    """Greedy nearest-position order that keeps every well's accesses in protocol order"""
+    n = len(segment)
+    successors = [[] for _ in range(n)]
+    waiting = [0] * n
+    last_access = {}
+    for i, action in enumerate(segment):
+        for well in set(action_wells(action)):
+            j = last_access.get(well)
+            if j is not None:
+                successors[j].append(i)
+                waiting[i] += 1
+            last_access[well] = i
+    paths = [[deck_coordinate(p) for p in action_path(a, protocol)] for a in segment]
+    ready = [i for i in range(n) if waiting[i] == 0]
+    order = []
+    current = start
+    while ready:
+        best = min(ready, key=lambda i: (distance(current, paths[i][0]) if paths[i] else 0.0, i))
+        ready.remove(best)
+        order.append(best)
+        for coordinate in paths[best]:
+            if coordinate is not None:
+                current = coordinate
+        for j in successors[best]:
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                ready.append(j)
+    return [segment[i] for i in order]
+
+
+def reorder_actions(protocol: BigKahunaProtocol) -> tuple[list, ReorderReport]:
+    """Reorder liquid handling between REORDER_BARRIERS to cut arm travel"""
+    actions = []
+    segment = []
+    for action in protocol.actions + [None]:
+        if action is None or action.action_type in REORDER_BARRIERS:
+            start = None
+            for previous in reversed(actions):
+                path = [deck_coordinate(p) for p in action_path(previous, protocol)]
+                path = [c for c in path if c is not None]
+                if path:
+                    start = path[-1]
+                    break
+            actions.extend(reorder_segment(segment, protocol, start))
+            segment = []
+            if action is not None:
+                actions.append(action)
+        else:
+            segment.append(action)
+    before = travel(protocol.actions, protocol)
+    after = travel(actions, protocol)
+    if after >= before:  # greedy order is not always shorter, keep the protocol as written then
+        actions, after = list(protocol.actions), before
+    moved = sum(1 for a, b in zip(protocol.actions, actions) if a is not b)
+    return actions, ReorderReport(travel_before=before, travel_after=after, saving=before - after, moved=moved)
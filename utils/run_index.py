@@ -0,0 +1,263 @@
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+from datetime import datetime
+from typing import Any, Optional
+
+from utils.big_kahuna_protocol_types import RANGE_TYPES, BigKahunaProtocol, BigKahunaTags
+from utils.log_parsing import LiquidSteps, read_logs
+from utils.timeline import RunTimeline, step_ms, wall_ms
+from utils.well_codec import row_number, well_label
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    log_file TEXT UNIQUE,
+    design_id INTEGER,
+    design_key TEXT,
+    protocol TEXT,
+    status TEXT,
+    start_ms INTEGER,
+    end_ms INTEGER,
+    duration_s REAL,
+    total_maps INTEGER,
+    volume REAL,
+    ingested_ms INTEGER
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    location TEXT,
+    plate TEXT,
+    well TEXT,
+    time_ms INTEGER NOT NULL,
+    volume REAL,
+    chemical TEXT
+);
+CREATE TABLE IF NOT EXISTS maps (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    map INTEGER NOT NULL,
+    action_type TEXT,
+    description TEXT,
+    start_ms INTEGER,
+    end_ms INTEGER,
+    duration_s REAL,
+    volume REAL
+);
+CREATE TABLE IF NOT EXISTS actions (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    action_type TEXT NOT NULL,
+    source_plate TEXT,
+    source_well TEXT,
+    source_chemical TEXT,
+    target_plate TEXT,
+    target_well TEXT,
+    volume REAL,
+    aspirate_ms INTEGER,
+    dispense_ms INTEGER,
+    tags TEXT
+);
+CREATE INDEX IF NOT EXISTS steps_well ON steps (plate, well, time_ms);
+CREATE INDEX IF NOT EXISTS steps_location ON steps (location, time_ms);
+CREATE INDEX IF NOT EXISTS steps_chemical ON steps (chemical, time_ms);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id, seq);
+CREATE INDEX IF NOT EXISTS maps_run ON maps (run_id, map);
+CREATE INDEX IF NOT EXISTS maps_type ON maps (action_type, start_ms);
+CREATE INDEX IF NOT EXISTS actions_target ON actions (target_plate, target_well, dispense_ms);
+CREATE INDEX IF NOT EXISTS actions_chemical ON actions (source_chemical, dispense_ms);
+CREATE INDEX IF NOT EXISTS actions_run ON actions (run_id, seq);
+CREATE INDEX IF NOT EXISTS runs_start ON runs (start_ms);
+"""
+
+
+GROUP_COLUMNS = {  # what events can be filtered and grouped by
+    "run_id": "s.run_id",
+    "design_id": "r.design_id",
+    "plate": "s.plate",
+    "well": "s.well",
+    "location": "s.location",
+    "type": "s.type",
+    "chemical": "s.chemical",
+}
+
+
+def step_well(step) -> Optional[str]:
+    if step.row is None or step.column is None:
+        return None
+    return well_label(row_number(step.row), int(step.column))
+
+
+def step_chemicals(steps: LiquidSteps, plates: dict[str, str], protocol: BigKahunaProtocol) -> list[Optional[str]]:
+    """Chemical of each dispense step, from the dispense actions of the protocol
+
+    The n-th logged dispense into a well is taken to be the n-th liquid
+    handling action on that well; transfers and aspirations get None.
+    """
+    queues = {}
+    for action in protocol.actions:
+        for single in (action.expand() if action.action_type in RANGE_TYPES else [action]):
+            if single.action_type in ("transfer", "dispense") and BigKahunaTags.SkipMap not in single.tags:
+                queues.setdefault((single.target_plate, single.target_well), []).append(getattr(single, "source_chemical", None))
+    taken = {}
+    chemicals = []
+    for step in steps:
+        key = (plates.get(step.location), step_well(step))
+        queue = queues.get(key) if step.type == "dispense" else None
+        n = taken.get(key, 0)
+        chemicals.append(queue[n] if queue and n < len(queue) else None)
+        if queue:
+            taken[key] = n + 1
+    return chemicals
+
+
+class RunIndex:
+    """SQLite index of finished runs: their LiquidSteps, map timelines and stamped protocols
+
+    Times are stored as wall_ms, ms since 1970 on the instrument's clock like
+    the LiquidSteps times, so that range queries use the indexes. Every call
+    opens its own connection, so the index can be used from the threads
+    actions run in.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode = WAL")  # readers do not wait for an ingest
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):  # one transaction, committed unless it raises
+        with closing(sqlite3.connect(self.path, timeout=30)) as db:
+            db.execute("PRAGMA foreign_keys = ON")
+            db.row_factory = sqlite3.Row
+            with db:
+                yield db
+
+    def ingest_run(
+        self,
+        steps: LiquidSteps,
+        log_file: Optional[str] = None,
+        design_id: Optional[int] = None,
+        timeline: Optional[RunTimeline] = None,
+        protocol: Optional[BigKahunaProtocol] = None,
+        design_key: Optional[str] = None,
+        status: str = "completed",
+    ) -> int:
+        """Add a run, replacing an earlier ingest of the same log file, and return its run_id"""
+        plates = {plate.deck_position: key for key, plate in protocol.plates.items()} if protocol else {}
+        chemicals = step_chemicals(steps, plates, protocol) if protocol else [None] * len(steps)
+        step_rows = [(i, s.type, s.location, plates.get(s.location), step_well(s), step_ms(s), s.volume, chemical)
+                     for i, (s, chemical) in enumerate(zip(steps, chemicals))]
+        times = [row[5] for row in step_rows]
+        run = {
+            "log_file": os.path.abspath(log_file) if log_file else None,
+            "design_id": design_id,
+            "design_key": design_key,
+            "protocol": protocol.name if protocol else None,
+            "status": status,
+            "start_ms": wall_ms(timeline.start) if timeline else (min(times) if times else None),
+            "end_ms": wall_ms(timeline.end) if timeline else (max(times) if times else None),
+            "duration_s": timeline.duration_s if timeline else ((max(times) - min(times)) / 1000 if times else 0.0),
+            "total_maps": timeline.total_maps if timeline else None,
+            "volume": timeline.volume if timeline else None,
+            "ingested_ms": wall_ms(datetime.now()),
+        }
+        with self.connect() as db:
+            if run["log_file"]:
+                db.execute("DELETE FROM runs WHERE log_file = ?", (run["log_file"],))
+            run_id = db.execute("INSERT INTO runs (%s) VALUES (%s)" % (", ".join(run), ", ".join("?" * len(run))),
+                                list(run.values())).lastrowid
+            db.executemany("INSERT INTO steps VALUES (%d, ?, ?, ?, ?, ?, ?, ?, ?)" % run_id, step_rows)
+            if timeline is not None:
+                db.executemany("INSERT INTO maps VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                    (run_id, m.map, m.action_type, m.description, wall_ms(m.start), wall_ms(m.end), m.duration_s, m.volume)
+                    for m in timeline.maps])
+            if protocol is not None:
+                db.executemany("INSERT INTO actions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                    (run_id, i, a.action_type, getattr(a, "source_plate", None), getattr(a, "source_well", None),
+                     getattr(a, "source_chemical", None), getattr(a, "target_plate", None), getattr(a, "target_well", None),
+                     getattr(a, "volume", None), wall_ms(getattr(a, "aspirate_timestamp", None)),
+                     wall_ms(getattr(a, "dispense_timestamp", None)), ",".join(t.value for t in getattr(a, "tags", [])))
+                    for i, a in enumerate(protocol.actions)])
+        return run_id
+
+    def ingest_log(self, log_file: str, protocol: Optional[BigKahunaProtocol] = None, design_id: Optional[int] = None) -> int:
+        """Index a raw ASMain log; copy_log puts them in folders named by design ID"""
+        if design_id is None:
+            folder = os.path.basename(os.path.dirname(os.path.abspath(log_file)))
+            design_id = int(folder) if folder.isdigit() else None
+        return self.ingest_run(read_logs(log_file), log_file, design_id, protocol=protocol)
+
+    def backfill(self, directory: str) -> list[int]:
+        """Index every ASMain log under directory that is not indexed yet"""
+        with self.connect() as db:
+            known = {row[0] for row in db.execute("SELECT log_file FROM runs WHERE log_file IS NOT NULL")}
+        run_ids = []
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.abspath(os.path.join(root, name))
+                if name.startswith("ASMain_") and name.endswith(".log") and path not in known:
+                    run_ids.append(self.ingest_log(path))
+        return run_ids
+
+    def query(self, sql: str, params: tuple = ()) -> list[dict[str, Any]]:
+        with self.connect() as db:
+            return [dict(row) for row in db.execute(sql, params)]
+
+    def events(
+        self,
+        filters: Optional[dict[str, Any]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        group_by: Optional[list[str]] = None,
+        limit: int = 1000,
+    ) -> dict[str, Any]:
+        """Logged liquid handling events matching filters, or their counts and volumes per group
+
+        filters and group_by take the keys of GROUP_COLUMNS. At most limit
+        events or groups are returned, "truncated" says whether there were more.
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value is not None}
+        unknown = sorted((set(filters) | set(group_by or [])) - set(GROUP_COLUMNS))
+        if unknown:
+            raise ValueError("cannot filter or group by %s, use %s" % (", ".join(unknown), ", ".join(GROUP_COLUMNS)))
+        where = ["%s = ?" % GROUP_COLUMNS[key] for key in filters]
+        params = list(filters.values())
+        if since is not None:
+            where.append("s.time_ms >= ?")
+            params.append(wall_ms(since))
+        if until is not None:
+            where.append("s.time_ms < ?")
+            params.append(wall_ms(until))
+        sql_where = " WHERE " + " AND ".join(where) if where else ""
+        if group_by:
+            columns = ", ".join("%s AS %s" % (GROUP_COLUMNS[key], key) for key in group_by)
+            sql = ("SELECT %s, COUNT(*) AS count, SUM(s.volume) AS volume, MIN(s.time_ms) AS first_ms, MAX(s.time_ms) AS last_ms"
+                   " FROM steps s JOIN runs r USING (run_id)%s GROUP BY %s ORDER BY %s LIMIT ?"
+                   % (columns, sql_where, ", ".join(group_by), ", ".join(group_by)))
+        else:
+            sql = ("SELECT s.*, r.design_id FROM steps s JOIN runs r USING (run_id)%s ORDER BY s.time_ms, s.run_id, s.seq LIMIT ?"
+                   % sql_where)
+        rows = self.query(sql, tuple(params + [limit + 1]))
+        return {"groups" if group_by else "events": rows[:limit], "truncated": len(rows) > limit}
+
+    def dispenses(self, plate: str, well: Optional[str] = None, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> list[dict[str, Any]]:
+        """Logged dispenses into a plate, or one of its wells, oldest first"""
+        sql = "SELECT s.*, r.design_id FROM steps s JOIN runs r USING (run_id) WHERE s.plate = ? AND s.type = 'dispense'"
+        params = [plate]
+        if well is not None:
+            sql += " AND s.well = ?"
+            params.append(well)
+        if since is not None:
+            sql += " AND s.time_ms >= ?"
+            params.append(wall_ms(since))
+        if until is not None:
+            sql += " AND s.time_ms < ?"
+            params.append(wall_ms(until))
+        return self.query(sql + " ORDER BY s.time_ms", tuple(params))
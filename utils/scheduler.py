@@ -0,0 +1,167 @@
+import math
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import LIQUID_TYPES, PLATE_TYPES, PROMPT_TYPES, BigKahunaDelay, BigKahunaProtocol, BigKahunaTags
+from utils.eta import DurationModel
+from utils.reorder import action_wells
+
+SCHEDULE_BARRIERS = PROMPT_TYPES  # delays and stirs are scheduled as plate holds, only prompts split the protocol
+
+
+class DelayOverlapReport(BaseModel):
+    makespan_before_s: float
+    makespan_after_s: float
+    saving_s: float
+    delays: int  # delays in the protocol
+    residual_delays: int  # delays left in the design after filling their windows
+    moved: int  # actions that changed position
+
+
+def dependencies(segment: list) -> list[set[int]]:
+    """Earlier segment indexes each action has to wait for
+
+    Liquid handling waits for the previous access to its wells, delays and
+    stirs hold their whole plate: they wait for, and are waited on by, every
+    access to that plate.
+    """
+    deps = [set() for _ in segment]
+    last_well = {}
+    last_plate_op = {}
+    since = {}  # plate -> accesses since its last delay/stir
+    for i, action in enumerate(segment):
+        if action.action_type in PLATE_TYPES:
+            plate = action.target_plate
+            if plate in last_plate_op:
+                deps[i].add(last_plate_op[plate])
+            deps[i].update(since.pop(plate, []))
+            last_plate_op[plate] = i
+            continue
+        for plate, well in action_wells(action):
+            if (plate, well) in last_well:
+                deps[i].add(last_well[(plate, well)])
+            if plate in last_plate_op:
+                deps[i].add(last_plate_op[plate])
+            since.setdefault(plate, []).append(i)
+            last_well[(plate, well)] = i
+        deps[i].discard(i)
+    return deps
+
+
+def residual_delay(plate: str, seconds: float) -> BigKahunaDelay:  # rounded up to LS's 0.01 min
+    return BigKahunaDelay(target_plate=plate, delay=math.ceil(seconds / 0.6) / 100)
+
+
+def schedule_segment(segment: list, protocol: BigKahunaProtocol, model: DurationModel, margin: float) -> list:
+    """List-schedule a segment on one arm, filling each plate's delay with other plates' work
+
+    Arm work is counted at (1 - margin) of its estimate so that a window is
+    only considered filled when the work is likely to really take that long.
+    """
+    n = len(segment)
+    deps = dependencies(segment)
+    successors = [[] for _ in range(n)]
+    waiting = [len(d) for d in deps]
+    for i, d in enumerate(deps):
+        for j in d:
+            successors[j].append(i)
+    arm = [0.0 if a.action_type == "delay" else (1 - margin) * model.action_seconds(a, protocol) for a in segment]
+    ready_time = [0.0] * n
+    gate = [None] * n  # delay that holds an action back
+    releases = []  # (time, plate) of every delay
+    ready = [i for i in range(n) if waiting[i] == 0]
+    actions = []
+    t = 0.0
+    while ready:
+        best = min(ready, key=lambda i: (segment[i].action_type != "delay", max(ready_time[i], t), i))
+        ready.remove(best)
+        action = segment[best]
+        if action.action_type == "delay":  # takes no arm time, starts the plate's hold
+            done = ready_time[best] + 60 * action.delay
+            releases.append((done, action.target_plate))
+        else:
+            start = max(ready_time[best], t)
+            if start > t:
+                actions.append(residual_delay(segment[gate[best]].target_plate, start - t))
+            t = done = start + arm[best]
+            actions.append(action)
+        for j in successors[best]:
+            if done > ready_time[j]:
+                ready_time[j] = done
+                gate[j] = best if action.action_type == "delay" else None
+            waiting[j] -= 1
+            if waiting[j] == 0:
+                ready.append(j)
+    if releases:  # the segment still ends after every hold, as written
+        done, plate = max(releases)
+        if done > t:
+            actions.append(residual_delay(plate, done - t))
+    return actions
+
+
+def drop_stale_skip_wash(original: list, actions: list, origins: Optional[list] = None) -> list:
+    """Remove SkipWash from actions no longer followed by the same liquid handling
+
+    origins gives the index in original of each action, None for actions a
+    pass added; without it actions are matched to original by identity, so
+    passes that copy actions have to pass it.
+    """
+    if origins is None:
+        index = {id(action): i for i, action in enumerate(original)}
+        origins = [index.get(id(action)) for action in actions]
+
+    def following(sequence, keys):
+        nexts = {}
+        previous = None
+        for action, key in zip(sequence, keys):
+            if action.action_type not in LIQUID_TYPES:
+                previous = None
+            elif BigKahunaTags.SkipMap not in action.tags:
+                if previous is not None:
+                    nexts[previous] = key
+                previous = key
+        return nexts
+
+    before, after = following(original, range(len(original))), following(actions, origins)
+    return [
+        action.model_copy(update={"tags": [tag for tag in action.tags if tag != BigKahunaTags.SkipWash]})
+        if action.action_type in LIQUID_TYPES and BigKahunaTags.SkipWash in action.tags
+        and (origin is None or before.get(origin) != after.get(origin)) else action
+        for action, origin in zip(actions, origins)
+    ]
+
+
+def overlap_delays(protocol: BigKahunaProtocol, model: DurationModel, margin: float = 0.1) -> tuple[list, DelayOverlapReport]:
+    """Run other plates' liquid handling inside each plate's delays
+
+    A delay on a plate becomes a hold that starts once everything before it on
+    that plate is done; later work on the plate waits for it, work on other
+    plates does not. Whatever part of a hold is not covered by estimated work
+    is kept as a shorter Delay map, so the design stays a linear LS design.
+    Pauses and generic actions split the protocol and are never moved across.
+    """
+    actions = []
+    segment = []
+    for action in protocol.actions + [None]:
+        if action is None or action.action_type in SCHEDULE_BARRIERS:
+            actions.extend(schedule_segment(segment, protocol, model, margin))
+            segment = []
+            if action is not None:
+                actions.append(action)
+        else:
+            segment.append(action)
+    actions = drop_stale_skip_wash(protocol.actions, actions)
+    before = model.estimate(protocol).total_s
+    after = model.estimate(protocol.model_copy(update={"actions": actions})).total_s
+    if after >= before:  # nothing to overlap, keep the protocol as written
+        actions, after = list(protocol.actions), before
+    moved = sum(1 for a, b in zip(protocol.actions, actions) if a is not b)
+    return actions, DelayOverlapReport(
+        makespan_before_s=before,
+        makespan_after_s=after,
+        saving_s=before - after,
+        delays=sum(1 for a in protocol.actions if a.action_type == "delay"),
+        residual_delays=sum(1 for a in actions if a.action_type == "delay"),
+        moved=moved,
+    )
@@ -0,0 +1,112 @@
+import json
+import os
+from typing import Any, Optional
+
+from utils.call_metrics import LatencyHistogram
+
+MIN_BASELINE = 5  # observations of a key before its baseline is used
+DRIFT_QUANTILE = 0.95  # intervals above this quantile of the baseline are long
+DRIFT_STREAK = 3  # long intervals in a row that flag drift
+DRIFT_RATIO = 1.5  # run median over baseline median that flags drift
+MAX_KEYS = 256  # per-map and per-signal histograms kept, beyond that only the totals
+
+
+class SignalStats:
+    """Pause-to-pause and map latencies of AS runs, with drift detection against earlier runs
+
+    Every interval goes into a LatencyHistogram for its kind ("signal" or
+    "map") and one for the kind and map description, so memory stays bounded
+    however long a run is. A key drifts when DRIFT_STREAK intervals in a row
+    are above the DRIFT_QUANTILE of its baseline, or when its run median
+    reaches DRIFT_RATIO times the baseline median. Keys with too short a
+    baseline are compared with the baseline of their kind.
+    """
+
+    def __init__(self):
+        self.run: dict[str, LatencyHistogram] = {}  # this run
+        self.baseline: dict[str, LatencyHistogram] = {}  # earlier runs
+        self.streaks: dict[str, int] = {}
+        self.drifting: dict[str, dict[str, Any]] = {}  # last drift of each key this run
+        self.runs = 0  # runs merged into the baseline
+
+    def start_run(self):
+        self.run = {}
+        self.streaks = {}
+        self.drifting = {}
+
+    def keys(self, kind: str, description: Optional[str]) -> list[str]:
+        keys = [kind]
+        if description:
+            key = "%s:%s" % (kind, description)
+            if key in self.run or len(self.run) < MAX_KEYS:
+                keys.append(key)
+        return keys
+
+    def reference(self, key: str, kind: str) -> Optional[LatencyHistogram]:  # baseline an interval of key is compared with
+        for name in (key, kind):
+            histogram = self.baseline.get(name)
+            if histogram is not None and histogram.count >= MIN_BASELINE:
+                return histogram
+        return None
+
+    def observe(self, kind: str, description: Optional[str], seconds: float) -> Optional[dict[str, Any]]:
+        """Add an interval, return the drift it shows or None"""
+        keys = self.keys(kind, description)
+        for key in keys:
+            histogram = self.run.get(key)
+            if histogram is None:
+                histogram = self.run[key] = LatencyHistogram()
+            histogram.observe(seconds)
+        key = keys[-1]
+        baseline = self.reference(key, kind)
+        if baseline is None:
+            return None
+        limit = baseline.quantile(DRIFT_QUANTILE)
+        streak = self.streaks[key] = self.streaks.get(key, 0) + 1 if seconds > limit else 0
+        run_median = self.run[key].quantile(0.5)
+        baseline_median = baseline.quantile(0.5)
+        if streak >= DRIFT_STREAK:
+            reason = "%d intervals in a row above the baseline p%d of %.3g s" % (streak, 100 * DRIFT_QUANTILE, limit)
+        elif self.run[key].count >= MIN_BASELINE and run_median >= DRIFT_RATIO * baseline_median:
+            reason = "median %.3g s against a baseline median of %.3g s" % (run_median, baseline_median)
+        else:
+            return None
+        drift = {"key": key, "seconds": seconds, "reason": reason}
+        self.drifting[key] = drift
+        return drift
+
+    def end_run(self, merge: bool = True):  # fold the run into the baseline, not for aborted runs
+        if not merge or not self.run:
+            return
+        for key, histogram in self.run.items():
+            baseline = self.baseline.get(key)
+            if baseline is None:
+                if len(self.baseline) >= MAX_KEYS * 4:
+                    continue
+                baseline = self.baseline[key] = LatencyHistogram()
+            baseline.merge(histogram)
+        self.runs += 1
+
+    def summary(self) -> dict[str, Any]:  # for node state: the totals and the drifting keys
+        names = ["signal", "map"] + sorted(self.drifting)
+        return {
+            "run": {name: self.run[name].summary() for name in names if name in self.run},
+            "baseline": {name: self.baseline[name].summary() for name in names if name in self.baseline},
+            "keys": len(self.run),
+            "baseline_runs": self.runs,
+            "drifting": self.drifting,
+        }
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"runs": self.runs, "baseline": {key: h.to_dict() for key, h in sorted(self.baseline.items())}}, f, indent=4)
+
+    @classmethod
+    def load(cls, path: str) -> "SignalStats":
+        stats = cls()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            stats.runs = data.get("runs", 0)
+            stats.baseline = {key: LatencyHistogram.from_dict(d) for key, d in data.get("baseline", {}).items()}
+        return stats
@@ -0,0 +1,118 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Optional
+
+ROTATE_BYTES = 8 << 20  # start a new file past this size
+ROTATE_S = 6 * 3600  # or after this long
+FLUSH_S = 5.0  # longest time a record waits in the buffer
+
+
+class StatusRecorder:
+    """JSON lines record of the AS status, written by a background thread
+
+    record() only stamps the fields and queues them; the writer thread
+    batches them into a buffered file and flushes at least every flush_s.
+    flush() waits until everything recorded so far is on disk, for state
+    changes that must not be lost. Files are named <name>.jsonl, then
+    <name>.1.jsonl, <name>.2.jsonl ... once one grows past rotate_bytes or
+    is older than rotate_s.
+    """
+
+    def __init__(self, directory: str, name: str, rotate_bytes: int = ROTATE_BYTES, rotate_s: float = ROTATE_S,
+                 flush_s: float = FLUSH_S, echo: bool = False):
+        self.directory = directory
+        self.name = name
+        self.rotate_bytes = rotate_bytes
+        self.rotate_s = rotate_s
+        self.flush_s = flush_s
+        self.echo = echo  # also print records
+        self.files: list[str] = []  # written so far, in order
+        self.errors = 0  # records that could not be written
+        self.file = None
+        self.opened = 0.0
+        self.queue = queue.SimpleQueue()
+        self.closed = False
+        os.makedirs(directory or ".", exist_ok=True)
+        self.open_file()
+        self.writer = threading.Thread(target=self.write_loop, name="status-record", daemon=True)
+        self.writer.start()
+
+    @property
+    def path(self) -> Optional[str]:  # file written now
+        return self.files[-1] if self.files else None
+
+    def open_file(self):
+        n = len(self.files)
+        path = os.path.join(self.directory, "%s.jsonl" % self.name if n == 0 else "%s.%d.jsonl" % (self.name, n))
+        self.file = open(path, "a", encoding="utf-8", buffering=1 << 16)
+        self.opened = time.monotonic()
+        self.files.append(path)
+
+    def rotate(self):
+        self.file.close()
+        self.open_file()
+
+    def record(self, kind: str, **fields: Any):  # queue one record, t is ms since the epoch
+        if self.closed:
+            return
+        item = {"t": time.time_ns() // 1000000, "kind": kind, **fields}
+        if self.echo:
+            print("\n>> record = %s\n" % item)
+        self.queue.put(item)
+
+    def flush(self, timeout: float = 10.0) -> bool:  # wait until all queued records are on disk
+        if self.closed:
+            return True
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+
+    def write(self, fields: dict):
+        try:
+            self.file.write(json.dumps(fields, default=str) + "\n")
+        except (OSError, ValueError, TypeError) as e:
+            self.errors += 1
+            print(">> Cannot write AS record %s: %s" % (self.path, e))
+            return
+        if self.file.tell() >= self.rotate_bytes or time.monotonic() - self.opened >= self.rotate_s:
+            self.rotate()
+
+    def write_loop(self):
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_s)
+            except queue.Empty:
+                item = {}
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                self.file.flush()
+                flushed = time.monotonic()
+                item.set()
+                continue
+            if item:
+                self.write(item)
+            if time.monotonic() - flushed >= self.flush_s:  # also while records keep coming
+                self.file.flush()
+                flushed = time.monotonic()
+        while True:  # records queued by other threads while closing
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not None:
+                self.write(item)
+        self.file.close()
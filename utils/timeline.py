@@ -0,0 +1,164 @@
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from pydantic import BaseModel
+
+LOG_TIME_FORMAT = "%m/%d/%Y %H:%M:%S.%f"  # ASMain log time stamps
+EPOCH = datetime(1970, 1, 1)  # LiquidSteps times are ms since EPOCH
+DAY_MS = 86400000
+STAMP_PATTERN = re.compile(r"\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}\.\d{3}")  # stamps ms_stamp prints back unchanged
+WASH_LOCATIONS = ("Drain", "Clean")  # wash station positions, not part of the protocol
+
+
+class MapInterval(BaseModel):
+    map: int
+    action_type: Optional[str]
+    description: Optional[str]
+    start: datetime
+    end: datetime
+    duration_s: float
+    volume: float  # volume dispensed into plates during the map
+
+
+class HoldInterval(BaseModel):
+    state: str
+    title: Optional[str]
+    start: datetime
+    end: datetime
+    duration_s: float
+
+
+class RunTimeline(BaseModel):
+    design_id: int
+    start: Optional[datetime]
+    end: Optional[datetime]
+    duration_s: float
+    total_maps: int
+    maps: list[MapInterval]
+    holds: list[HoldInterval]
+    time_per_action_type_s: dict[str, float]
+    idle_s: float
+    volume: float
+    volume_per_min: float
+    maps_per_hour: float
+
+
+@lru_cache(maxsize=4096)
+def day_ms(date: str) -> int:  # "08/14/2025" -> ms from EPOCH to its midnight
+    return (datetime.strptime(date, "%m/%d/%Y") - EPOCH) // timedelta(milliseconds=1)
+
+
+@lru_cache(maxsize=4096)
+def day_stamp(day: int) -> str:
+    return (EPOCH + timedelta(days=day)).strftime("%m/%d/%Y")
+
+
+def stamp_ms(stamp: str) -> int:
+    """ASMain time stamp -> ms since 1970 on the instrument's local clock, no time zone is applied"""
+    try:
+        date, clock = stamp.split(" ")
+        hours, minutes, seconds = clock.split(":")
+        return day_ms(date) + (int(hours) * 60 + int(minutes)) * 60000 + round(float(seconds) * 1000)
+    except ValueError:  # not the usual layout, let strptime decide
+        return (datetime.strptime(stamp, LOG_TIME_FORMAT) - EPOCH) // timedelta(milliseconds=1)
+
+
+def ms_stamp(ms: int) -> str:  # inverse of stamp_ms, with the millisecond precision ASMain logs use
+    day, ms = divmod(ms, DAY_MS)
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%s %02d:%02d:%02d.%03d" % (day_stamp(day), hours, minutes, seconds, ms)
+
+
+def datetime_ms(t: datetime) -> int:  # datetime -> ms since EPOCH on the local wall clock, as stamp_ms
+    if t.tzinfo is not None:
+        t = t.astimezone().replace(tzinfo=None)
+    return (t - EPOCH) // timedelta(milliseconds=1)
+
+
+def wall_ms(value) -> Optional[int]:  # datetime or ASMain time stamp -> ms since EPOCH, None for none
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return stamp_ms(value)
+    return datetime_ms(value)
+
+
+def ms_datetime(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def step_ms(step) -> int:
+    ms = getattr(step, "time_ms", None)  # LiquidSteps records carry the parsed time
+    return ms if ms is not None else stamp_ms(step.timestamp)
+
+
+def step_time(step) -> datetime:
+    return ms_datetime(step_ms(step))
+
+
+def build_timeline(design_id: int, transitions: list, holds: list, steps: list, map_actions: list[str],
+                   start: Optional[datetime] = None, end: Optional[datetime] = None) -> RunTimeline:
+    """Per-map timeline of a run
+
+    transitions and holds are the AS10 records of the run, steps the parsed
+    LiquidSteps and map_actions the action type behind each LS map, in map order.
+    """
+    plate_steps = [(step_ms(step), step.volume) for step in steps
+                   if step.type == "dispense" and step.location not in WASH_LOCATIONS]
+    if start is None:
+        start = transitions[0][3] if transitions else (ms_datetime(plate_steps[0][0]) if plate_steps else None)
+    if end is None:
+        end = ms_datetime(plate_steps[-1][0]) if plate_steps else start
+
+    maps = []
+    total_maps = 0
+    i = 0
+    for n, (number, total, description, map_start) in enumerate(transitions):
+        total_maps = max(total_maps, total)
+        map_end = transitions[n + 1][3] if n + 1 < len(transitions) else end
+        start_ms = datetime_ms(map_start)
+        end_ms = datetime_ms(map_end) + (n + 1 == len(transitions))  # the last map keeps a dispense stamped at the run end
+        volume = 0.0
+        while i < len(plate_steps) and plate_steps[i][0] < start_ms:
+            i += 1
+        j = i
+        while j < len(plate_steps) and plate_steps[j][0] < end_ms:
+            volume += plate_steps[j][1]
+            j += 1
+        maps.append(MapInterval(
+            map=number,
+            action_type=map_actions[number - 1] if 0 < number <= len(map_actions) else None,
+            description=description,
+            start=map_start,
+            end=map_end,
+            duration_s=(map_end - map_start).total_seconds(),
+            volume=volume,
+        ))
+
+    hold_intervals = [HoldInterval(state=state, title=title, start=s, end=e, duration_s=(e - s).total_seconds())
+                      for state, title, s, e in holds]
+    per_type = {}
+    for interval in maps:
+        key = interval.action_type or "unknown"
+        per_type[key] = per_type.get(key, 0.0) + interval.duration_s
+
+    duration = (end - start).total_seconds() if start and end else 0.0
+    volume = sum(v for _, v in plate_steps)
+    return RunTimeline(
+        design_id=design_id,
+        start=start,
+        end=end,
+        duration_s=duration,
+        total_maps=total_maps or len(map_actions),
+        maps=maps,
+        holds=hold_intervals,
+        time_per_action_type_s=per_type,
+        idle_s=sum(h.duration_s for h in hold_intervals),
+        volume=volume,
+        volume_per_min=volume / (duration / 60) if duration > 0 else 0.0,
+        maps_per_hour=len(maps) / (duration / 3600) if duration > 0 else 0.0,
+    )
@@ -0,0 +1,144 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import LIQUID_TYPES, PLATE_TYPES, PROMPT_TYPES, BigKahunaProtocol, BigKahunaTags
+from utils.reorder import action_wells
+from utils.scheduler import drop_stale_skip_wash
+from utils.well_codec import well_position
+
+GROUP_BARRIERS = PROMPT_TYPES + PLATE_TYPES  # a 4Tip group never spans these
+TIP_TAGS = (BigKahunaTags.FourTip, BigKahunaTags.SingleTip, BigKahunaTags.ExtSingleTip)
+HEAD_TIPS = 4  # tips on the 4Tip head, one per row in a column
+
+
+class FourTipReport(BaseModel):
+    groups: int  # 4Tip maps created
+    maps_saved: int
+    single_tip: int  # untagged liquid handling that fell back to SingleTip
+
+
+def group_key(action) -> Optional[tuple]:
+    """Actions with equal keys can share a 4Tip map when their rows are adjacent, None if never"""
+    if action.action_type not in LIQUID_TYPES or BigKahunaTags.SkipMap in action.tags:
+        return None
+    other_tags = tuple(sorted(tag.value for tag in action.tags if tag not in TIP_TAGS and tag != BigKahunaTags.SkipWash))
+    if action.action_type == "dispense":
+        return ("dispense", action.source_chemical, action.target_plate, well_position(action.target_well)[1], action.volume, other_tags)
+    source_row, source_column = well_position(action.source_well)
+    target_row, target_column = well_position(action.target_well)
+    return ("transfer", action.source_plate, action.target_plate, source_column, target_column, target_row - source_row, action.volume, other_tags)
+
+
+def head_row(action) -> int:  # row the tip works in, the source row of a transfer
+    well = action.source_well if action.action_type == "transfer" else action.target_well
+    return well_position(well)[0]
+
+
+def with_tip(action, tip: BigKahunaTags):
+    return action.model_copy(update={"tags": [tag for tag in action.tags if tag not in TIP_TAGS] + [tip]})
+
+
+def plate_fits(action, protocol: BigKahunaProtocol, plate_types: Optional[list[str]]) -> bool:
+    plates = [protocol.plates[action.target_plate]]
+    if action.action_type == "transfer":
+        plates.append(protocol.plates[action.source_plate])
+    return all(plate.rows >= HEAD_TIPS and (plate_types is None or plate.type in plate_types) for plate in plates)
+
+
+def find_groups(segment: list, protocol: BigKahunaProtocol, plate_types: Optional[list[str]]) -> list[list[int]]:
+    """Sets of HEAD_TIPS segment indexes on adjacent rows that can be pulled together without reordering any well's accesses
+
+    Members are run in row order, so they must not share a well with each
+    other, nor with any action between the first and the last of them.
+    """
+    candidates = {}
+    for i, action in enumerate(segment):
+        key = group_key(action)
+        if key is not None and plate_fits(action, protocol, plate_types):
+            candidates.setdefault(key, []).append(i)
+    groups = []
+    used = set()
+    accessed = [set(action_wells(action)) for action in segment]
+    for indexes in candidates.values():
+        by_row = {}
+        for i in indexes:
+            by_row.setdefault(head_row(segment[i]), i)
+        for row in sorted(by_row):
+            members = [by_row.get(row + k) for k in range(HEAD_TIPS)]
+            if None in members or used.intersection(members):
+                continue
+            members.sort()
+            if any(accessed[a] & accessed[b] for k, a in enumerate(members) for b in members[k + 1:]):
+                continue  # a member touches another's wells, running them in row order could reorder those accesses
+            first = members[0]
+            others = set(members)
+            wells = set().union(*(accessed[i] for i in members[1:]))
+            if any(accessed[j] & wells for j in range(first + 1, members[-1]) if j not in others):
+                continue  # a member would jump over another access to its wells
+            groups.append(members)
+            used.update(members)
+    return groups
+
+
+def optimize_four_tip(protocol: BigKahunaProtocol, plate_types: Optional[list[str]] = None) -> tuple[list, FourTipReport]:
+    """Pull dispenses/transfers on 4 adjacent rows with the same source and volume together as 4Tip runs
+
+    Grouped actions are tagged FourTip and placed next to each other, in row
+    order, where the first of them was; the compiler's merge_four_tip pass
+    turns each run into one map.
+    Other liquid handling without a tip tag is tagged SingleTip.
+    SkipWash is dropped where grouping changed the step that follows.
+    """
+    actions = []
+    origins = []  # index in protocol.actions of each action, the tagged ones are copies
+    groups = 0
+    single = 0
+    segment = []
+    positions = []
+    for index, action in enumerate(protocol.actions + [None]):
+        if action is not None and action.action_type not in GROUP_BARRIERS:
+            segment.append(action)
+            positions.append(index)
+            continue
+        found = find_groups(segment, protocol, plate_types)
+        leaders = {members[0]: members for members in found}
+        grouped = {i for members in found for i in members}
+        for i, member in enumerate(segment):
+            if i in leaders:
+                run = sorted(leaders[i], key=lambda j: head_row(segment[j]))
+                actions.extend(with_tip(segment[j], BigKahunaTags.FourTip) for j in run)
+                origins.extend(positions[j] for j in run)
+            elif i not in grouped:
+                if group_key(member) is not None and not any(tag in TIP_TAGS for tag in member.tags):
+                    member = with_tip(member, BigKahunaTags.SingleTip)
+                    single += 1
+                actions.append(member)
+                origins.append(positions[i])
+        groups += len(found)
+        segment = []
+        positions = []
+        if action is not None:
+            actions.append(action)
+            origins.append(index)
+    actions = drop_stale_skip_wash(protocol.actions, actions, origins)
+    return actions, FourTipReport(groups=groups, maps_saved=groups * (HEAD_TIPS - 1), single_tip=single)
+
+
+def four_tip_runs(actions: list) -> list[list[int]]:
+    """Split actions into maps: runs of HEAD_TIPS FourTip actions on adjacent rows, everything else alone"""
+    runs = []
+    i = 0
+    while i < len(actions):
+        action = actions[i]
+        if BigKahunaTags.FourTip in getattr(action, "tags", ()) and group_key(action) is not None and i + HEAD_TIPS <= len(actions):
+            run = actions[i:i + HEAD_TIPS]
+            row = head_row(action)
+            if all(group_key(a) == group_key(action) and BigKahunaTags.FourTip in a.tags and head_row(a) == row + k
+                   for k, a in enumerate(run)):
+                runs.append(list(range(i, i + HEAD_TIPS)))
+                i += HEAD_TIPS
+                continue
+        runs.append([i])
+        i += 1
+    return runs
@@ -0,0 +1,53 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+from utils.big_kahuna_protocol_types import LIQUID_TYPES, PLATE_TYPES, PROMPT_TYPES, RANGE_TYPES, BigKahunaProtocol, BigKahunaTags
+
+WASH_BARRIERS = PROMPT_TYPES + PLATE_TYPES  # the tip may sit between these, always wash
+
+
+class WashPlan(BaseModel):
+    skipped: int  # wash cycles removed
+    actions: list[int]  # indexes of the actions tagged SkipWash
+
+
+def source_key(action) -> tuple:  # what the tip picks up in an action
+    if action.action_type == "transfer":
+        return ("well", action.source_plate, action.source_well)
+    return ("chemical", action.source_chemical)
+
+
+def can_skip_wash(previous, following, compatibility: dict[str, list[str]]) -> bool:
+    """Whether the tip can go from previous to following without a wash cycle in between"""
+    a, b = source_key(previous), source_key(following)
+    if a == b:
+        return True
+    if a[0] == "chemical" and b[0] == "chemical":
+        return b[1] in compatibility.get(a[1], ())
+    return False
+
+
+def plan_skip_wash(protocol: BigKahunaProtocol, compatibility: Optional[dict[str, list[str]]] = None) -> tuple[list, WashPlan]:
+    """Tag SkipWash on liquid handling whose next step picks up the same, or a compatible, liquid
+
+    SkipWash skips the wash that follows the tagged map. Consecutive steps are
+    compared across SkipMap actions, which do not run, but never across a
+    prompt, delay or stir.
+    """
+    compatibility = compatibility or {}
+    actions = list(protocol.actions)
+    tagged = []
+    previous = None
+    for i, action in enumerate(actions):
+        if action.action_type in WASH_BARRIERS or action.action_type in RANGE_TYPES:  # a range map goes through many wells
+            previous = None
+            continue
+        if action.action_type not in LIQUID_TYPES or BigKahunaTags.SkipMap in action.tags:
+            continue
+        if previous is not None and can_skip_wash(actions[previous], action, compatibility):
+            if BigKahunaTags.SkipWash not in actions[previous].tags:
+                actions[previous] = actions[previous].model_copy(update={"tags": actions[previous].tags + [BigKahunaTags.SkipWash]})
+                tagged.append(previous)
+        previous = i
+    return actions, WashPlan(skipped=len(tagged), actions=tagged)
@@ -0,0 +1,41 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+WELL_PATTERN = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+@lru_cache(maxsize=None)
+def row_label(row: int) -> str:  # 1 -> "A", 26 -> "Z", 27 -> "AA", like spreadsheet columns
+    label = ""
+    while row > 0:
+        row, rest = divmod(row - 1, 26)
+        label = chr(65 + rest) + label
+    return label
+
+
+@lru_cache(maxsize=None)
+def row_number(label: str) -> int:  # "A" -> 1, "AA" -> 27
+    row = 0
+    for letter in label.upper():
+        row = row * 26 + ord(letter) - 64
+    return row
+
+
+@lru_cache(maxsize=65536)
+def parse_well(well: str) -> Optional[tuple[int, int]]:  # "B3" -> (2, 3), None if not a well label
+    match = WELL_PATTERN.match(well)
+    if match is None:
+        return None
+    return row_number(match.group(1)), int(match.group(2))
+
+
+def well_position(well: str) -> tuple[int, int]:  # like parse_well, but raises on bad labels
+    position = parse_well(well)
+    if position is None:
+        raise ValueError("%r is not a well label" % well)
+    return position
+
+
+def well_label(row: int, column: int) -> str:
+    return "%s%d" % (row_label(row), column)